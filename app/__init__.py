@@ -5,36 +5,95 @@ The flask application package.
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from flask_wtf.csrf import CSRFProtect
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import event
 import os
 
+from app.events import broker
+from app.ratelimit import limiter
+
 '''deadline_app is the object'''
 db = SQLAlchemy()
 login_manager = LoginManager()
+# every POST needs a token, not just the FlaskForm ones (JSON clients send X-CSRFToken)
+csrf = CSRFProtect()
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-def create_app():
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers in other worker processes carry on while one writes,
+    # and the busy timeout makes writers queue instead of failing on the lock.
+    # auto_vacuum only takes effect on a new file; it lets `flask maintenance
+    # vacuum` free pages without a full VACUUM.
+    dbapi_connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    dbapi_connection.execute('PRAGMA journal_mode=WAL')
+    dbapi_connection.execute('PRAGMA busy_timeout=5000')
+
+
+def create_app(config=None):
+    """Build the app; config overrides the defaults before anything is initialised."""
     deadline_app = Flask(__name__)
     deadline_app.config.from_mapping(
         SECRET_KEY='shmortobius',
         SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(basedir, 'app.db'),
-        SQLALCHEMY_TRACK_MODIFICATIONS=False
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # compiled templates are shared by every worker and survive restarts
+        JINJA_BYTECODE_CACHE_DIR=os.path.join(deadline_app.instance_path, 'jinja-cache'),
     )
+    if config:
+        deadline_app.config.update(config)
 
     db.init_app(deadline_app)
     login_manager.init_app(deadline_app)
+    csrf.init_app(deadline_app)
+    broker.init_app(deadline_app)
+    limiter.init_app(deadline_app)
 
     # where to redirect when @login_required hits an anonymous user
-    login_manager.login_view = 'login'
+    login_manager.login_view = 'main.login'
 
-    from app.models import User
+    from app import identity
+    identity.init_app(deadline_app)
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return identity.load_user(int(user_id))
+
+    from app import archive
+    archive.init_app(deadline_app)
+
+    from app.journal import journal
+    journal.init_app(deadline_app)
+
+    from app.audit import audit
+    audit.init_app(deadline_app)
+
+    from app.sharding import shards
+    shards.init_app(deadline_app)
+
+    from app import schema, provisioning, workload, deadline_index, maintenance
+    schema.init_app(deadline_app)
+    provisioning.init_app(deadline_app)
+    workload.init_app(deadline_app)
+    deadline_index.init_app(deadline_app)
+    maintenance.init_app(deadline_app)
+
+    from app.routes import bp
+    deadline_app.register_blueprint(bp)
+
+    from app import assets
+    assets.init_app(deadline_app)
+
+    cache_dir = deadline_app.config['JINJA_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        deadline_app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
 
     with deadline_app.app_context():
-        from app import routes, models
-        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _sqlite_pragmas)
+        schema.check_schema(deadline_app)
 
     return deadline_app
@@ -0,0 +1,274 @@
+"""
+Term archiving: move finished classes out of the live tables.
+
+A class, its assignments, their submissions and the class memberships are
+copied into a separate SQLite file and deleted from the live database in a
+single transaction, using INSERT ... SELECT across an ATTACHed database so
+the move is a handful of set-based statements regardless of class size.
+Users referenced by the class are copied (not moved) so archived pages can
+still show names, without their password hashes. Archived rows are read back through a query-only session.
+"""
+
+import os
+
+import click
+from flask import current_app, g
+from flask.cli import AppGroup
+from sqlalchemy import create_engine, event, text, select
+from sqlalchemy.orm import Session
+
+from app import db, schema, workload, deadline_index
+from app.journal import journal
+from app.models import Class, Assignment, Submission, class_memberships
+from app.sharding import shards
+
+
+class ArchiveError(Exception):
+    """Raised when a class cannot be archived or restored."""
+
+
+# (table, WHERE clause selecting the class's rows in the source schema)
+_CLASS_ROWS = (
+    (Class.__table__, 'id = :class_id'),
+    (Assignment.__table__, 'class_id = :class_id'),
+    (
+        Submission.__table__,
+        'assignment_id IN (SELECT id FROM {src}.assignment WHERE class_id = :class_id)',
+    ),
+    (class_memberships, 'class_id = :class_id'),
+)
+
+_CLASS_USERS = (
+    'id IN ('
+    'SELECT owner_id FROM {src}."class" WHERE id = :class_id '
+    'UNION SELECT user_id FROM {src}.class_memberships WHERE class_id = :class_id '
+    'UNION SELECT creator_id FROM {src}.assignment WHERE class_id = :class_id '
+    'UNION SELECT student_id FROM {src}.submission WHERE assignment_id IN '
+    '(SELECT id FROM {src}.assignment WHERE class_id = :class_id))'
+)
+
+_engines = {}
+
+
+def archive_path():
+    return current_app.config['ARCHIVE_DATABASE_PATH']
+
+
+def _engine(path):
+    engine = _engines.get(path)
+    if engine is None:
+        engine = create_engine('sqlite:///' + path)
+
+        @event.listens_for(engine, 'connect')
+        def _query_only(dbapi_connection, connection_record):
+            dbapi_connection.execute('PRAGMA query_only = ON')
+
+        _engines[path] = engine
+    return engine
+
+
+def dispose_engines(close=True):
+    """Forget pooled archive connections (close=False after fork)."""
+    for engine in _engines.values():
+        engine.dispose(close=close)
+
+
+def _copy_statement(table, src, dst, where, verb='INSERT'):
+    columns = ', '.join(f'"{c.name}"' for c in table.columns)
+    return text(
+        f'{verb} INTO {dst}."{table.name}" ({columns}) '
+        f'SELECT {columns} FROM {src}."{table.name}" WHERE {where.format(src=src)}'
+    )
+
+
+def _copy_users_statement(src, dst):
+    # archived pages only need names; the hash stays in app.db alone
+    columns = '"id", "username", "email", "notifications_enabled"'
+    return text(
+        f'INSERT OR REPLACE INTO {dst}."user" ({columns}, "password_hash") '
+        f"SELECT {columns}, '' FROM {src}.\"user\" WHERE {_CLASS_USERS.format(src=src)}"
+    )
+
+
+def _delete_statement(table, schema, where):
+    return text(f'DELETE FROM {schema}."{table.name}" WHERE {where.format(src=schema)}')
+
+
+def _move_class(connection, class_id, src, dst, copy_users):
+    """Copy a class's rows from src to dst and delete them from src.
+
+    Runs on a connection with the archive file ATTACHed, so the whole move
+    commits or rolls back as one transaction.
+    """
+    params = {'class_id': class_id}
+    found = connection.execute(
+        text(f'SELECT 1 FROM {src}."class" WHERE id = :class_id'), params
+    ).first()
+    if found is None:
+        raise ArchiveError(f'Class {class_id} not found in {src} database.')
+    clash = connection.execute(
+        text(f'SELECT 1 FROM {dst}."class" WHERE id = :class_id'), params
+    ).first()
+    if clash is not None:
+        raise ArchiveError(f'Class {class_id} already exists in {dst} database.')
+
+    if copy_users:
+        connection.execute(_copy_users_statement(src, dst), params)
+        # archives written before hashes were left out
+        connection.execute(text(f"UPDATE {dst}.\"user\" SET password_hash = '' WHERE password_hash != ''"))
+
+    moved = {}
+    for table, where in _CLASS_ROWS:
+        result = connection.execute(_copy_statement(table, src, dst, where), params)
+        moved[table.name] = result.rowcount
+    # delete children before parents; the submission filter needs the assignments
+    for table, where in reversed(_CLASS_ROWS):
+        connection.execute(_delete_statement(table, src, where), params)
+    return moved
+
+
+def _attached(callback):
+    path = archive_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # make sure the archive has the same schema as the live tables
+    writer = create_engine('sqlite:///' + path)
+    try:
+        schema.upgrade(writer)
+    finally:
+        writer.dispose()
+
+    # finish any pending work first, so the session holds no write lock
+    db.session.commit()
+    # one connection throughout: the pool may hand the session another one
+    # after a commit, and that would not have the archive attached
+    with db.engine.connect() as connection:
+        # ATTACH is not allowed inside a transaction
+        connection.execute(text('ATTACH DATABASE :path AS archive'), {'path': path})
+        connection.commit()
+        try:
+            with connection.begin():
+                result = callback(connection)
+        finally:
+            connection.execute(text('DETACH DATABASE archive'))
+            connection.commit()
+    db.session.expire_all()
+    return result
+
+
+def archive_class(class_id):
+    """Move a class and everything under it into the archive database."""
+    # journaled submissions would land after their assignments are gone
+    if journal.enabled:
+        journal.flush()
+    # sharded submissions come home first so they move with the class
+    shards.collect(class_id)
+
+    def move(connection):
+        moved = _move_class(connection, class_id, 'main', 'archive', copy_users=True)
+        deadline_index.drop_class(class_id, connection)
+        # raw SQL moves fire no ORM events
+        workload.invalidate_class(class_id, connection)
+        return moved
+
+    try:
+        moved = _attached(move)
+    except Exception:
+        # the class stays live, so its submissions go back to its shard
+        shards.distribute(class_id)
+        raise
+    return moved
+
+
+def restore_class(class_id):
+    """Move an archived class back into the live tables."""
+    def move(connection):
+        moved = _move_class(connection, class_id, 'archive', 'main', copy_users=False)
+        deadline_index.rebuild(connection, class_id=class_id)
+        workload.invalidate_class(class_id, connection)
+        workload.invalidate_members(class_id, connection)
+        return moved
+
+    moved = _attached(move)
+    shards.distribute(class_id)
+    return moved
+
+
+def archive_session():
+    """Read-only session on the archive file for this app context, or None."""
+    if 'archive_session' not in g:
+        path = archive_path()
+        g.archive_session = Session(_engine(path)) if os.path.exists(path) else None
+    return g.archive_session
+
+
+def close_archive_session(exc=None):
+    session = g.pop('archive_session', None)
+    if session is not None:
+        session.close()
+
+
+def get_archived(model, ident):
+    session = archive_session()
+    if session is None:
+        return None
+    return session.get(model, ident)
+
+
+def archived_classes_for(user_id):
+    """Archived classes the user owned or was enrolled in."""
+    session = archive_session()
+    if session is None:
+        return []
+    members = class_memberships.c
+    return session.scalars(
+        select(Class)
+        .where(
+            (Class.owner_id == user_id)
+            | Class.id.in_(select(members.class_id).where(members.user_id == user_id))
+        )
+        .order_by(Class.name)
+    ).all()
+
+
+def init_app(app):
+    app.config.setdefault(
+        'ARCHIVE_DATABASE_PATH', os.path.join(app.root_path, 'archive.db')
+    )
+    app.teardown_appcontext(close_archive_session)
+    app.cli.add_command(archive_cli)
+
+
+archive_cli = AppGroup('archive', help='Move finished classes in and out of the archive.')
+
+
+@archive_cli.command('class')
+@click.argument('class_id', type=int)
+def archive_class_command(class_id):
+    """Archive CLASS_ID and all of its assignments and submissions."""
+    try:
+        moved = archive_class(class_id)
+    except ArchiveError as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f'Archived class {class_id}: ' + ', '.join(f'{n} {t}' for t, n in moved.items()))
+
+
+@archive_cli.command('restore')
+@click.argument('class_id', type=int)
+def restore_class_command(class_id):
+    """Restore archived CLASS_ID into the live tables."""
+    try:
+        moved = restore_class(class_id)
+    except ArchiveError as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f'Restored class {class_id}: ' + ', '.join(f'{n} {t}' for t, n in moved.items()))
+
+
+@archive_cli.command('list')
+def list_archived_command():
+    """List archived classes."""
+    session = archive_session()
+    if session is None:
+        click.echo('No archive database yet.')
+        return
+    for clazz in session.scalars(select(Class).order_by(Class.id)):
+        click.echo(f'{clazz.id}\t{clazz.name}')
@@ -0,0 +1,194 @@
+"""
+Static asset pipeline: vendored, fingerprinted and precompressed files.
+
+`flask assets build` downloads the third-party CSS/JS we used to load from a
+CDN into static/vendor (checking their SRI hashes), then copies every asset
+to static/dist under a content-hashed name with .gz (and .br, when the
+brotli package is installed) siblings, and writes static/dist/manifest.json.
+
+Templates call asset_url('content/style.css'). With a build present that
+returns /assets/style.<hash>.css, served with a one-year immutable
+Cache-Control so browsers never revalidate it; without a build it falls
+back to the plain static file or the CDN, so a fresh checkout still works.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import urllib.request
+
+import click
+from flask import Blueprint, abort, current_app, request, send_file, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always produced
+    brotli = None
+
+
+# logical name -> (CDN url, subresource integrity hash)
+VENDOR = {
+    'vendor/bootstrap.min.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.8/dist/css/bootstrap.min.css',
+        'sha384-sRIl4kxILFvY47J16cr9ZwB07vP4J8+LH7qKQnuqkuIAvNWLzeN8tE5YBujZqJLB',
+    ),
+    'vendor/bootstrap.bundle.min.js': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.8/dist/js/bootstrap.bundle.min.js',
+        'sha384-FKyoEForCGlyvwx9Hj09JcYn3nv7wiPVlz7YYwJrWVcXK/BmnVDxM+D2scQbITxI',
+    ),
+}
+
+# our own files under static/ that get fingerprinted alongside VENDOR
+OWN_ASSETS = ['content/style.css']
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+bp = Blueprint('assets', __name__)
+
+
+class AssetError(Exception):
+    """Raised when an asset cannot be vendored or built."""
+
+
+def _sri(data):
+    return 'sha384-' + base64.b64encode(hashlib.sha384(data).digest()).decode()
+
+
+def vendor(static_dir, fetch=True):
+    """Make sure every VENDOR file exists locally and matches its SRI hash."""
+    for name, (url, integrity) in VENDOR.items():
+        path = os.path.join(static_dir, name)
+        if not os.path.exists(path):
+            if not fetch:
+                raise AssetError(f'{name} is not vendored yet; run the build with fetching on.')
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+            if _sri(data) != integrity:
+                raise AssetError(f'{url} does not match its integrity hash.')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        else:
+            with open(path, 'rb') as f:
+                if _sri(f.read()) != integrity:
+                    raise AssetError(f'{path} does not match its integrity hash.')
+
+
+def build(static_dir, fetch=True):
+    """Vendor, fingerprint and precompress every asset; return the manifest."""
+    vendor(static_dir, fetch=fetch)
+    dist = os.path.join(static_dir, 'dist')
+    os.makedirs(dist, exist_ok=True)
+
+    manifest = {}
+    for name in OWN_ASSETS + list(VENDOR):
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            data = f.read()
+        stem, ext = os.path.splitext(os.path.basename(name))
+        hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        manifest[name] = hashed
+
+        target = os.path.join(dist, hashed)
+        if os.path.exists(target):
+            continue
+        with open(target, 'wb') as f:
+            f.write(data)
+        with open(target + '.gz', 'wb') as f:
+            # mtime=0 keeps rebuilds byte-for-byte identical
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(target + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+
+    # drop outputs of earlier builds
+    keep = set(manifest.values())
+    for filename in os.listdir(dist):
+        base = filename[:-3] if filename.endswith(('.gz', '.br')) else filename
+        if base not in keep and filename != 'manifest.json':
+            os.remove(os.path.join(dist, filename))
+
+    with open(os.path.join(dist, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, 'dist', 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(name):
+    """URL for a logical asset name such as 'content/style.css'."""
+    hashed = current_app.extensions['assets'].get(name)
+    if hashed is not None:
+        return url_for('assets.asset', filename=hashed)
+    if name in VENDOR:
+        return VENDOR[name][0]
+    return url_for('static', filename=name)
+
+
+def asset_integrity(name):
+    """SRI hash for vendored assets, empty for our own files."""
+    return VENDOR[name][1] if name in VENDOR else ''
+
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    """Serve a fingerprinted file, precompressed when the client allows it."""
+    if filename not in current_app.extensions['assets_files']:
+        abort(404)
+    path = os.path.join(current_app.static_folder, 'dist', filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.exists(path + suffix):
+            encoding, path = candidate, path + suffix
+            break
+
+    response = send_file(path, mimetype=mimetype, max_age=31536000, conditional=True)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def load(app):
+    """(Re)read the manifest; each worker does this once at startup."""
+    manifest = load_manifest(app.static_folder)
+    app.extensions['assets'] = manifest
+    app.extensions['assets_files'] = frozenset(manifest.values())
+
+
+def init_app(app):
+    load(app)
+    app.register_blueprint(bp)
+    app.add_template_global(asset_url)
+    app.add_template_global(asset_integrity)
+    app.cli.add_command(assets_cli)
+
+
+assets_cli = AppGroup('assets', help='Build the static asset bundle.')
+
+
+@assets_cli.command('build')
+@click.option('--fetch/--no-fetch', default=True,
+              help='Download vendored files that are missing.')
+def build_command(fetch):
+    """Vendor, fingerprint and precompress static assets."""
+    try:
+        manifest = build(current_app.static_folder, fetch=fetch)
+    except (AssetError, OSError) as exc:
+        raise click.ClickException(str(exc))
+    for name, hashed in sorted(manifest.items()):
+        click.echo(f'{name} -> dist/{hashed}')
+    if brotli is None:
+        click.echo('brotli not installed, wrote gzip variants only')
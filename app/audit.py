@@ -0,0 +1,293 @@
+"""
+Append-only activity log of views, submissions and grade changes.
+
+Events are buffered in memory and written to AUDIT_DB_PATH in batches by a
+background thread per worker.
+"""
+
+import atexit
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+import click
+from flask import current_app, has_request_context, request
+from flask.cli import AppGroup
+from flask_login import current_user
+
+
+log = logging.getLogger(__name__)
+
+COLUMNS = ('at', 'action', 'user_id', 'username', 'class_id', 'assignment_id', 'ip', 'detail')
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS audit ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, at TEXT NOT NULL, action TEXT NOT NULL, '
+    'user_id INTEGER, username TEXT, class_id INTEGER, assignment_id INTEGER, '
+    'ip TEXT, detail TEXT)',
+    'CREATE INDEX IF NOT EXISTS ix_audit_at ON audit (at)',
+    'CREATE INDEX IF NOT EXISTS ix_audit_user ON audit (user_id, at)',
+    'CREATE INDEX IF NOT EXISTS ix_audit_assignment ON audit (assignment_id, at)',
+    "CREATE TRIGGER IF NOT EXISTS audit_no_update BEFORE UPDATE ON audit "
+    "BEGIN SELECT RAISE(ABORT, 'the audit log is append-only'); END",
+    "CREATE TRIGGER IF NOT EXISTS audit_no_delete BEFORE DELETE ON audit "
+    "BEGIN SELECT RAISE(ABORT, 'the audit log is append-only'); END",
+)
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    for statement in _SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+class AuditLog:
+    """Per-process buffer and writer thread, started on first use."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._dropped = 0
+        self._stopping = False
+        self._flush_requested = False
+        self._taken = self._written = 0  # batches taken from the buffer / written
+        self._pid = None
+        self._thread = None
+        self._config = None
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_ENABLED', True)
+        app.config.setdefault('AUDIT_DB_PATH', os.path.join(app.instance_path, 'audit.db'))
+        app.config.setdefault('AUDIT_BUFFER_SIZE', 10000)
+        app.config.setdefault('AUDIT_BATCH', 500)
+        app.config.setdefault('AUDIT_FLUSH_INTERVAL', 1.0)
+        # with the buffer full: 'drop' the event (counted in an audit.dropped
+        # entry) or 'block' the request for up to AUDIT_BLOCK_TIMEOUT seconds
+        app.config.setdefault('AUDIT_OVERFLOW', 'drop')
+        app.config.setdefault('AUDIT_BLOCK_TIMEOUT', 0.05)
+        app.extensions['audit'] = self
+        self._config = app.config
+        app.cli.add_command(audit_cli)
+
+    def _ensure_started(self):
+        # restarted in a forked worker, since the writer thread does not survive fork()
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            config = self._config
+            self.path = config['AUDIT_DB_PATH']
+            self.capacity = config['AUDIT_BUFFER_SIZE']
+            self.batch = config['AUDIT_BATCH']
+            self.interval = config['AUDIT_FLUSH_INTERVAL']
+            self.overflow = config['AUDIT_OVERFLOW']
+            self.block_timeout = config['AUDIT_BLOCK_TIMEOUT']
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._buffer = []
+            self._dropped = 0
+            self._stopping = False
+            self._flush_requested = False
+            self._taken = self._written = 0
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def reset(self):
+        """Drop buffered events and the writer (used after fork and in tests)."""
+        if self._pid == os.getpid():
+            self.stop()
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._dropped = 0
+        self._pid = None
+        self._thread = None
+
+    def stop(self):
+        """Write out whatever is buffered and stop the writer."""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout=10)
+        self._pid = None
+
+    def record(self, action, class_id=None, assignment_id=None, detail=None):
+        """Buffer one event for the current user and request.
+
+        Returns False when the event was dropped because the buffer is full.
+        """
+        if not self._config['AUDIT_ENABLED']:
+            return True
+        self._ensure_started()
+
+        user_id = username = ip = None
+        if has_request_context():
+            ip = request.remote_addr
+            if current_user.is_authenticated:
+                user_id, username = current_user.id, current_user.username
+        event = (
+            datetime.utcnow().isoformat(sep=' ', timespec='milliseconds'),
+            action, user_id, username, class_id, assignment_id, ip, detail,
+        )
+
+        with self._cond:
+            if len(self._buffer) >= self.capacity and self.overflow == 'block':
+                self._cond.notify_all()
+                self._cond.wait_for(
+                    lambda: len(self._buffer) < self.capacity, timeout=self.block_timeout
+                )
+            if len(self._buffer) >= self.capacity:
+                self._dropped += 1
+                return False
+            self._buffer.append(event)
+            if len(self._buffer) >= self.batch:
+                self._cond.notify_all()
+        return True
+
+    def flush(self):
+        """Ask the writer to write now and wait until the buffer is empty."""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            # the next batch taken holds everything recorded so far
+            taken = self._taken
+            self._flush_requested = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._written > taken, timeout=10)
+
+    def _run(self):
+        conn = connect(self.path)
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._stopping or self._flush_requested
+                        or len(self._buffer) >= self.batch,
+                        timeout=self.interval,
+                    )
+                    batch, self._buffer = self._buffer, []
+                    self._flush_requested = False
+                    self._taken += 1
+                    taken = self._taken
+                    dropped, self._dropped = self._dropped, 0
+                    stopping = self._stopping
+                    # wake requests blocked on a full buffer
+                    self._cond.notify_all()
+
+                if dropped:
+                    batch.append((
+                        datetime.utcnow().isoformat(sep=' ', timespec='milliseconds'),
+                        'audit.dropped', None, None, None, None, None,
+                        f'{dropped} events dropped, buffer full',
+                    ))
+                if batch:
+                    self._write(conn, batch)
+
+                with self._cond:
+                    self._written = taken
+                    self._cond.notify_all()
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            conn.execute('BEGIN')
+            conn.executemany(
+                f'INSERT INTO audit ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))})',
+                batch,
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            log.exception('Could not write %d audit events', len(batch))
+            # keep them for the next round as far as the buffer allows
+            with self._cond:
+                room = max(0, self.capacity - len(self._buffer))
+                self._buffer[:0] = batch[:room]
+                self._dropped += len(batch) - min(room, len(batch))
+
+
+audit = AuditLog()
+atexit.register(audit.stop)
+
+
+def query(path, user_id=None, username=None, class_id=None, assignment_id=None,
+          action=None, since=None, until=None, limit=None):
+    """Audit rows (dicts, oldest first) matching every filter given."""
+    clauses, params = [], []
+    for column, value in (
+        ('user_id', user_id),
+        ('username', username),
+        ('class_id', class_id),
+        ('assignment_id', assignment_id),
+    ):
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    if action:
+        # 'submission' matches submission.create and submission.edit
+        clauses.append('(action = ? OR action LIKE ?)')
+        params.extend([action, action + '.%'])
+    if since:
+        clauses.append('at >= ?')
+        params.append(since.isoformat(sep=' '))
+    if until:
+        clauses.append('at < ?')
+        params.append(until.isoformat(sep=' '))
+
+    sql = f'SELECT {", ".join(COLUMNS)} FROM audit'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    sql += ' ORDER BY id'
+    if limit:
+        sql += f' LIMIT {int(limit)}'
+
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return [dict(zip(COLUMNS, row)) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+audit_cli = AppGroup('audit', help='Query and export the activity log.')
+
+
+@audit_cli.command('export')
+@click.option('--user', 'username', help='Only events by this username.')
+@click.option('--class', 'class_id', type=int, help='Only events in this class.')
+@click.option('--assignment', 'assignment_id', type=int, help='Only events for this assignment.')
+@click.option('--action', help='Action or action prefix, e.g. submission or class.view.')
+@click.option('--since', type=click.DateTime(), help='Events at or after this UTC time.')
+@click.option('--until', type=click.DateTime(), help='Events before this UTC time.')
+@click.option('--limit', type=int, help='At most this many events.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json']), default='csv', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='File to write (default: stdout).')
+def export_command(username, class_id, assignment_id, action, since, until, limit, fmt, output):
+    """Export audit events, oldest first."""
+    path = current_app.config['AUDIT_DB_PATH']
+    if not os.path.exists(path):
+        raise click.ClickException(f'No audit log at {path}.')
+
+    rows = query(path, username=username, class_id=class_id, assignment_id=assignment_id,
+                 action=action, since=since, until=until, limit=limit)
+    if fmt == 'json':
+        for row in rows:
+            output.write(json.dumps(row) + '\n')
+    else:
+        writer = csv.DictWriter(output, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    if output is not sys.stdout:
+        click.echo(f'Exported {len(rows)} events.', err=True)
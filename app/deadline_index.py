@@ -0,0 +1,169 @@
+"""
+Deadline-conflict advisor and the per-student daily deadline index behind it.
+
+deadline_load holds, for every student, day and class, how many assignments
+fall due. It is kept current incrementally: ORM inserts, due-date changes
+and deletes of an Assignment adjust the counts of every member of its class
+in the same transaction, and enrolling adds the class's counts for the new
+member. Bulk paths (cloning, archiving, restoring) rebuild or drop a class's
+rows explicitly, and `flask deadlines reindex` rebuilds everything.
+
+With the index in place, the question "how many of this class's students
+already have deadlines around this time" is one grouped query over
+(user_id, day) primary-key ranges, whatever the size of the class.
+"""
+
+from datetime import timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, literal, select, delete, true
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.models import Assignment, DeadlineLoad, class_memberships
+
+
+load = DeadlineLoad.__table__
+members = class_memberships.c
+
+
+def _upsert(rows_select):
+    """INSERT the (user_id, class_id, day, count) rows, adding to existing counts.
+
+    SQLite needs a WHERE on an INSERT ... SELECT that carries an upsert
+    clause, hence the `WHERE true` on selects that have no other filter.
+    """
+    stmt = insert(load).from_select(['user_id', 'class_id', 'day', 'count'], rows_select)
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'day', 'class_id'],
+        set_={'count': load.c.count + stmt.excluded.count},
+    )
+
+
+def _bump(connection, class_id, day, delta):
+    connection.execute(_upsert(
+        select(members.user_id, literal(class_id), literal(day, load.c.day.type), literal(delta))
+        .where(members.class_id == class_id)
+    ))
+    if delta < 0:
+        connection.execute(
+            delete(load).where(load.c.class_id == class_id, load.c.day == day, load.c.count <= 0)
+        )
+
+
+@event.listens_for(Assignment, 'after_insert')
+def _assignment_added(mapper, connection, target):
+    _bump(connection, target.class_id, target.due_date.date(), 1)
+
+
+@event.listens_for(Assignment, 'after_delete')
+def _assignment_removed(mapper, connection, target):
+    _bump(connection, target.class_id, target.due_date.date(), -1)
+
+
+@event.listens_for(Assignment, 'after_update')
+def _assignment_moved(mapper, connection, target):
+    history = inspect(target).attrs.due_date.history
+    if not history.deleted or not history.added:
+        return
+    old, new = history.deleted[0].date(), history.added[0].date()
+    if old != new:
+        _bump(connection, target.class_id, old, -1)
+        _bump(connection, target.class_id, new, 1)
+
+
+def _class_days(class_id=None):
+    """(class_id, day, count) of assignments, optionally for one class."""
+    day = func.date(Assignment.due_date)
+    query = select(Assignment.class_id, day.label('day'), func.count().label('count'))
+    if class_id is not None:
+        query = query.where(Assignment.class_id == class_id)
+    return query.group_by(Assignment.class_id, day).subquery()
+
+
+def member_added(class_id, user_id, connection=None):
+    """Add a new member's share of the class's deadlines."""
+    connection = connection or db.session.connection()
+    days = _class_days(class_id)
+    connection.execute(_upsert(
+        select(literal(user_id), days.c.class_id, days.c.day, days.c['count']).where(true())
+    ))
+
+
+def drop_class(class_id, connection=None):
+    connection = connection or db.session.connection()
+    connection.execute(delete(load).where(load.c.class_id == class_id))
+
+
+def rebuild(connection=None, class_id=None):
+    """Recompute the index for one class, or for everything."""
+    connection = connection or db.session.connection()
+    if class_id is None:
+        connection.execute(delete(load))
+    else:
+        drop_class(class_id, connection)
+    days = _class_days(class_id)
+    connection.execute(_upsert(
+        select(members.user_id, days.c.class_id, days.c.day, days.c['count'])
+        .join(days, days.c.class_id == members.class_id)
+        .where(true())
+    ))
+
+
+def conflict_histogram(clazz, due, window_hours):
+    """How many of clazz's students have other deadlines near due.
+
+    The window is widened to whole days, since the index counts per day.
+    Returns {'students': n, 'from': date, 'to': date, 'histogram': [...]},
+    where histogram[i] is the number of students with i other deadlines in
+    the window and the last bucket collects everything above.
+    """
+    first = (due - timedelta(hours=window_hours)).date()
+    last = (due + timedelta(hours=window_hours)).date()
+
+    students = (
+        select(members.user_id)
+        .where(members.class_id == clazz.id, members.user_id != clazz.owner_id)
+    )
+    student_count = db.session.scalar(select(func.count()).select_from(students.subquery()))
+    busy = db.session.execute(
+        select(DeadlineLoad.user_id, func.sum(DeadlineLoad.count))
+        .where(
+            DeadlineLoad.user_id.in_(students),
+            DeadlineLoad.class_id != clazz.id,
+            DeadlineLoad.day.between(first, last),
+        )
+        .group_by(DeadlineLoad.user_id)
+    ).all()
+
+    buckets = 4  # 0, 1, 2, 3+
+    histogram = [0] * buckets
+    for _, total in busy:
+        histogram[min(total, buckets - 1)] += 1
+    histogram[0] = student_count - len(busy)
+
+    return {
+        'students': student_count,
+        'from': first.isoformat(),
+        'to': last.isoformat(),
+        'window_hours': window_hours,
+        'histogram': histogram,
+    }
+
+
+deadlines_cli = AppGroup('deadlines', help='Maintain the deadline-conflict index.')
+
+
+@deadlines_cli.command('reindex')
+def reindex_command():
+    """Rebuild deadline_load from assignments and memberships."""
+    rebuild()
+    db.session.commit()
+    rows = db.session.scalar(select(func.count()).select_from(load))
+    click.echo(f'Rebuilt deadline index: {rows} rows.')
+
+
+def init_app(app):
+    app.config.setdefault('DEADLINE_CONFLICT_WINDOW_HOURS', 24)
+    app.cli.add_command(deadlines_cli)
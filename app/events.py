@@ -0,0 +1,265 @@
+"""
+Live update fan-out for the server-sent events endpoint.
+
+Views publish small JSON events (assignment created, submission recorded)
+and every open /events connection in a matching class receives them without
+touching the database. The broker keeps one bounded queue per connection so a
+slow client can only ever hold a fixed number of events in memory.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+class Subscription:
+    """One open event stream: the classes it listens to and its queue."""
+
+    def __init__(self, user_id, class_ids, maxsize):
+        self.user_id = user_id
+        self.class_ids = frozenset(class_ids)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def wants(self, event):
+        if event['class_id'] not in self.class_ids:
+            return False
+        audience = event.get('user_ids')
+        return audience is None or self.user_id in audience
+
+    def offer(self, event):
+        """Queue an event without blocking the publisher.
+
+        A full queue means the client is not keeping up; rather than grow
+        without bound we flag the stream so it tells the browser to resync.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def close(self):
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            self.overflowed = True
+
+    def messages(self, heartbeat, max_seconds=None):
+        """Yield SSE-formatted messages, with a comment line every heartbeat seconds.
+
+        Ends after max_seconds; the browser reconnects on its own, and the
+        worker thread the stream held is free again in the meantime.
+        """
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        while True:
+            if self.overflowed:
+                yield format_sse('resync', {})
+                return
+            timeout = heartbeat
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    return
+            try:
+                event = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                yield ': heartbeat\n\n'
+                continue
+            if event is None:
+                return
+            yield format_sse(event['type'], event['data'])
+
+
+def format_sse(event_type, data):
+    return f'event: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+
+class LocalBackend:
+    """Deliver events only to subscribers inside the publishing process."""
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, event):
+        self._deliver(event)
+
+    def stop(self):
+        pass
+
+
+class SQLiteBackend:
+    """Share events between worker processes through a local SQLite file.
+
+    Stands in for an external broker: publishers append a row and every
+    process polls for rows newer than the last one it saw, then fans them
+    out to its own subscribers. Old rows are pruned on publish.
+    """
+
+    def __init__(self, path, poll_interval=0.5, retention_seconds=300):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS event ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'created REAL NOT NULL, '
+            'payload TEXT NOT NULL)'
+        )
+        return conn
+
+    def start(self, deliver):
+        self._deliver = deliver
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT COALESCE(MAX(id), 0) FROM event').fetchone()
+        finally:
+            conn.close()
+        self._cursor = row[0]
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._poll, name='events-sqlite-poller', daemon=True
+        )
+        self._thread.start()
+
+    def _poll(self):
+        conn = self._connect()
+        try:
+            while not self._stop.wait(self.poll_interval):
+                rows = conn.execute(
+                    'SELECT id, payload FROM event WHERE id > ? ORDER BY id',
+                    (self._cursor,),
+                ).fetchall()
+                for event_id, payload in rows:
+                    self._cursor = event_id
+                    self._deliver(json.loads(payload))
+        finally:
+            conn.close()
+
+    def publish(self, event):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT INTO event (created, payload) VALUES (?, ?)',
+                (now, json.dumps(event)),
+            )
+            conn.execute(
+                'DELETE FROM event WHERE created < ?',
+                (now - self.retention_seconds,),
+            )
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2)
+            self._thread = None
+
+
+class EventBroker:
+    """In-process pub/sub hub that fans events out to open SSE connections."""
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._backend = None
+        self._pid = None
+        self.queue_size = 100
+        self.heartbeat_seconds = 15
+
+    def init_app(self, app):
+        app.config.setdefault('EVENTS_BACKEND', 'local')
+        app.config.setdefault('EVENTS_DB_PATH', os.path.join(app.instance_path, 'events.db'))
+        app.config.setdefault('EVENTS_QUEUE_SIZE', 100)
+        app.config.setdefault('EVENTS_HEARTBEAT_SECONDS', 15)
+        app.config.setdefault('EVENTS_POLL_INTERVAL', 0.5)
+        # Each open stream holds a worker thread under gthread: cap them per
+        # process (None: no cap) and end each one after a while.
+        app.config.setdefault('EVENTS_MAX_STREAMS', None)
+        app.config.setdefault('EVENTS_STREAM_SECONDS', 300)
+        app.extensions['events'] = self
+        self._app_config = app.config
+
+    def _make_backend(self):
+        config = self._app_config
+        self.queue_size = config['EVENTS_QUEUE_SIZE']
+        self.heartbeat_seconds = config['EVENTS_HEARTBEAT_SECONDS']
+        if config['EVENTS_BACKEND'] == 'sqlite':
+            os.makedirs(os.path.dirname(config['EVENTS_DB_PATH']), exist_ok=True)
+            return SQLiteBackend(
+                config['EVENTS_DB_PATH'],
+                poll_interval=config['EVENTS_POLL_INTERVAL'],
+            )
+        return LocalBackend()
+
+    def _ensure_started(self):
+        # Backends are started lazily and restarted in a forked worker,
+        # since poller threads do not survive fork().
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._subscriptions = set()
+            self._backend = self._make_backend()
+            self._backend.start(self._deliver)
+            self._pid = os.getpid()
+
+    def reset(self):
+        """Stop the backend and drop all subscriptions (used after fork and in tests)."""
+        with self._lock:
+            if self._backend is not None and self._pid == os.getpid():
+                self._backend.stop()
+            self._backend = None
+            self._pid = None
+            self._subscriptions = set()
+
+    def subscribe(self, user_id, class_ids):
+        """A new Subscription, or None when EVENTS_MAX_STREAMS are already open."""
+        self._ensure_started()
+        limit = self._app_config['EVENTS_MAX_STREAMS']
+        subscription = Subscription(user_id, class_ids, self.queue_size)
+        with self._lock:
+            if limit is not None and len(self._subscriptions) >= limit:
+                return None
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event_type, class_id, data, user_ids=None):
+        """Publish an event to everyone listening on class_id.
+
+        user_ids narrows the audience (e.g. a submission is only shown to the
+        student who made it and the class owner).
+        """
+        self._ensure_started()
+        event = {
+            'type': event_type,
+            'class_id': class_id,
+            'data': data,
+            'user_ids': sorted(user_ids) if user_ids is not None else None,
+        }
+        self._backend.publish(event)
+
+    def _deliver(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                subscription.offer(event)
+
+
+broker = EventBroker()
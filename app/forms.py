@@ -8,7 +8,7 @@ from wtforms import (
     DateTimeField,
     IntegerField,
 )
-from wtforms.validators import DataRequired, Email, EqualTo, ValidationError
+from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Optional
 from app.models import User
 
 
@@ -49,6 +49,23 @@ class ClassForm(FlaskForm):
     description = TextAreaField('Description')
     submit = SubmitField('Save')
 
+class CloneClassForm(FlaskForm):
+    name = StringField('New class name', validators=[DataRequired()])
+    description = TextAreaField('Description')
+    start_date = DateTimeField(
+        'New first due date (YYYY-MM-DD HH:MM)',
+        format='%Y-%m-%d %H:%M',
+        validators=[Optional()],
+    )
+    shift_days = IntegerField('Or shift every due date by (days)', validators=[Optional()])
+    copy_descriptions = BooleanField('Copy assignment descriptions', default=True)
+    copy_reminders = BooleanField('Copy reminder settings', default=True)
+    submit = SubmitField('Clone class')
+
+    def validate_shift_days(self, shift_days):
+        if shift_days.data is not None and self.start_date.data is not None:
+            raise ValidationError('Give either a new first due date or a shift, not both.')
+
 class SubmissionForm(FlaskForm):
     content = TextAreaField('Your work', validators=[DataRequired()])
     submit = SubmitField('Submit')
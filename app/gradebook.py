@@ -0,0 +1,283 @@
+"""
+Grades and feedback on submissions, and the class gradebook.
+
+The gradebook grid (students x assignments) comes from one query: class
+members are paired with the class's assignments and left-joined against
+submission, and the rows are folded into flat arrays indexed by
+row * width + column. Saving the grid or uploading a CSV of grades goes
+through apply_grades, which diffs the edits against that matrix and writes
+only the cells that changed: existing submissions with one executemany
+UPDATE, and cells with nothing handed in (say a zero for missing work) with
+one executemany INSERT, all in a single transaction. If the student hands
+in between loading the grid and saving it, the INSERT only sets the grade
+on their new submission.
+
+With submission sharding on, the roster comes from app.db and the
+submissions from the class's shard in a second query.
+"""
+
+import csv
+import io
+import math
+from array import array
+from collections import namedtuple
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.models import Assignment, Submission, User, class_memberships
+from app.sharding import shards
+
+
+CSV_FIELDS = ['student_id', 'username', 'assignment_id', 'assignment', 'grade', 'feedback']
+
+Cell = namedtuple('Cell', 'submission_id grade feedback submitted')
+
+_UNGRADED = math.nan
+
+
+class Gradebook:
+    """Students x assignments of one class, with grades in flat arrays."""
+
+    def __init__(self, students, assignments):
+        self.students = students          # [(id, username)] by username
+        self.assignments = assignments    # [(id, title, due_date)] by due date
+        self.row_of = {student_id: r for r, (student_id, _) in enumerate(students)}
+        self.col_of = {assignment_id: c for c, (assignment_id, _, _) in enumerate(assignments)}
+        self.width = len(assignments)
+        size = len(students) * self.width
+        self.submission_ids = array('q', [0] * size)  # 0: no submission row
+        self.grades = array('d', [_UNGRADED] * size)
+        self.submitted = bytearray(size)
+        self.feedback = {}  # index -> text, only where there is some
+
+    def index(self, student_id, assignment_id):
+        """Flat index of a cell, or None if either id is not in this class."""
+        r = self.row_of.get(student_id)
+        c = self.col_of.get(assignment_id)
+        if r is None or c is None:
+            return None
+        return r * self.width + c
+
+    def grade(self, i):
+        value = self.grades[i]
+        return None if math.isnan(value) else value
+
+    def cell(self, row, col):
+        i = row * self.width + col
+        return Cell(
+            self.submission_ids[i] or None,
+            self.grade(i),
+            self.feedback.get(i),
+            bool(self.submitted[i]),
+        )
+
+    def average(self, col):
+        """Mean grade of an assignment over the students who have one."""
+        values = [self.grades[r * self.width + col] for r in range(len(self.students))]
+        values = [v for v in values if not math.isnan(v)]
+        return sum(values) / len(values) if values else None
+
+
+def load_gradebook(clazz):
+    members = class_memberships.c
+    columns = [User.id, User.username, Assignment.id, Assignment.title, Assignment.due_date]
+    query = (
+        select(*columns)
+        .select_from(class_memberships)
+        .join(User, User.id == members.user_id)
+        .outerjoin(Assignment, Assignment.class_id == members.class_id)
+        .where(members.class_id == clazz.id, members.user_id != clazz.owner_id)
+        .order_by(User.username, User.id, Assignment.due_date, Assignment.id)
+    )
+    if not shards.enabled:
+        query = query.add_columns(
+            Submission.id,
+            Submission.grade,
+            Submission.feedback,
+            Submission.submitted_at,
+        ).outerjoin(
+            Submission,
+            and_(
+                Submission.assignment_id == Assignment.id,
+                Submission.student_id == members.user_id,
+            ),
+        )
+    rows = db.session.execute(query).all()
+
+    students, assignments = {}, {}
+    for student_id, username, a_id, title, due_date, *_ in rows:
+        students.setdefault(student_id, username)
+        if a_id is not None:
+            # every student carries every assignment in the same order
+            assignments.setdefault(a_id, (a_id, title, due_date))
+
+    book = Gradebook(list(students.items()), list(assignments.values()))
+    if shards.enabled:
+        # the submissions live in the class's shard, not next to the roster
+        cells = shards.submission_session(clazz.id).execute(
+            select(
+                Submission.student_id,
+                Submission.assignment_id,
+                Submission.id,
+                Submission.grade,
+                Submission.feedback,
+                Submission.submitted_at,
+            ).where(Submission.assignment_id.in_(book.col_of))
+        ).all()
+    else:
+        cells = [(row[0], row[2], *row[5:]) for row in rows if row[5] is not None]
+
+    for student_id, a_id, sub_id, grade, feedback, submitted_at in cells:
+        i = book.index(student_id, a_id)
+        if i is None:
+            continue  # a student who has left the class
+        book.submission_ids[i] = sub_id
+        if grade is not None:
+            book.grades[i] = grade
+        if feedback:
+            book.feedback[i] = feedback
+        book.submitted[i] = submitted_at is not None
+    return book
+
+
+@dataclass
+class GradeResult:
+    updated: int = 0
+    created: int = 0
+    # (row number, reason); row numbers count edits from 1
+    errors: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'updated': self.updated,
+            'created': self.created,
+            'errors': [{'row': row, 'reason': reason} for row, reason in self.errors],
+        }
+
+
+def parse_grade(value):
+    """'' or None -> None (ungraded); otherwise a finite, non-negative float."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+    grade = float(value)
+    if not math.isfinite(grade) or grade < 0:
+        raise ValueError(f'{value!r} is not a valid grade')
+    return grade
+
+
+def apply_grades(clazz, edits, book=None):
+    """Write grade/feedback edits for clazz in one transaction.
+
+    Each edit is a dict with student_id and assignment_id and, optionally,
+    grade and feedback; a key that is left out keeps its current value.
+    """
+    book = book or load_gradebook(clazz)
+    result = GradeResult()
+
+    changes = {}
+    for number, edit in enumerate(edits, start=1):
+        i = book.index(edit.get('student_id'), edit.get('assignment_id'))
+        if i is None:
+            result.errors.append((number, 'not a student and assignment of this class'))
+            continue
+        try:
+            grade = parse_grade(edit['grade']) if 'grade' in edit else book.grade(i)
+        except (TypeError, ValueError):
+            result.errors.append((number, f'invalid grade {edit["grade"]!r}'))
+            continue
+        feedback = (edit.get('feedback') or '').strip() if 'feedback' in edit else book.feedback.get(i, '')
+        # later edits of the same cell win
+        changes[i] = (edit['student_id'], edit['assignment_id'], grade, feedback or None)
+
+    now = datetime.utcnow()
+    updates, inserts = [], []
+    for i, (student_id, assignment_id, grade, feedback) in changes.items():
+        if grade == book.grade(i) and feedback == book.feedback.get(i):
+            continue
+        values = {
+            'grade': grade,
+            'feedback': feedback,
+            'graded_at': now if grade is not None else None,
+        }
+        if book.submission_ids[i]:
+            updates.append({'id': book.submission_ids[i], **values})
+        elif grade is not None or feedback:
+            # graded without anything handed in; submitted_at stays empty
+            inserts.append({
+                'assignment_id': assignment_id,
+                'student_id': student_id,
+                'content': None,
+                'submitted_at': None,
+                **values,
+            })
+
+    session = shards.writable_session(clazz.id)
+    if updates:
+        session.execute(update(Submission), updates)
+    if inserts:
+        # core insert: the ORM would fill the submitted_at default back in
+        stmt = insert(Submission.__table__)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=['assignment_id', 'student_id'],
+            set_={name: stmt.excluded[name] for name in ('grade', 'feedback', 'graded_at')},
+        ), inserts)
+    session.commit()
+
+    result.updated, result.created = len(updates), len(inserts)
+    return result
+
+
+def parse_grade_csv(text, book):
+    """Read grade edits from CSV text shaped like export_csv's output.
+
+    Students can be given by student_id or username; grade and feedback
+    columns that are missing from the header are left unchanged.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    header = set(reader.fieldnames or ())
+    if 'assignment_id' not in header or not header & {'student_id', 'username'}:
+        raise ValueError('CSV needs an assignment_id column and a student_id or username column.')
+
+    by_username = {username: student_id for student_id, username in book.students}
+    edits = []
+    for row in reader:
+        student = (row.get('student_id') or '').strip()
+        assignment = (row.get('assignment_id') or '').strip()
+        edit = {
+            'student_id': int(student) if student.isdigit() else by_username.get(
+                (row.get('username') or '').strip()
+            ),
+            'assignment_id': int(assignment) if assignment.isdigit() else None,
+        }
+        if 'grade' in header:
+            edit['grade'] = row['grade']
+        if 'feedback' in header:
+            edit['feedback'] = row['feedback']
+        edits.append(edit)
+    return edits
+
+
+def export_csv(book):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(CSV_FIELDS)
+    for r, (student_id, username) in enumerate(book.students):
+        for c, (a_id, title, _) in enumerate(book.assignments):
+            cell = book.cell(r, c)
+            writer.writerow([
+                student_id,
+                username,
+                a_id,
+                title,
+                '' if cell.grade is None else f'{cell.grade:g}',
+                cell.feedback or '',
+            ])
+    return out.getvalue()
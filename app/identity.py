@@ -0,0 +1,75 @@
+"""
+Cached identity for flask-login's current_user.
+
+Rebuilding current_user used to cost a SELECT on every authenticated
+request. The loader now returns a CachedUser, a small detached snapshot of
+the user's columns, kept in a TTL/LRU cache keyed by id. Any flush that
+updates or deletes a User evicts its entry, so password, email and
+notification changes are seen on the next request in this process (and
+within USER_CACHE_TTL seconds in other workers).
+
+CachedUser is not attached to a session: views that need the ORM object,
+e.g. to append it to a relationship, should load it or use current_user.id.
+"""
+
+from flask_login import UserMixin
+from sqlalchemy import event, select
+
+from app import db
+from app.cache import TTLCache
+from app.models import User
+
+
+class CachedUser(UserMixin):
+    """Read-only, session-detached stand-in for User on current_user."""
+
+    __slots__ = ('id', 'username', 'email', 'notifications_enabled')
+
+    def __init__(self, id, username, email, notifications_enabled):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.notifications_enabled = notifications_enabled
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+user_cache = TTLCache()
+
+
+def load_user(user_id):
+    """Return the CachedUser for user_id, querying only on a cache miss."""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    row = db.session.execute(
+        select(User.id, User.username, User.email, User.notifications_enabled)
+        .where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+
+    user = CachedUser(*row)
+    user_cache.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id):
+    user_cache.pop(user_id)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _evict_changed_user(mapper, connection, target):
+    invalidate_user(target.id)
+
+
+def init_app(app):
+    app.config.setdefault('USER_CACHE_TTL', 300)
+    app.config.setdefault('USER_CACHE_SIZE', 1024)
+    user_cache.configure(
+        maxsize=app.config['USER_CACHE_SIZE'],
+        ttl=app.config['USER_CACHE_TTL'],
+    )
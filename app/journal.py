@@ -0,0 +1,397 @@
+"""
+Write-ahead journal that batches submission commits during deadline spikes.
+
+Each worker appends to its own fsync'd segment files, which a background
+thread upserts into submission; `flask journal replay` recovers leftovers.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import secrets
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert
+
+from app.models import Submission
+from app.sharding import shards
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows; only one process journals there
+    fcntl = None
+
+
+log = logging.getLogger(__name__)
+
+PendingSubmission = namedtuple(
+    'PendingSubmission', 'assignment_id student_id content submitted_at'
+)
+
+
+def _decode(line):
+    data = json.loads(line)
+    return PendingSubmission(
+        data['assignment_id'],
+        data['student_id'],
+        data['content'],
+        datetime.fromisoformat(data['submitted_at']),
+    )
+
+
+def _encode(record):
+    return json.dumps({
+        'assignment_id': record.assignment_id,
+        'student_id': record.student_id,
+        'content': record.content,
+        'submitted_at': record.submitted_at.isoformat(),
+    }) + '\n'
+
+
+def read_segment(path):
+    """Records in a segment; a torn last line (never acknowledged) is skipped."""
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(_decode(line))
+            except (ValueError, KeyError):
+                log.warning('Skipping unreadable journal line in %s', path)
+    return records
+
+
+def _fsync_dir(path):
+    if os.name != 'posix':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _upsert_statement():
+    table = Submission.__table__
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=['assignment_id', 'student_id'],
+        set_={'content': stmt.excluded.content, 'submitted_at': stmt.excluded.submitted_at},
+        # never let a replayed entry overwrite a newer submission
+        where=or_(
+            table.c.submitted_at.is_(None),
+            table.c.submitted_at <= stmt.excluded.submitted_at,
+        ),
+    )
+
+
+def write_records(connection, records):
+    """Upsert records into submission; the last entry per student wins."""
+    latest = {}
+    for record in records:
+        latest[record.assignment_id, record.student_id] = record
+    if latest:
+        connection.execute(_upsert_statement(), [record._asdict() for record in latest.values()])
+    return len(latest)
+
+
+class SubmissionJournal:
+    """Per-process journal, started lazily like the event broker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()       # current segment and pending entries
+        self._sync_lock = threading.Lock()  # one fsync (or segment swap) at a time
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pid = None
+        self._thread = None
+        self._app = None
+
+    def init_app(self, app):
+        app.config.setdefault('SUBMISSION_JOURNAL_ENABLED', False)
+        app.config.setdefault(
+            'SUBMISSION_JOURNAL_DIR', os.path.join(app.instance_path, 'journal')
+        )
+        app.config.setdefault('SUBMISSION_JOURNAL_INTERVAL', 0.2)
+        app.config.setdefault('SUBMISSION_JOURNAL_BATCH', 500)
+        app.extensions['journal'] = self
+        self._app = app
+        app.cli.add_command(journal_cli)
+        if app.config['SUBMISSION_JOURNAL_ENABLED']:
+            # replay what a crashed worker left behind before serving anything
+            app.before_request(self._ensure_started)
+
+    @property
+    def enabled(self):
+        return self._app is not None and self._app.config['SUBMISSION_JOURNAL_ENABLED']
+
+    # ----- lifecycle -----
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._open()
+            self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name='submission-journal-writer', daemon=True
+        )
+        self._thread.start()
+
+    def _open(self):
+        config = self._app.config
+        self.directory = config['SUBMISSION_JOURNAL_DIR']
+        self.interval = config['SUBMISSION_JOURNAL_INTERVAL']
+        self.batch = config['SUBMISSION_JOURNAL_BATCH']
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._token = f'{os.getpid()}-{secrets.token_hex(4)}'
+        self._lock_file = open(os.path.join(self.directory, f'{self._token}.lock'), 'w')
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+
+        self._pending = {}
+        self._records = []
+        self._sealed = self._adopt_orphans()
+        for _, records in self._sealed:
+            for record in records:
+                self._pending[record.assignment_id, record.student_id] = record
+        self._seq = 0
+        self._written = self._synced = 0
+        self._stop.clear()
+        self._new_segment()
+
+    def _adopt_orphans(self):
+        """Segments of processes that are no longer running, oldest first.
+
+        The dead owner's lock file is kept locked until its segments are
+        written, so if this process dies too the next one adopts them again.
+        """
+        sealed = []
+        self._orphan_locks = []
+        for lock_path in glob.glob(os.path.join(self.directory, '*.lock')):
+            token = os.path.basename(lock_path)[:-len('.lock')]
+            if token == self._token:
+                continue
+            try:
+                other = open(lock_path)
+            except FileNotFoundError:
+                continue  # adopted and finished by someone else meanwhile
+            if fcntl is not None:
+                try:
+                    fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    other.close()  # still alive, or being adopted
+                    continue
+            if os.fstat(other.fileno()).st_nlink == 0:
+                other.close()
+                continue
+            self._orphan_locks.append(other)
+            for path in sorted(glob.glob(os.path.join(self.directory, f'{token}.*.log'))):
+                records = read_segment(path)
+                log.warning('Replaying %d journaled submissions from %s', len(records), path)
+                sealed.append((path, records))
+        return sealed
+
+    def _new_segment(self):
+        self._seq += 1
+        self._path = os.path.join(self.directory, f'{self._token}.{self._seq:08d}.log')
+        self._file = open(self._path, 'a', encoding='utf-8')
+        _fsync_dir(self.directory)
+
+    def reset(self):
+        """Forget this process's journal state (after fork and in tests).
+
+        A forked worker inherits the parent's open segment but not its
+        writer thread; it starts a journal of its own on first use.
+        """
+        if self._pid == os.getpid():
+            self._stop.set()
+            self._wake.set()
+        else:
+            # a lock held by one of the parent's threads at fork time would
+            # never be released in the child
+            self._lock = threading.Lock()
+            self._sync_lock = threading.Lock()
+            self._flush_lock = threading.Lock()
+            self._wake = threading.Event()
+            self._stop = threading.Event()
+        self._pid = None
+        self._thread = None
+
+    def stop(self):
+        """Stop the writer and flush everything journaled so far."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=30)
+        self.flush()
+        with self._lock:
+            self._file.close()
+            os.remove(self._path)
+            self._lock_file.close()
+            os.remove(self._lock_file.name)
+            self._pid = None
+            self._thread = None
+
+    def replay(self):
+        """Write segments left by stopped processes; returns how many entries.
+
+        Used by `flask journal replay` when no worker is going to start.
+        """
+        with self._lock:
+            self._open()
+            self._pid = os.getpid()
+        replayed = sum(len(records) for _, records in self._sealed)
+        self.stop()
+        return replayed
+
+    # ----- request side -----
+
+    def append(self, assignment_id, student_id, content):
+        """Journal a submission durably; returns it once it is safe to acknowledge."""
+        self._ensure_started()
+        record = PendingSubmission(assignment_id, student_id, content, datetime.utcnow())
+        line = _encode(record)
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._records.append(record)
+            self._pending[assignment_id, student_id] = record
+            self._written += 1
+            seq = self._written
+            waiting = len(self._records)
+        self._sync(seq)
+        if waiting >= self.batch:
+            self._wake.set()
+        return record
+
+    def _sync(self, seq):
+        # group commit: one fsync covers every line written before it started
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._lock:
+                target = self._written
+                fileno = self._file.fileno()
+            os.fsync(fileno)
+            self._synced = target
+
+    def pending(self, assignment_id, student_id):
+        """The newest journaled submission not yet in the database, or None.
+
+        The student's next request may well land on another worker, so the
+        other workers' segment files are searched as well as this one's
+        memory. Segments are only deleted once their rows are committed, so
+        a caller that reads the database after this misses nothing.
+        """
+        if self._pid != os.getpid():
+            return None
+        key = assignment_id, student_id
+        with self._lock:
+            latest = self._pending.get(key)
+        for path in glob.glob(os.path.join(self.directory, '*.log')):
+            if os.path.basename(path).startswith(self._token + '.'):
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                continue  # written to the database meanwhile
+            for line in lines:
+                try:
+                    record = _decode(line)
+                except (ValueError, KeyError):
+                    continue  # a line another worker is still writing
+                if (record.assignment_id, record.student_id) == key and (
+                    latest is None or record.submitted_at >= latest.submitted_at
+                ):
+                    latest = record
+        return latest
+
+    # ----- writer side -----
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # keep the segments and try again on the next tick
+                log.exception('Writing journaled submissions failed')
+
+    def _seal(self):
+        with self._sync_lock:
+            with self._lock:
+                if not self._records:
+                    return
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._synced = self._written
+                self._file.close()
+                self._sealed.append((self._path, self._records))
+                self._records = []
+                self._new_segment()
+
+    def flush(self):
+        """Write every sealed segment, then the current one, to the database."""
+        if self._pid != os.getpid():
+            # not started in this process, so it holds nothing to write
+            return
+        with self._flush_lock:
+            self._seal()
+            if not self._sealed:
+                return
+            if shards.locked:
+                # classes are being moved; keep the segments until unlock
+                return
+            with self._app.app_context():
+                while self._sealed:
+                    path, records = self._sealed[0]
+                    # one transaction per submission shard (just app.db
+                    # unless sharded); replaying a segment is idempotent
+                    for engine, group in shards.partition(records):
+                        with engine.begin() as connection:
+                            write_records(connection, group)
+                    os.remove(path)
+                    self._sealed.pop(0)
+                    with self._lock:
+                        for record in records:
+                            key = record.assignment_id, record.student_id
+                            if self._pending.get(key) is record:
+                                del self._pending[key]
+                for other in self._orphan_locks:
+                    os.remove(other.name)
+                    other.close()
+                self._orphan_locks = []
+
+
+journal = SubmissionJournal()
+atexit.register(journal.stop)
+
+
+journal_cli = AppGroup('journal', help='Inspect and replay the submission journal.')
+
+
+@journal_cli.command('replay')
+@with_appcontext
+def replay_command():
+    """Write journal segments left by stopped workers into the database."""
+    if not os.path.isdir(current_app.config['SUBMISSION_JOURNAL_DIR']):
+        click.echo('No journal directory, nothing to replay.')
+        return
+    replayed = current_app.extensions['journal'].replay()
+    click.echo(f'Replayed {replayed} journaled submissions.')
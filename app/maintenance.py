@@ -0,0 +1,242 @@
+"""
+Online backups and routine upkeep of the SQLite files.
+
+Backups use SQLite's backup API in a single step. In WAL mode that only
+holds a read snapshot of the source, so submissions keep flowing while it
+copies; a copy in small steps would instead start over every time another
+connection writes, and might never finish during a busy hour. Each copy is
+written under a temporary name, checked with PRAGMA quick_check and only
+then renamed into place, so a backup file is either complete or absent.
+
+`flask maintenance run` is meant for a cron job or systemd timer: it runs
+PRAGMA optimize (ANALYZE only where statistics are stale), returns free
+pages to the filesystem with incremental vacuum once they exceed
+MAINTENANCE_VACUUM_THRESHOLD of the file, and optionally takes a backup.
+Every step reports file size, page and freelist counts and its duration.
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app import db
+from app.sharding import shards
+
+
+def database_paths():
+    """{name: path} of the SQLite files worth maintaining."""
+    paths = {'main': db.engine.url.database}
+    archive = current_app.config.get('ARCHIVE_DATABASE_PATH')
+    if archive and os.path.exists(archive):
+        paths['archive'] = archive
+    for shard in range(shards.count):
+        if os.path.exists(shards.path(shard)):
+            paths[f'shard-{shard}'] = shards.path(shard)
+    return paths
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+def file_metrics(conn, path):
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    wal = path + '-wal'
+    return {
+        'size_bytes': os.path.getsize(path),
+        'wal_bytes': os.path.getsize(wal) if os.path.exists(wal) else 0,
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_pages': freelist,
+    }
+
+
+def backup(path, dest):
+    """Copy the database at path to dest while it stays in use."""
+    started = time.monotonic()
+    tmp = dest + '.partial'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    source = _connect(path)
+    target = sqlite3.connect(tmp)
+    try:
+        # pages=-1: one step from one read snapshot
+        source.backup(target, pages=-1)
+        check = target.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f'backup of {path} failed its check: {check}')
+        metrics = file_metrics(target, tmp)
+    finally:
+        target.close()
+        source.close()
+    os.replace(tmp, dest)
+    return {**metrics, 'duration_seconds': round(time.monotonic() - started, 3)}
+
+
+def prune_backups(directory, name, keep):
+    """Delete all but the newest keep backups of one database."""
+    backups = sorted(glob.glob(os.path.join(directory, f'{name}-*.db')))
+    for old in backups[:-keep] if keep else []:
+        os.remove(old)
+    return backups[-keep:] if keep else backups
+
+
+def optimize(path, full=False):
+    """PRAGMA optimize, or a full ANALYZE; returns the file metrics."""
+    started = time.monotonic()
+    conn = _connect(path)
+    try:
+        conn.execute('ANALYZE' if full else 'PRAGMA optimize')
+        metrics = file_metrics(conn, path)
+    finally:
+        conn.close()
+    return {**metrics, 'duration_seconds': round(time.monotonic() - started, 3)}
+
+
+def auto_vacuum_mode(conn):
+    return {0: 'none', 1: 'full', 2: 'incremental'}[
+        conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    ]
+
+
+def enable_incremental_vacuum(path):
+    """Switch a file to auto_vacuum=INCREMENTAL. Runs one full VACUUM, which
+    locks the database for its duration; do it once, off-peak."""
+    conn = _connect(path)
+    try:
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+        return auto_vacuum_mode(conn)
+    finally:
+        conn.close()
+
+
+def incremental_vacuum(path, threshold=0.0, max_pages=None):
+    """Release free pages when they exceed threshold (a fraction of the file).
+
+    Only frees up to max_pages per call so the write lock stays short.
+    """
+    started = time.monotonic()
+    conn = _connect(path)
+    try:
+        before = file_metrics(conn, path)
+        mode = auto_vacuum_mode(conn)
+        freed = 0
+        wanted = before['page_count'] and before['freelist_pages'] / before['page_count'] > threshold
+        if mode == 'incremental' and wanted:
+            pages = before['freelist_pages'] if max_pages is None else min(max_pages, before['freelist_pages'])
+            # execute() would step the pragma once, freeing a single page;
+            # executescript runs it to completion
+            conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+            freed = before['freelist_pages'] - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        after = file_metrics(conn, path)
+    finally:
+        conn.close()
+    return {
+        **after,
+        'auto_vacuum': mode,
+        'freed_pages': freed,
+        'duration_seconds': round(time.monotonic() - started, 3),
+    }
+
+
+def _report(step, name, metrics, as_json):
+    if as_json:
+        click.echo(json.dumps({'step': step, 'database': name, **metrics}))
+    else:
+        values = ' '.join(f'{key}={value}' for key, value in metrics.items())
+        click.echo(f'{step} {name}: {values}')
+
+
+def _backup_all(directory, keep, as_json):
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    for name, path in database_paths().items():
+        dest = os.path.join(directory, f'{name}-{stamp}.db')
+        _report('backup', name, {'file': dest, **backup(path, dest)}, as_json)
+        prune_backups(directory, name, keep)
+
+
+maintenance_cli = AppGroup('maintenance', help='Back up and tune the SQLite databases.')
+
+_json_option = click.option('--json', 'as_json', is_flag=True, help='One JSON object per line.')
+
+
+@maintenance_cli.command('backup')
+@click.option('--dir', 'directory', help='Where to put backups (default: MAINTENANCE_BACKUP_DIR).')
+@click.option('--keep', type=int, help='Backups to keep per database (default: MAINTENANCE_BACKUP_KEEP).')
+@_json_option
+def backup_command(directory, keep, as_json):
+    """Take an online backup of every database file."""
+    config = current_app.config
+    _backup_all(
+        directory or config['MAINTENANCE_BACKUP_DIR'],
+        config['MAINTENANCE_BACKUP_KEEP'] if keep is None else keep,
+        as_json,
+    )
+
+
+@maintenance_cli.command('optimize')
+@click.option('--full', is_flag=True, help='Run a full ANALYZE instead of PRAGMA optimize.')
+@_json_option
+def optimize_command(full, as_json):
+    """Refresh the query planner's statistics."""
+    for name, path in database_paths().items():
+        _report('optimize', name, optimize(path, full=full), as_json)
+
+
+@maintenance_cli.command('vacuum')
+@click.option('--enable', is_flag=True,
+              help='Switch to auto_vacuum=INCREMENTAL first (one blocking VACUUM).')
+@click.option('--max-pages', type=int, help='Free at most this many pages.')
+@_json_option
+def vacuum_command(enable, max_pages, as_json):
+    """Return free pages to the filesystem without a blocking VACUUM."""
+    for name, path in database_paths().items():
+        if enable:
+            enable_incremental_vacuum(path)
+        metrics = incremental_vacuum(path, max_pages=max_pages)
+        _report('vacuum', name, metrics, as_json)
+        if metrics['auto_vacuum'] != 'incremental':
+            click.echo(f'{name} does not use incremental vacuum yet; run with --enable once.', err=True)
+
+
+@maintenance_cli.command('run')
+@click.option('--backup/--no-backup', 'take_backup', default=False, help='Also take a backup.')
+@_json_option
+def run_command(take_backup, as_json):
+    """Scheduled upkeep: optimize, vacuum above the threshold, optional backup."""
+    config = current_app.config
+    for name, path in database_paths().items():
+        _report('optimize', name, optimize(path), as_json)
+        _report('vacuum', name, incremental_vacuum(
+            path,
+            threshold=config['MAINTENANCE_VACUUM_THRESHOLD'],
+            max_pages=config['MAINTENANCE_VACUUM_MAX_PAGES'],
+        ), as_json)
+    if take_backup:
+        _backup_all(
+            config['MAINTENANCE_BACKUP_DIR'],
+            config['MAINTENANCE_BACKUP_KEEP'],
+            as_json,
+        )
+
+
+def init_app(app):
+    app.config.setdefault('MAINTENANCE_BACKUP_DIR', os.path.join(app.instance_path, 'backups'))
+    app.config.setdefault('MAINTENANCE_BACKUP_KEEP', 7)
+    # vacuum once free pages are more than this fraction of the file
+    app.config.setdefault('MAINTENANCE_VACUUM_THRESHOLD', 0.1)
+    app.config.setdefault('MAINTENANCE_VACUUM_MAX_PAGES', 5000)
+    app.cli.add_command(maintenance_cli)
@@ -3,11 +3,16 @@ from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
+# shared with bulk provisioning so both paths produce the same hashes
+PASSWORD_HASH_METHOD = "pbkdf2:sha256"
+
 #users enrolled in classes
 class_memberships = db.Table(
     'class_memberships',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
     db.Column('class_id', db.Integer, db.ForeignKey('class.id'), primary_key=True),
+    # the primary key leads with user_id, so per-class roster lookups need their own index
+    db.Index('ix_class_memberships_class_id', 'class_id'),
 )
 
 class User(db.Model, UserMixin):
@@ -20,7 +25,7 @@ class User(db.Model, UserMixin):
     def set_password(self, password):
             self.password_hash = generate_password_hash(
             password,
-            method="pbkdf2:sha256"
+            method=PASSWORD_HASH_METHOD
         )
 
     def check_password(self, password):
@@ -31,6 +36,10 @@ class User(db.Model, UserMixin):
     
 #added for class assignemnt connection
 class Class(db.Model):
+    # AUTOINCREMENT: ids of archived (deleted) rows must never be handed out
+    # again, or restoring them would clash and the live row would shadow them
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(140), nullable=False)
     description = db.Column(db.Text)
@@ -51,6 +60,8 @@ class Class(db.Model):
 
 
 class Assignment(db.Model):
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(140), nullable=False)
     description = db.Column(db.Text)
@@ -62,7 +73,7 @@ class Assignment(db.Model):
     creator = db.relationship('User', backref='created_assignments')
 
     # which class this assignment belongs to
-    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False, index=True)
     clazz = db.relationship('Class', backref='assignments')
 
     def __repr__(self):
@@ -76,12 +87,65 @@ class Submission(db.Model):
     content = db.Column(db.Text)  # or a file path / URL if you want uploads
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # NULL submitted_at: graded (e.g. a zero) without anything handed in
+    grade = db.Column(db.Float)
+    feedback = db.Column(db.Text)
+    graded_at = db.Column(db.DateTime)
+
     assignment = db.relationship('Assignment', backref='submissions')
     student = db.relationship('User', backref='submissions')
 
     __table_args__ = (
         db.UniqueConstraint('assignment_id', 'student_id', name='uq_assignment_student'),
+        {'sqlite_autoincrement': True},
     )
 
     def __repr__(self):
         return f'<Submission assignment={self.assignment_id} student={self.student_id}>'
+
+
+class DeadlineLoad(db.Model):
+    """How many deadlines a student has on a day from one class.
+
+    A precomputed index maintained by app.deadline_index so the assignment
+    form can show deadline clashes without joining every student's classes.
+    """
+    __tablename__ = 'deadline_load'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DeadlineLoad user={self.user_id} day={self.day} count={self.count}>'
+
+
+class WorkloadGeneration(db.Model):
+    """Counter bumped when a class's assignments or a user's classes change.
+
+    Kept in app.db so every worker can tell its cached workload is stale;
+    see app.workload. scope is 'class' or 'user'.
+    """
+    __tablename__ = 'workload_generation'
+
+    scope = db.Column(db.String(8), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<WorkloadGeneration {self.scope}={self.scope_id} {self.generation}>'
+
+
+class ClassShard(db.Model):
+    """Which submission shard holds a class's submissions.
+
+    Only used when SUBMISSION_SHARDS is set; see app.sharding.
+    """
+    __tablename__ = 'class_shard'
+
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), primary_key=True)
+    shard = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<ClassShard class={self.class_id} shard={self.shard}>'
@@ -0,0 +1,209 @@
+"""
+Bulk user account provisioning from a registrar export.
+
+Registering accounts one form post at a time costs two uniqueness queries,
+a password hash and a commit per user. Here a whole CSV/JSON batch is
+checked against existing accounts with two IN queries, passwords are hashed
+across a process pool (PBKDF2 is CPU-bound, so threads would not help), and
+users are written with executemany INSERTs in chunks. Rows that cannot be
+created are reported individually instead of failing the batch.
+
+The process pool is only used by `flask users provision`. The HTTP endpoint
+hashes in the request thread and refuses batches over PROVISIONING_MAX_ROWS,
+so a large registrar export goes through the command instead of holding a
+worker past its timeout.
+"""
+
+import csv
+import functools
+import io
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import click
+from email_validator import EmailNotValidError, validate_email
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import PASSWORD_HASH_METHOD, User
+
+
+FIELDS = ('username', 'email', 'password')
+
+# stay well under SQLite's bound-parameter limit
+IN_CHUNK = 500
+
+MAX_LENGTHS = {
+    'username': User.username.type.length,
+    'email': User.email.type.length,
+}
+
+
+@dataclass
+class ProvisionResult:
+    created: int = 0
+    # (row number, username, reason); row numbers count data rows from 1
+    conflicts: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'conflicts': [
+                {'row': row, 'username': username, 'reason': reason}
+                for row, username, reason in self.conflicts
+            ],
+        }
+
+
+def parse_users(text, fmt):
+    """Read rows of {username, email, password} from CSV or JSON text."""
+    if fmt == 'json':
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError('JSON input must be a list of user objects.')
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    return [{name: (row.get(name) or '').strip() for name in FIELDS} for row in rows]
+
+
+def _existing(column, values):
+    """Values of column already taken, one IN query per IN_CHUNK values."""
+    values = list(values)
+    taken = set()
+    for start in range(0, len(values), IN_CHUNK):
+        chunk = values[start:start + IN_CHUNK]
+        taken.update(db.session.scalars(select(column).where(column.in_(chunk))))
+    return taken
+
+
+def _hash_passwords(passwords, workers):
+    hasher = functools.partial(generate_password_hash, method=PASSWORD_HASH_METHOD)
+    if workers <= 1 or len(passwords) < 2:
+        return [hasher(password) for password in passwords]
+
+    # spawn, not fork: the app process may be running background threads
+    context = multiprocessing.get_context('spawn')
+    chunksize = max(1, len(passwords) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return list(pool.map(hasher, passwords, chunksize=chunksize))
+
+
+def provision_users(rows, workers=None, chunk_size=1000):
+    """Create accounts for rows; return a ProvisionResult."""
+    workers = workers or os.cpu_count() or 1
+    result = ProvisionResult()
+
+    valid = []
+    seen_usernames, seen_emails = set(), set()
+    for number, row in enumerate(rows, start=1):
+        username, email, password = row['username'], row['email'], row['password']
+        if not username or not email or not password:
+            result.conflicts.append((number, username, 'username, email and password are required'))
+            continue
+        too_long = [name for name, limit in MAX_LENGTHS.items() if len(row[name]) > limit]
+        if too_long:
+            name = too_long[0]
+            result.conflicts.append((number, username, f'{name} is longer than {MAX_LENGTHS[name]} characters'))
+            continue
+        try:
+            validate_email(email, check_deliverability=False)
+        except EmailNotValidError:
+            result.conflicts.append((number, username, 'invalid email address'))
+            continue
+        if username in seen_usernames:
+            result.conflicts.append((number, username, 'duplicate username in this batch'))
+            continue
+        if email in seen_emails:
+            result.conflicts.append((number, username, 'duplicate email in this batch'))
+            continue
+        seen_usernames.add(username)
+        seen_emails.add(email)
+        valid.append((number, row))
+
+    taken_usernames = _existing(User.username, seen_usernames)
+    taken_emails = _existing(User.email, seen_emails)
+
+    pending = []
+    for number, row in valid:
+        if row['username'] in taken_usernames:
+            result.conflicts.append((number, row['username'], 'username already exists'))
+        elif row['email'] in taken_emails:
+            result.conflicts.append((number, row['username'], 'email already exists'))
+        else:
+            pending.append((number, row))
+
+    hashes = _hash_passwords([row['password'] for _, row in pending], workers)
+    records = [
+        (number, {
+            'username': row['username'],
+            'email': row['email'],
+            'password_hash': password_hash,
+            'notifications_enabled': True,
+        })
+        for (number, row), password_hash in zip(pending, hashes)
+    ]
+
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(User), [values for _, values in chunk])
+            result.created += len(chunk)
+        except IntegrityError:
+            # someone registered one of these names meanwhile; find which row by row
+            for number, values in chunk:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(User), [values])
+                    result.created += 1
+                except IntegrityError:
+                    result.conflicts.append((number, values['username'], 'username or email already exists'))
+
+    db.session.commit()
+    result.conflicts.sort()
+    return result
+
+
+users_cli = AppGroup('users', help='Manage user accounts.')
+
+
+@users_cli.command('provision')
+@click.argument('source', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json']),
+              help='Input format (default: from the file extension).')
+@click.option('--workers', type=int, default=None,
+              help='Processes used for password hashing (default: all cores).')
+@click.option('--chunk-size', type=int, default=1000, show_default=True,
+              help='Users per INSERT batch.')
+def provision_command(source, fmt, workers, chunk_size):
+    """Create accounts from a CSV or JSON file with username, email and password."""
+    fmt = fmt or ('json' if source.name.endswith('.json') else 'csv')
+    try:
+        rows = parse_users(source.read(), fmt)
+    except (ValueError, csv.Error) as exc:
+        raise click.ClickException(f'Could not read {source.name}: {exc}')
+
+    result = provision_users(rows, workers=workers, chunk_size=chunk_size)
+    for row, username, reason in result.conflicts:
+        click.echo(f'row {row} ({username or "?"}): {reason}', err=True)
+    click.echo(f'Created {result.created} users, {len(result.conflicts)} rows skipped.')
+
+
+def init_app(app):
+    # usernames allowed to use the provisioning endpoint
+    app.config.setdefault('PROVISIONING_ADMINS', [])
+    # each password hash takes ~0.4s, so a full batch stays far inside
+    # SERVER_TIMEOUT; larger uploads are refused, use `flask users provision`
+    app.config.setdefault('PROVISIONING_MAX_ROWS', 10)
+    app.cli.add_command(users_cli)
+
+
+def is_admin(user):
+    return user.is_authenticated and user.username in current_app.config['PROVISIONING_ADMINS']
@@ -0,0 +1,194 @@
+"""
+Token-bucket rate limiting for the expensive anonymous endpoints.
+
+Login hashes a password per attempt, register hashes one and runs two
+uniqueness queries, and enroll accepts guessable integer class codes, so
+each is throttled per client IP, per username and per endpoint overall.
+Limits are written like '10/minute' and can be overridden per scope through
+the RATELIMITS config mapping, e.g.
+
+    RATELIMITS = {'login': {'ip': '5/minute'}}
+
+The memory backend keeps buckets in this process; RATELIMIT_BACKEND='sqlite'
+keeps them in a local SQLite file so every worker process agrees. Only the
+methods that do the work (POST by default) consume tokens, so page views
+cost nothing. A rejected request gets 429 Too Many Requests with Retry-After.
+"""
+
+import functools
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app, request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+@functools.lru_cache(maxsize=64)
+def parse_limit(spec):
+    """'10/minute' -> (capacity, tokens refilled per second)."""
+    count, _, period = spec.partition('/')
+    count = int(count)
+    return count, count / _PERIODS[period.strip().rstrip('s')]
+
+
+def _refill(tokens, updated, now, capacity, rate):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class MemoryBackend:
+    """Buckets in a dict, shared by the threads of one process."""
+
+    def __init__(self, max_keys=100000, idle_seconds=3600):
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now=None):
+        """Consume one token; return 0 if allowed, else seconds until one is free."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, capacity, rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return 0
+
+    def _prune(self, now):
+        # a bucket idle long enough to have refilled is the same as no bucket
+        self._buckets = {
+            key: (tokens, updated)
+            for key, (tokens, updated) in self._buckets.items()
+            if now - updated < self.idle_seconds
+        }
+
+
+class SQLiteBackend:
+    """Buckets in a local SQLite file so all worker processes share limits."""
+
+    def __init__(self, path, prune_every=1000, idle_seconds=86400):
+        self.path = path
+        self.prune_every = prune_every
+        self.idle_seconds = idle_seconds
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated FROM bucket WHERE key = ?', (key,)
+            ).fetchone()
+            tokens = capacity if row is None else _refill(row[0], row[1], now, capacity, rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            conn.execute(
+                'INSERT INTO bucket (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (key, tokens, now),
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._takes += 1
+        if self._takes % self.prune_every == 0:
+            conn.execute('DELETE FROM bucket WHERE updated < ?', (now - self.idle_seconds,))
+        return wait
+
+
+class RateLimiter:
+    """Picks the backend from config and provides the limit() decorator."""
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_BACKEND', 'memory')
+        app.config.setdefault(
+            'RATELIMIT_DB_PATH', os.path.join(app.instance_path, 'ratelimit.db')
+        )
+        app.config.setdefault('RATELIMITS', {})
+
+        if app.config['RATELIMIT_BACKEND'] == 'sqlite':
+            os.makedirs(os.path.dirname(app.config['RATELIMIT_DB_PATH']), exist_ok=True)
+            backend = SQLiteBackend(app.config['RATELIMIT_DB_PATH'])
+        else:
+            backend = MemoryBackend()
+        app.extensions['ratelimit'] = backend
+
+    def limit(self, scope, methods=('POST',), **defaults):
+        """Throttle a view. Keyword arguments give the default limit for each
+        dimension: ip, username (the submitted or logged-in username) and
+        endpoint (all clients together)."""
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method in methods and current_app.config['RATELIMIT_ENABLED']:
+                    self._check(scope, defaults)
+                return view(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def _check(self, scope, defaults):
+        limits = dict(defaults)
+        limits.update(current_app.config['RATELIMITS'].get(scope, {}))
+        backend = current_app.extensions['ratelimit']
+
+        for dimension, spec in limits.items():
+            if not spec:
+                continue
+            key = self._key(dimension)
+            if key is None:
+                continue
+            capacity, rate = parse_limit(spec)
+            wait = backend.take(f'{scope}:{dimension}:{key}', capacity, rate)
+            if wait:
+                raise TooManyRequests(
+                    'Too many attempts, please wait and try again.',
+                    retry_after=math.ceil(wait),
+                )
+
+    @staticmethod
+    def _key(dimension):
+        if dimension == 'ip':
+            return request.remote_addr or 'unknown'
+        if dimension == 'username':
+            username = request.form.get('username')
+            if not username and current_user.is_authenticated:
+                username = current_user.username
+            return username.strip().lower() if username else None
+        if dimension == 'endpoint':
+            return 'all'
+        raise ValueError(f'unknown rate limit dimension {dimension!r}')
+
+
+limiter = RateLimiter()
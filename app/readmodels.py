@@ -0,0 +1,196 @@
+"""
+Read-only row objects for the list views.
+
+timeline, deadlines, assignments and view_submissions only read a few
+columns from each row and never change them, yet building ORM instances
+gives every row an identity-map entry, change-tracking state and lazy
+relationship loaders (and assignment.clazz.name in a template costs one
+more query per class). These helpers run plain Core selects on the
+session's connection, joining in the class or student name up front, and
+wrap each result row in a small __slots__ object holding just the columns
+its view uses. benchmarks/bench_read_path.py compares both paths.
+
+With submission sharding on, submission rows come from a shard file that has
+no user table, so names are looked up in app.db with one IN query, and a
+student's work across classes is gathered from every shard in parallel.
+"""
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Assignment, Class, Submission, User
+from app.sharding import shards
+
+
+assignment = Assignment.__table__.c
+clazz = Class.__table__.c
+submission = Submission.__table__.c
+user = User.__table__.c
+
+
+class TimelineRow:
+    __slots__ = ('id', 'title', 'due_date', 'class_id', 'class_name')
+
+    def __init__(self, id, title, due_date, class_id, class_name):
+        self.id = id
+        self.title = title
+        self.due_date = due_date
+        self.class_id = class_id
+        self.class_name = class_name
+
+    def __repr__(self):
+        return f'<TimelineRow {self.id} {self.title!r}>'
+
+
+class DeadlineRow:
+    __slots__ = ('id', 'title', 'description', 'due_date')
+
+    def __init__(self, id, title, description, due_date):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.due_date = due_date
+
+    def __repr__(self):
+        return f'<DeadlineRow {self.id} {self.title!r}>'
+
+
+class AssignmentListRow:
+    __slots__ = ('id', 'title', 'description', 'due_date', 'class_id', 'class_name')
+
+    def __init__(self, id, title, description, due_date, class_id, class_name):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.due_date = due_date
+        self.class_id = class_id
+        self.class_name = class_name
+
+    def __repr__(self):
+        return f'<AssignmentListRow {self.id} {self.title!r}>'
+
+
+class SubmissionRow:
+    __slots__ = ('id', 'student_id', 'username', 'content', 'submitted_at', 'grade', 'feedback')
+
+    def __init__(self, id, student_id, username, content, submitted_at, grade, feedback):
+        self.id = id
+        self.student_id = student_id
+        self.username = username
+        self.content = content
+        self.submitted_at = submitted_at
+        self.grade = grade
+        self.feedback = feedback
+
+    def __repr__(self):
+        return f'<SubmissionRow {self.id} {self.username!r}>'
+
+
+def _rows(row_type, query, session=None):
+    connection = (session or db.session).connection()
+    return [row_type(*row) for row in connection.execute(query)]
+
+
+def timeline(class_ids):
+    """Assignments of class_ids by due date, with their class name."""
+    if not class_ids:
+        return []
+    return _rows(TimelineRow, (
+        select(assignment.id, assignment.title, assignment.due_date, clazz.id, clazz.name)
+        .join_from(Assignment.__table__, Class.__table__, clazz.id == assignment.class_id)
+        .where(assignment.class_id.in_(class_ids))
+        .order_by(assignment.due_date)
+    ))
+
+
+def deadlines(class_ids):
+    if not class_ids:
+        return []
+    return _rows(DeadlineRow, (
+        select(assignment.id, assignment.title, assignment.description, assignment.due_date)
+        .where(assignment.class_id.in_(class_ids))
+        .order_by(assignment.due_date)
+    ))
+
+
+def assignment_list(class_ids):
+    if not class_ids:
+        return []
+    return _rows(AssignmentListRow, (
+        select(
+            assignment.id,
+            assignment.title,
+            assignment.description,
+            assignment.due_date,
+            clazz.id,
+            clazz.name,
+        )
+        .join_from(Assignment.__table__, Class.__table__, clazz.id == assignment.class_id)
+        .where(assignment.class_id.in_(class_ids))
+        .order_by(assignment.due_date)
+    ))
+
+
+def submissions(assignment_id, session=None):
+    """Submissions of an assignment with the student's username.
+
+    session picks the database, so archived assignments work too.
+    """
+    return _rows(SubmissionRow, (
+        select(
+            submission.id,
+            submission.student_id,
+            user.username,
+            submission.content,
+            submission.submitted_at,
+            submission.grade,
+            submission.feedback,
+        )
+        .join_from(Submission.__table__, User.__table__, user.id == submission.student_id)
+        .where(submission.assignment_id == assignment_id)
+        .order_by(submission.id)
+    ), session)
+
+
+def shard_submissions(assignment_id, session):
+    """submissions() for a shard session: usernames come from app.db."""
+    rows = session.connection().execute(
+        select(
+            submission.id,
+            submission.student_id,
+            submission.content,
+            submission.submitted_at,
+            submission.grade,
+            submission.feedback,
+        )
+        .where(submission.assignment_id == assignment_id)
+        .order_by(submission.id)
+    ).all()
+    names = dict(db.session.connection().execute(
+        select(user.id, user.username).where(user.id.in_({row.student_id for row in rows}))
+    ).all())
+    return [
+        SubmissionRow(id, student_id, names.get(student_id), content, submitted_at, grade, feedback)
+        for id, student_id, content, submitted_at, grade, feedback in rows
+    ]
+
+
+def handed_in(student_id, assignment_ids, class_ids):
+    """The subset of assignment_ids the student has handed work in for.
+
+    class_ids are the classes of those assignments; only their shards are read.
+    """
+    if not assignment_ids:
+        return set()
+    query = select(submission.assignment_id).where(
+        submission.student_id == student_id,
+        submission.assignment_id.in_(assignment_ids),
+        submission.submitted_at.is_not(None),
+    )
+    if not shards.enabled:
+        return set(db.session.connection().scalars(query))
+    found = shards.fan_out(
+        lambda connection: connection.scalars(query).all(),
+        {shards.shard_for(class_id) for class_id in class_ids},
+    )
+    return {assignment_id for ids in found for assignment_id in ids}
@@ -2,27 +2,41 @@
 Routes and views for the flask application.
 """
 
+import csv
+import io
 from datetime import datetime, timedelta
 
-from flask import current_app as deadline_app
-from flask import render_template, redirect, url_for, flash, request, abort
+from flask import (
+    Blueprint, render_template, redirect, url_for, flash, request, abort, Response,
+    jsonify, current_app,
+)
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy import select, insert, and_
 
 from app.forms import (
     LoginForm,
     RegistrationForm,
     AssignmentForm,
     ClassForm,
+    CloneClassForm,
     SubmissionForm,
     EnrollClassForm,
 )
-from app.models import User, Assignment, Class, Submission
-from app import db
+from app.models import User, Assignment, Class, Submission, class_memberships
+from app.events import broker
+from app.journal import journal
+from app.audit import audit
+from app.sharding import shards
+from app.ratelimit import limiter
+from app import db, archive, provisioning, workload, deadline_index, gradebook, readmodels
+
+
+bp = Blueprint('main', __name__)
 
 
 # ---------- HOME ----------
 
-@deadline_app.route('/')
+@bp.route('/')
 def home():
     """Render the home page."""
     return render_template(
@@ -36,54 +50,80 @@ def home():
 
 def _get_user_class_ids():
     """Return a set of class IDs the current user owns or is enrolled in."""
-    owned_classes = Class.query.filter_by(owner_id=current_user.id).all()
-    member_classes = current_user.classes.all()  # many-to-many backref
+    members = class_memberships.c
+    owned = select(Class.id).where(Class.owner_id == current_user.id)
+    enrolled = select(members.class_id).where(members.user_id == current_user.id)
 
-    class_ids = {c.id for c in owned_classes + member_classes}
+    class_ids = set(db.session.scalars(owned.union(enrolled)))
     return class_ids
 
 
+# ---------- HELPER: ORM ROWS FOR THE CACHED CURRENT USER ----------
+
+def _current_user_record():
+    """Load the User row behind current_user.
+
+    current_user is a cached, session-detached snapshot (see app.identity);
+    use this only when the ORM object itself is needed, e.g. to append the
+    user to a relationship.
+    """
+    return db.session.get(User, current_user.id)
+
+
+def _enrolled_classes():
+    """Classes the current user is a member of."""
+    members = class_memberships.c
+    return (
+        Class.query
+        .join(class_memberships, members.class_id == Class.id)
+        .filter(members.user_id == current_user.id)
+        .all()
+    )
+
+
+# ---------- HELPER: LIVE ROW OR READ-ONLY ARCHIVED ROW ----------
+
+def _get_live_or_archived(model, ident):
+    """Return (obj, session, archived), falling back to the term archive.
+
+    Archived classes stay browsable; callers use the returned session for
+    follow-up queries and must not offer any write actions when archived.
+    """
+    obj = db.session.get(model, ident)
+    if obj is not None:
+        return obj, db.session, False
+
+    obj = archive.get_archived(model, ident)
+    if obj is None:
+        abort(404)
+    return obj, archive.archive_session(), True
+
+
 # ---------- TIMELINE / DEADLINES ----------
 
-@deadline_app.route('/timeline')
+@bp.route('/timeline')
 @login_required
 def timeline():
     """Show assignments for the current user ordered by due date."""
-    class_ids = _get_user_class_ids()
-
-    if class_ids:
-        assignments = (
-            Assignment.query
-            .filter(Assignment.class_id.in_(class_ids))
-            .order_by(Assignment.due_date)
-            .all()
-        )
-    else:
-        assignments = []
+    assignments = readmodels.timeline(_get_user_class_ids())
+    submitted = readmodels.handed_in(
+        current_user.id, [a.id for a in assignments], {a.class_id for a in assignments}
+    )
 
     return render_template(
         'timeline.html',
         title='Timeline',
         assignments=assignments,
+        submitted=submitted,
         now=datetime.now(),
     )
 
 
-@deadline_app.route('/deadlines')
+@bp.route('/deadlines')
 @login_required
 def deadlines():
     """Render upcoming deadlines for the current user."""
-    class_ids = _get_user_class_ids()
-
-    if class_ids:
-        assignments = (
-            Assignment.query
-            .filter(Assignment.class_id.in_(class_ids))
-            .order_by(Assignment.due_date)
-            .all()
-        )
-    else:
-        assignments = []
+    assignments = readmodels.deadlines(_get_user_class_ids())
 
     return render_template(
         'deadlines.html',
@@ -93,46 +133,210 @@ def deadlines():
     )
 
 
+# ---------- LIVE UPDATES (SERVER-SENT EVENTS) ----------
+
+def _assignment_event(assignment):
+    """Everything an open timeline needs to draw an assignment card."""
+    return {
+        'id': assignment.id,
+        'title': assignment.title,
+        'due_date': assignment.due_date.isoformat(),
+        'class_id': assignment.class_id,
+        'class_name': assignment.clazz.name,
+        'class_url': url_for('main.class_detail', class_id=assignment.class_id),
+        'submit_url': url_for('main.submit_assignment', assignment_id=assignment.id),
+    }
+
+
+@bp.route('/events')
+@login_required
+def event_stream():
+    """Push assignment and submission updates for the user's classes."""
+    # class membership is resolved once per connection, not per event
+    subscription = broker.subscribe(current_user.id, _get_user_class_ids())
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if subscription is None:
+        # every stream slot in this worker is taken; the browser tries again later
+        return Response('retry: 30000\n\n', mimetype='text/event-stream', headers=headers)
+    heartbeat = broker.heartbeat_seconds
+    max_seconds = current_app.config['EVENTS_STREAM_SECONDS']
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            yield from subscription.messages(heartbeat, max_seconds)
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers=headers)
+
+
+# ---------- WORKLOAD HEATMAP ----------
+
+@bp.route('/workload')
+@login_required
+def workload_view():
+    """Heatmap of how many assignments are due per day across all classes."""
+    today = datetime.now().date()
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        start = today
+    start -= timedelta(days=start.weekday())  # weeks run Monday to Sunday
+
+    weeks = request.args.get('weeks', type=int) or current_app.config['WORKLOAD_WEEKS']
+    weeks = max(1, min(weeks, 52))
+
+    load = workload.get_workload(current_user.id, start, weeks)
+    return render_template(
+        'workload.html',
+        title='Workload',
+        load=load,
+        start=start,
+        weeks=weeks,
+        prev_start=start - timedelta(weeks=weeks),
+        next_start=start + timedelta(weeks=weeks),
+        today=today,
+    )
+
+
 # ---------- CLASSES ----------
 
-@deadline_app.route('/classes')
+@bp.route('/classes')
 @login_required
 def classes():
     """Show classes the user owns and is enrolled in."""
     owned_classes = Class.query.filter_by(owner_id=current_user.id).all()
-    enrolled_classes = current_user.classes.all()  # via backref
+    enrolled_classes = _enrolled_classes()
+    archived_classes = archive.archived_classes_for(current_user.id)
 
     return render_template(
         'classes.html',
         owned_classes=owned_classes,
         enrolled_classes=enrolled_classes,
+        archived_classes=archived_classes,
     )
 
 
-@deadline_app.route('/classes/new', methods=['GET', 'POST'])
+@bp.route('/classes/new', methods=['GET', 'POST'])
 @login_required
 def new_class():
     """Create a new class."""
     form = ClassForm()
     if form.validate_on_submit():
+        owner = _current_user_record()
         clazz = Class(
             name=form.name.data,
             description=form.description.data,
-            owner=current_user,
+            owner=owner,
         )
         # Owner is also a member of the class
-        clazz.members.append(current_user)
+        clazz.members.append(owner)
 
         db.session.add(clazz)
+        workload.invalidate_user(owner.id)
         db.session.commit()
         flash('Class created!')
-        return redirect(url_for('classes'))
+        return redirect(url_for('main.classes'))
 
     return render_template('class_form.html', form=form)
 
 
-@deadline_app.route('/classes/enroll', methods=['GET', 'POST'])
+def _clone_class(source, name, description, start_date=None, shift=None,
+                 copy_descriptions=True, copy_reminders=True):
+    """Create a copy of source owned by the current user, with all of its
+    assignments, in one transaction.
+
+    Due dates move by shift, or so the earliest one lands on start_date.
+    The assignments are read with one SELECT and written with one
+    executemany INSERT, so the cost does not grow with per-row round-trips.
+    """
+    rows = db.session.execute(
+        select(
+            Assignment.title,
+            Assignment.description,
+            Assignment.due_date,
+            Assignment.reminder_hours,
+        )
+        .where(Assignment.class_id == source.id)
+        .order_by(Assignment.due_date, Assignment.id)
+    ).all()
+
+    if start_date is not None and rows:
+        shift = start_date - rows[0].due_date
+    shift = shift or timedelta()
+
+    clazz = Class(name=name, description=description, owner_id=current_user.id)
+    db.session.add(clazz)
+    db.session.flush()
+
+    # Owner is also a member of the class
+    db.session.execute(
+        insert(class_memberships).values(user_id=current_user.id, class_id=clazz.id)
+    )
+
+    if rows:
+        now = datetime.utcnow()
+        db.session.execute(
+            insert(Assignment),
+            [
+                {
+                    'title': row.title,
+                    'description': row.description if copy_descriptions else None,
+                    'due_date': row.due_date + shift,
+                    'created_at': now,
+                    'reminder_hours': row.reminder_hours if copy_reminders else 24,
+                    'creator_id': current_user.id,
+                    'class_id': clazz.id,
+                }
+                for row in rows
+            ],
+        )
+
+    deadline_index.rebuild(class_id=clazz.id)
+    # the bulk insert bypasses the ORM events that normally do this
+    workload.invalidate_class(clazz.id)
+    workload.invalidate_user(current_user.id)
+    db.session.commit()
+    return clazz, len(rows)
+
+
+@bp.route('/classes/<int:class_id>/clone', methods=['GET', 'POST'])
+@login_required
+def clone_class(class_id):
+    """Start a new term of a class by copying its assignments."""
+    source = Class.query.get_or_404(class_id)
+
+    if current_user.id != source.owner_id:
+        abort(403)
+
+    form = CloneClassForm()
+    if request.method == 'GET':
+        form.name.data = f'{source.name} (copy)'
+        form.description.data = source.description
+
+    if form.validate_on_submit():
+        shift = None
+        if form.shift_days.data is not None:
+            shift = timedelta(days=form.shift_days.data)
+        clazz, copied = _clone_class(
+            source,
+            form.name.data,
+            form.description.data,
+            start_date=form.start_date.data,
+            shift=shift,
+            copy_descriptions=form.copy_descriptions.data,
+            copy_reminders=form.copy_reminders.data,
+        )
+        flash(f'Class cloned with {copied} assignments!')
+        return redirect(url_for('main.class_detail', class_id=clazz.id))
+
+    return render_template('clone_class_form.html', form=form, source=source)
+
+
+@bp.route('/classes/enroll', methods=['GET', 'POST'])
 @login_required
+@limiter.limit('enroll', ip='30/minute', username='10/minute', endpoint='600/minute')
 def enroll_in_class():
     """Enroll in an existing class"""
     form = EnrollClassForm()
@@ -141,55 +345,77 @@ def enroll_in_class():
         """check if the class code exists in the database at all"""
         if Class.query.filter_by(id=form.classCode.data).first() is None:
             flash('Invalid Class Code')
-            return redirect(url_for('enroll_in_class'))
+            return redirect(url_for('main.enroll_in_class'))
         """check if user is already a member of this class"""
 
         clazz = Class.query.get_or_404(form.classCode.data)
-        if current_user == clazz.owner or clazz.members.filter_by(id=current_user.id).first():
+        if current_user.id == clazz.owner_id or clazz.members.filter_by(id=current_user.id).first():
             flash('Already Enrolled')
-            return redirect(url_for('enroll_in_class'))
+            return redirect(url_for('main.enroll_in_class'))
         
-        clazz.members.append(current_user)
+        clazz.members.append(_current_user_record())
+        deadline_index.member_added(clazz.id, current_user.id)
+        workload.invalidate_user(current_user.id)
         db.session.commit()
         flash('Enrolled in Class!')
-        return redirect(url_for('classes'))
+        return redirect(url_for('main.classes'))
 
     return render_template('class_enroll_form.html', form=form, title="Classes")
 
 
 
-@deadline_app.route('/classes/<int:class_id>')
+@bp.route('/classes/<int:class_id>')
 @login_required
 def class_detail(class_id):
     """View a single class and its assignments."""
-    clazz = Class.query.get_or_404(class_id)
+    clazz, session, archived = _get_live_or_archived(Class, class_id)
 
     # Only owner or enrolled members can view
-    if current_user != clazz.owner and not clazz.members.filter_by(
+    if current_user.id != clazz.owner_id and not clazz.members.filter_by(
         id=current_user.id
     ).first():
         abort(403)
 
     assignments = (
-        Assignment.query
+        session.query(Assignment)
         .filter_by(class_id=clazz.id)
         .order_by(Assignment.due_date)
         .all()
     )
 
-    return render_template('class_detail.html', clazz=clazz, assignments=assignments)
+    audit.record('class.view', class_id=clazz.id)
+    return render_template(
+        'class_detail.html',
+        clazz=clazz,
+        assignments=assignments,
+        archived=archived,
+    )
+
+
+@bp.route('/classes/<int:class_id>/archive', methods=['POST'])
+@login_required
+def archive_class(class_id):
+    """Close a finished class by moving it into the term archive."""
+    clazz = Class.query.get_or_404(class_id)
+
+    if current_user.id != clazz.owner_id:
+        abort(403)
+
+    archive.archive_class(clazz.id)
+    flash('Class archived. It is now read-only.')
+    return redirect(url_for('main.class_detail', class_id=class_id))
 
 
 # ---------- ASSIGNMENTS (CREATE INSIDE CLASS, LIST ALL) ----------
 
-@deadline_app.route('/classes/<int:class_id>/assignments/new', methods=['GET', 'POST'])
+@bp.route('/classes/<int:class_id>/assignments/new', methods=['GET', 'POST'])
 @login_required
 def new_assignment(class_id):
     """Create a new assignment inside a specific class."""
     clazz = Class.query.get_or_404(class_id)
 
     # Only the class owner can create assignments
-    if current_user != clazz.owner:
+    if current_user.id != clazz.owner_id:
         abort(403)
 
     form = AssignmentForm()
@@ -199,31 +425,48 @@ def new_assignment(class_id):
             description=form.description.data,
             due_date=form.due_date.data,
             clazz=clazz,
-            creator=current_user,
+            creator_id=current_user.id,
         )
         db.session.add(assignment)
         db.session.commit()
+        broker.publish('assignment', clazz.id, _assignment_event(assignment))
         flash('Assignment created!')
-        return redirect(url_for('class_detail', class_id=clazz.id))
+        return redirect(url_for('main.class_detail', class_id=clazz.id))
 
-    return render_template('assignment_form.html', form=form, clazz=clazz)
+    return render_template(
+        'assignment_form.html',
+        form=form,
+        clazz=clazz,
+        window_hours=current_app.config['DEADLINE_CONFLICT_WINDOW_HOURS'],
+    )
 
 
-@deadline_app.route('/assignments')
+@bp.route('/classes/<int:class_id>/assignments/conflicts')
+@login_required
+def assignment_conflicts(class_id):
+    """How many students already have other deadlines near a proposed due date."""
+    clazz = Class.query.get_or_404(class_id)
+
+    if current_user.id != clazz.owner_id:
+        abort(403)
+
+    try:
+        due = datetime.strptime(request.args.get('due', ''), '%Y-%m-%d %H:%M')
+    except ValueError:
+        return jsonify(error='due must look like YYYY-MM-DD HH:MM'), 400
+    window = request.args.get(
+        'window', type=int, default=current_app.config['DEADLINE_CONFLICT_WINDOW_HOURS']
+    )
+    window = max(0, min(window, 24 * 14))
+
+    return jsonify(deadline_index.conflict_histogram(clazz, due, window))
+
+
+@bp.route('/assignments')
 @login_required
 def assignments():
     """List assignments in classes the current user belongs to."""
-    class_ids = _get_user_class_ids()
-
-    if class_ids:
-        assignments_list = (
-            Assignment.query
-            .filter(Assignment.class_id.in_(class_ids))
-            .order_by(Assignment.due_date)
-            .all()
-        )
-    else:
-        assignments_list = []
+    assignments_list = readmodels.assignment_list(_get_user_class_ids())
 
     return render_template(
         'assignments.html',
@@ -234,7 +477,7 @@ def assignments():
 
 # ---------- SUBMISSIONS (PER-STUDENT WORK) ----------
 
-@deadline_app.route('/assignments/<int:assignment_id>/submit', methods=['GET', 'POST'])
+@bp.route('/assignments/<int:assignment_id>/submit', methods=['GET', 'POST'])
 @login_required
 def submit_assignment(assignment_id):
     """Create or edit the current user's submission for an assignment."""
@@ -242,92 +485,422 @@ def submit_assignment(assignment_id):
     clazz = assignment.clazz
 
     # Must be in the class (or be the owner)
-    if current_user != clazz.owner and not clazz.members.filter_by(
+    if current_user.id != clazz.owner_id and not clazz.members.filter_by(
         id=current_user.id
     ).first():
         abort(403)
 
     form = SubmissionForm()
 
+    # A journaled submission that has not reached the table yet is newer.
+    # Look it up first: entries leave the journal only after they commit.
+    pending = journal.pending(assignment.id, current_user.id)
+
     # If they already submitted, load it so they can edit
-    submission = Submission.query.filter_by(
-        assignment_id=assignment.id,
-        student_id=current_user.id,
+    session = shards.submission_session(clazz.id)
+    submission = session.scalars(
+        select(Submission).filter_by(assignment_id=assignment.id, student_id=current_user.id)
     ).first()
 
     if form.validate_on_submit():
-        if submission is None:
-            submission = Submission(
-                assignment=assignment,
-                student=current_user,
-            )
-            db.session.add(submission)
-
-        submission.content = form.content.data
-        submission.submitted_at = datetime.utcnow()
-        db.session.commit()
+        edited = pending is not None or (submission is not None and submission.submitted_at is not None)
+        if journal.enabled:
+            # durable once journaled; the background writer upserts it
+            submitted_at = journal.append(
+                assignment.id, current_user.id, form.content.data
+            ).submitted_at
+        else:
+            session = shards.writable_session(clazz.id)
+            if submission is None:
+                submission = Submission(
+                    assignment_id=assignment.id,
+                    student_id=current_user.id,
+                )
+                session.add(submission)
+
+            submission.content = form.content.data
+            submission.submitted_at = submitted_at = datetime.utcnow()
+            session.commit()
+        audit.record(
+            'submission.edit' if edited else 'submission.create',
+            class_id=clazz.id,
+            assignment_id=assignment.id,
+            detail=f'{len(form.content.data or "")} characters, submitted_at {submitted_at.isoformat()}',
+        )
+        broker.publish(
+            'submission',
+            clazz.id,
+            {
+                'assignment_id': assignment.id,
+                'student_id': current_user.id,
+                'username': current_user.username,
+                'submitted_at': submitted_at.isoformat(),
+            },
+            user_ids={current_user.id, clazz.owner_id},
+        )
         flash('Your work has been submitted.')
-        return redirect(url_for('class_detail', class_id=clazz.id))
+        return redirect(url_for('main.class_detail', class_id=clazz.id))
 
     # Pre-fill with existing content if any
-    if request.method == 'GET' and submission:
+    if request.method == 'GET':
+        audit.record('assignment.view', class_id=clazz.id, assignment_id=assignment.id)
+    if request.method == 'GET' and pending:
+        form.content.data = pending.content
+    elif request.method == 'GET' and submission:
         form.content.data = submission.content
 
-    return render_template('submit_assignment.html', form=form, assignment=assignment)
+    return render_template(
+        'submit_assignment.html',
+        form=form,
+        assignment=assignment,
+        submission=submission,
+    )
 
 
-@deadline_app.route('/assignments/<int:assignment_id>/submissions')
+@bp.route('/assignments/<int:assignment_id>/submissions')
 @login_required
 def view_submissions(assignment_id):
     """Teacher view of all submissions for an assignment."""
-    assignment = Assignment.query.get_or_404(assignment_id)
+    assignment, session, archived = _get_live_or_archived(Assignment, assignment_id)
     clazz = assignment.clazz
 
-    if current_user != clazz.owner:
+    if current_user.id != clazz.owner_id:
         abort(403)
 
-    submissions = Submission.query.filter_by(assignment_id=assignment.id).all()
+    if not archived and shards.enabled:
+        submissions = readmodels.shard_submissions(
+            assignment.id, shards.submission_session(clazz.id)
+        )
+    else:
+        submissions = readmodels.submissions(assignment.id, session)
+    audit.record('submissions.view', class_id=clazz.id, assignment_id=assignment.id)
     return render_template(
         'submissions.html',
         assignment=assignment,
         submissions=submissions,
+        archived=archived,
+    )
+
+
+# ---------- MISSING WORK (WHO HAS NOT SUBMITTED) ----------
+
+def _missing_submissions(clazz, assignment_id=None):
+    """Return (student_id, username, assignment_id, title, due_date) rows for
+    every enrolled student without a submission, in a single anti-join.
+
+    Members are paired with the class's assignments and left-joined against
+    submission on the (assignment_id, student_id) unique index; rows where no
+    handed-in submission matched are the missing ones (a grade entered for
+    work never handed in does not count). The class owner is excluded.
+    With sharded submissions the join cannot cross files, so the handed-in
+    pairs are read from the class's shard and filtered out here instead.
+    """
+    members = class_memberships.c
+    query = (
+        select(
+            User.id,
+            User.username,
+            Assignment.id,
+            Assignment.title,
+            Assignment.due_date,
+        )
+        .select_from(class_memberships)
+        .join(User, User.id == members.user_id)
+        .join(Assignment, Assignment.class_id == members.class_id)
+        .where(
+            members.class_id == clazz.id,
+            members.user_id != clazz.owner_id,
+        )
+        .order_by(User.username, Assignment.due_date, Assignment.id)
+    )
+    if assignment_id is not None:
+        query = query.where(Assignment.id == assignment_id)
+
+    if shards.enabled:
+        if assignment_id is None:
+            assignment_ids = db.session.scalars(
+                select(Assignment.id).where(Assignment.class_id == clazz.id)
+            ).all()
+        else:
+            assignment_ids = [assignment_id]
+        handed_in = set(map(tuple, shards.submission_session(clazz.id).execute(
+            select(Submission.student_id, Submission.assignment_id).where(
+                Submission.assignment_id.in_(assignment_ids),
+                Submission.submitted_at.is_not(None),
+            )
+        )))
+        return [row for row in db.session.execute(query) if (row[0], row[2]) not in handed_in]
+
+    query = query.outerjoin(
+        Submission,
+        and_(
+            Submission.assignment_id == Assignment.id,
+            Submission.student_id == members.user_id,
+            Submission.submitted_at.is_not(None),
+        ),
+    ).where(Submission.id.is_(None))
+    return db.session.execute(query).all()
+
+
+def _missing_matrix(rows):
+    """Fold anti-join rows into a student x assignment matrix.
+
+    Returns (students, assignments, missing) where students and assignments
+    are ordered lists of (id, label) tuples and missing is a set of
+    (student_id, assignment_id) pairs.
+    """
+    students = {}
+    assignments_by_id = {}
+    missing = set()
+    for student_id, username, a_id, title, due_date in rows:
+        students.setdefault(student_id, username)
+        assignments_by_id.setdefault(a_id, (title, due_date))
+        missing.add((student_id, a_id))
+
+    assignment_cols = sorted(
+        assignments_by_id.items(), key=lambda item: (item[1][1], item[0])
+    )
+    return list(students.items()), assignment_cols, missing
+
+
+def _missing_csv(rows, filename):
+    """Stream the anti-join rows as a CSV download."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['student_id', 'username', 'assignment_id', 'assignment', 'due_date'])
+    for student_id, username, a_id, title, due_date in rows:
+        writer.writerow([student_id, username, a_id, title, due_date.isoformat(sep=' ')])
+
+    return Response(
+        out.getvalue(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
     )
 
 
+@bp.route('/classes/<int:class_id>/missing')
+@login_required
+def class_missing(class_id):
+    """Teacher view of every student x assignment pair with no submission."""
+    clazz = Class.query.get_or_404(class_id)
+
+    if current_user.id != clazz.owner_id:
+        abort(403)
+
+    rows = _missing_submissions(clazz)
+    if request.args.get('format') == 'csv':
+        return _missing_csv(rows, f'class-{clazz.id}-missing.csv')
+
+    students, assignment_cols, missing = _missing_matrix(rows)
+    return render_template(
+        'missing.html',
+        title='Missing Work',
+        clazz=clazz,
+        assignment=None,
+        students=students,
+        assignment_cols=assignment_cols,
+        missing=missing,
+    )
+
+
+@bp.route('/assignments/<int:assignment_id>/missing')
+@login_required
+def assignment_missing(assignment_id):
+    """Teacher view of enrolled students who have not submitted an assignment."""
+    assignment = Assignment.query.get_or_404(assignment_id)
+    clazz = assignment.clazz
+
+    if current_user.id != clazz.owner_id:
+        abort(403)
+
+    rows = _missing_submissions(clazz, assignment_id=assignment.id)
+    if request.args.get('format') == 'csv':
+        return _missing_csv(rows, f'assignment-{assignment.id}-missing.csv')
+
+    students, assignment_cols, missing = _missing_matrix(rows)
+    return render_template(
+        'missing.html',
+        title='Missing Work',
+        clazz=clazz,
+        assignment=assignment,
+        students=students,
+        assignment_cols=assignment_cols,
+        missing=missing,
+    )
+
+
+# ---------- GRADEBOOK ----------
+
+def _grid_edits(form):
+    """Edits from the gradebook grid's grade-<student>-<assignment> and
+    feedback-<student>-<assignment> fields."""
+    edits = {}
+    for name, value in form.items():
+        kind, _, key = name.partition('-')
+        if kind not in ('grade', 'feedback'):
+            continue
+        student_id, _, assignment_id = key.partition('-')
+        if not (student_id.isdigit() and assignment_id.isdigit()):
+            continue
+        cell = (int(student_id), int(assignment_id))
+        edit = edits.setdefault(cell, {'student_id': cell[0], 'assignment_id': cell[1]})
+        edit[kind] = value
+    return list(edits.values())
+
+
+def _flash_grade_result(result):
+    flash(f'Saved {result.updated + result.created} grades.')
+    for row, reason in result.errors[:10]:
+        flash(f'Row {row}: {reason}')
+    if len(result.errors) > 10:
+        flash(f'... and {len(result.errors) - 10} more problems.')
+
+
+def _audit_grades(clazz, result, source=None):
+    detail = f'{result.updated} updated, {result.created} created'
+    if source:
+        detail += f' from {source}'
+    audit.record('grades.update', class_id=clazz.id, detail=detail)
+
+
+@bp.route('/classes/<int:class_id>/gradebook', methods=['GET', 'POST'])
+@login_required
+def class_gradebook(class_id):
+    """Teacher grid of grades; the whole grid is saved in one POST.
+
+    JSON clients can POST {"grades": [{"student_id", "assignment_id",
+    "grade", "feedback"}, ...]} instead and get the result back as JSON.
+    """
+    clazz = Class.query.get_or_404(class_id)
+
+    if current_user.id != clazz.owner_id:
+        abort(403)
+    book = gradebook.load_gradebook(clazz)
+
+    if request.method == 'POST':
+        if request.is_json:
+            edits = (request.get_json(silent=True) or {}).get('grades')
+            if not isinstance(edits, list) or not all(isinstance(e, dict) for e in edits):
+                return jsonify(error='expected {"grades": [...]}'), 400
+            result = gradebook.apply_grades(clazz, edits, book)
+            _audit_grades(clazz, result)
+            return jsonify(result.as_dict())
+
+        result = gradebook.apply_grades(clazz, _grid_edits(request.form), book)
+        _audit_grades(clazz, result)
+        _flash_grade_result(result)
+        return redirect(url_for('main.class_gradebook', class_id=clazz.id))
+
+    if request.args.get('format') == 'csv':
+        return Response(
+            gradebook.export_csv(book),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=class-{clazz.id}-grades.csv'},
+        )
+
+    return render_template('gradebook.html', title='Gradebook', clazz=clazz, book=book)
+
+
+@bp.route('/classes/<int:class_id>/gradebook/upload', methods=['POST'])
+@login_required
+def upload_grades(class_id):
+    """Apply a CSV of grades, in the same shape as the gradebook export."""
+    clazz = Class.query.get_or_404(class_id)
+
+    if current_user.id != clazz.owner_id:
+        abort(403)
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        flash('Choose a CSV file to upload.')
+        return redirect(url_for('main.class_gradebook', class_id=clazz.id))
+
+    book = gradebook.load_gradebook(clazz)
+    try:
+        edits = gradebook.parse_grade_csv(upload.read().decode('utf-8-sig'), book)
+    except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+        flash(f'Could not read {upload.filename}: {exc}')
+        return redirect(url_for('main.class_gradebook', class_id=clazz.id))
+
+    result = gradebook.apply_grades(clazz, edits, book)
+    _audit_grades(clazz, result, source=upload.filename)
+    _flash_grade_result(result)
+    return redirect(url_for('main.class_gradebook', class_id=clazz.id))
+
+
+# ---------- BULK ACCOUNT PROVISIONING ----------
+
+@bp.route('/admin/users/provision', methods=['POST'])
+@login_required
+def provision_accounts():
+    """Create a small batch of accounts from an uploaded CSV/JSON file or body.
+
+    CSRF-protected like every form post (API clients send X-CSRFToken);
+    big exports are refused in favour of `flask users provision`.
+    """
+    if not provisioning.is_admin(current_user):
+        abort(403)
+
+    upload = request.files.get('file')
+    if upload is not None:
+        text = upload.read().decode('utf-8-sig')
+        fmt = 'json' if upload.filename.endswith('.json') else 'csv'
+    else:
+        text = request.get_data(as_text=True)
+        fmt = 'json' if request.is_json else 'csv'
+
+    try:
+        rows = provisioning.parse_users(text, fmt)
+    except (ValueError, csv.Error) as exc:
+        return jsonify(error=f'Could not read users: {exc}'), 400
+
+    limit = current_app.config['PROVISIONING_MAX_ROWS']
+    if len(rows) > limit:
+        return jsonify(
+            error=f'{len(rows)} users is more than {limit} per request; '
+                  'use `flask users provision` for large batches.'
+        ), 413
+
+    # hashing stays in this thread: no process pool inside a web worker
+    result = provisioning.provision_users(rows, workers=1)
+    return jsonify(result.as_dict())
+
+
 # ---------- AUTH ROUTES ----------
 
-@deadline_app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
+@limiter.limit('login', ip='20/minute', username='10/minute', endpoint='600/minute')
 def login():
     """Login page with form + logic."""
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         if user is None or not user.check_password(form.password.data):
             flash('Invalid username or password')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get('next')
-        return redirect(next_page or url_for('home'))
+        return redirect(next_page or url_for('main.home'))
 
     return render_template('login.html', title='Sign In', form=form)
 
 
-@deadline_app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     """Log the user out."""
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 
-@deadline_app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
+@limiter.limit('register', ip='10/hour', endpoint='300/minute')
 def register():
     """User registration."""
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
 
     form = RegistrationForm()
     if form.validate_on_submit():
@@ -339,6 +912,6 @@ def register():
         db.session.add(user)
         db.session.commit()
         flash('Congratulations, you are now a registered user!')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('register.html', title='Register', form=form)
@@ -0,0 +1,158 @@
+"""
+Database schema setup and upgrades.
+
+Creating and reflecting the schema is no longer done on every boot. The
+schema version is stored in SQLite's PRAGMA user_version, so startup only
+reads one integer; when it is behind SCHEMA_VERSION the database is
+upgraded (create missing tables, add missing columns and indexes) with
+`flask init-db`, which deployments run before starting the workers. Boot
+refuses to serve an outdated database instead of running DDL from every
+worker at once, unless DB_AUTO_UPGRADE is turned on (handy for local use).
+"""
+
+import logging
+import os
+import sys
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.schema import CreateTable
+
+from app import db
+
+
+# bump whenever models.py changes the schema
+SCHEMA_VERSION = 6
+
+log = logging.getLogger(__name__)
+
+
+def schema_version(connection):
+    return connection.execute(text('PRAGMA user_version')).scalar()
+
+
+def _add_missing_columns(connection):
+    """ALTER TABLE ... ADD COLUMN for model columns an older file lacks."""
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = (
+                f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" '
+                f'{column.type.compile(dialect=connection.dialect)}'
+            )
+            if column.default is not None and column.default.is_scalar:
+                default = literal(column.default.arg).compile(
+                    dialect=connection.dialect,
+                    compile_kwargs={'literal_binds': True},
+                )
+                ddl += f' DEFAULT {default}'
+            connection.execute(text(ddl))
+
+
+def _backfill_deadline_load(connection):
+    from app import deadline_index
+    deadline_index.rebuild(connection)
+
+
+def _use_autoincrement(connection):
+    """Rebuild tables that became AUTOINCREMENT so freed ids are not reused.
+
+    SQLite cannot ALTER a table into AUTOINCREMENT: create the new table
+    under a temporary name, copy the rows (which also seeds sqlite_sequence),
+    drop the old one and rename. Renaming the new table leaves other
+    tables' foreign keys pointing at the original name.
+    """
+    for table in db.metadata.sorted_tables:
+        if not table.dialect_options['sqlite']['autoincrement']:
+            continue
+        ddl = connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': table.name},
+        ).scalar()
+        if ddl is None or 'AUTOINCREMENT' in ddl.upper():
+            continue
+        rebuilt = f'{table.name}_rebuilt'
+        create = str(CreateTable(table).compile(dialect=connection.dialect))
+        prefix = f'CREATE TABLE {connection.dialect.identifier_preparer.format_table(table)}'
+        connection.execute(text(create.replace(prefix, f'CREATE TABLE "{rebuilt}"', 1)))
+        columns = ', '.join(f'"{c.name}"' for c in table.columns)
+        connection.execute(text(
+            f'INSERT INTO "{rebuilt}" ({columns}) SELECT {columns} FROM "{table.name}"'
+        ))
+        connection.execute(text(f'DROP TABLE "{table.name}"'))
+        connection.execute(text(f'ALTER TABLE "{rebuilt}" RENAME TO "{table.name}"'))
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+# (version, step): data to fill in once when upgrading from below version
+DATA_MIGRATIONS = [
+    (2, _backfill_deadline_load),
+    (5, _use_autoincrement),
+]
+
+
+def upgrade(engine):
+    """Bring the database behind engine up to SCHEMA_VERSION."""
+    with engine.begin() as connection:
+        before = schema_version(connection)
+        db.metadata.create_all(connection)
+        _add_missing_columns(connection)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        for version, step in DATA_MIGRATIONS:
+            if before < version:
+                step(connection)
+        connection.execute(text(f'PRAGMA user_version = {SCHEMA_VERSION}'))
+
+
+def init_db():
+    upgrade(db.engine)
+
+
+def _running_init_db():
+    # `flask init-db` loads the app before running, so boot must let it
+    # through; every other flask command (run included) is refused
+    return os.environ.get('FLASK_RUN_FROM_CLI') == 'true' and 'init-db' in sys.argv[1:]
+
+
+def check_schema(app):
+    """Cheap boot-time check; upgrades or refuses to start when behind."""
+    with db.engine.connect() as connection:
+        version = schema_version(connection)
+    if version == SCHEMA_VERSION:
+        return
+
+    if version > SCHEMA_VERSION or not app.config['DB_AUTO_UPGRADE']:
+        message = (
+            f'Database schema is at version {version}, expected {SCHEMA_VERSION}. '
+            'Run `flask init-db` to upgrade it.'
+        )
+        if _running_init_db():
+            log.warning(message)
+            return
+        raise RuntimeError(message)
+    log.warning('Upgrading database schema from version %s to %s', version, SCHEMA_VERSION)
+    init_db()
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create or upgrade the database schema."""
+    with db.engine.connect() as connection:
+        before = schema_version(connection)
+    init_db()
+    click.echo(f'Database schema at version {SCHEMA_VERSION} (was {before}).')
+
+
+def init_app(app):
+    app.config.setdefault('DB_AUTO_UPGRADE', False)
+    app.cli.add_command(init_db_command)
@@ -0,0 +1,118 @@
+"""
+Production serving for the deadline application.
+
+Runs the app under gunicorn: a master process that preloads the app, forks
+SERVER_WORKERS worker processes with SERVER_THREADS threads each, recycles
+workers after SERVER_MAX_REQUESTS requests and restarts them gracefully on
+SIGHUP. Everything is configured through environment variables so it can be
+driven from runserver.py, a service unit or a container.
+
+Under the default gthread workers every open /events stream holds one of a
+worker's SERVER_THREADS threads, so streams are capped at half of them per
+worker (SERVER_MAX_STREAMS) and ended every EVENTS_STREAM_SECONDS, which
+also lets max_requests recycling finish. With SERVER_WORKER_CLASS=gevent
+streams are cheap and are not capped. Behind a reverse proxy, set
+SERVER_PROXY_HOPS to the number of proxies so rate limits and the audit log
+use the client address from X-Forwarded-*; the default 0 ignores those
+headers, since clients connecting directly could otherwise fake them.
+"""
+
+import multiprocessing
+from os import environ
+
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from app import db, archive
+from app.audit import audit
+from app.events import broker
+from app.journal import journal
+from app.sharding import shards
+
+
+def _env_int(name, default):
+    try:
+        return int(environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_bool(name, default):
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def production_options():
+    """gunicorn settings built from SERVER_* environment variables."""
+    host = environ.get('SERVER_HOST', '0.0.0.0')
+    port = _env_int('SERVER_PORT', 5555)
+    return {
+        'bind': f'{host}:{port}',
+        'workers': _env_int('SERVER_WORKERS', multiprocessing.cpu_count() * 2 + 1),
+        'threads': _env_int('SERVER_THREADS', 4),
+        'worker_class': environ.get('SERVER_WORKER_CLASS', 'gthread'),
+        'preload_app': _env_bool('SERVER_PRELOAD', True),
+        'max_requests': _env_int('SERVER_MAX_REQUESTS', 1000),
+        'max_requests_jitter': _env_int('SERVER_MAX_REQUESTS_JITTER', 100),
+        'timeout': _env_int('SERVER_TIMEOUT', 30),
+        'graceful_timeout': _env_int('SERVER_GRACEFUL_TIMEOUT', 30),
+        'keepalive': _env_int('SERVER_KEEPALIVE', 5),
+        'accesslog': environ.get('SERVER_ACCESS_LOG', '-'),
+        'loglevel': environ.get('SERVER_LOG_LEVEL', 'info'),
+    }
+
+
+def configure_app(app, options):
+    """App settings that depend on how it is served."""
+    if options['worker_class'] == 'gthread':
+        default_streams = max(1, options['threads'] // 2)
+        app.config['EVENTS_MAX_STREAMS'] = _env_int('SERVER_MAX_STREAMS', default_streams)
+    hops = _env_int('SERVER_PROXY_HOPS', 0)
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+
+def reset_after_fork(app):
+    """Drop state a forked worker must not share with its parent.
+
+    SQLite handles opened in the master (e.g. while preloading) are
+    discarded without closing them, so the parent's connections are left
+    untouched and the worker opens its own on first use; the same goes for
+    the archive and submission shard files. Background threads do not
+    survive fork, so the event broker, the submission journal and the audit
+    log writer are restarted lazily too.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    archive.dispose_engines(close=False)
+    shards.dispose(close=False)
+    broker.reset()
+    journal.reset()
+    audit.reset()
+
+
+def serve(app):
+    """Run app under gunicorn until it is told to stop."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError as exc:
+        raise SystemExit(
+            'SERVER_MODE=production needs gunicorn: pip install gunicorn'
+        ) from exc
+
+    options = production_options()
+    configure_app(app, options)
+
+    class DeadlineServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+            self.cfg.set('post_fork', lambda server, worker: reset_after_fork(app))
+
+        def load(self):
+            return app
+
+    DeadlineServer().run()
+
@@ -0,0 +1,430 @@
+"""
+Optional sharding of submissions across several SQLite files, one per class.
+
+The class_shard table maps classes to shards; moving classes between shards
+needs the maintenance lock (`flask shards lock`).
+"""
+
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import g
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, create_engine, event, func, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from werkzeug.exceptions import ServiceUnavailable
+
+from app import db
+from app.cache import TTLCache
+from app.models import Assignment, ClassShard, Submission
+
+
+class ShardError(Exception):
+    """Raised when submissions cannot be routed or moved."""
+
+
+def stable_shard(class_id, count):
+    """Initial shard of a class; the same in every process and release."""
+    return zlib.crc32(str(class_id).encode()) % count
+
+
+def _pragmas(dbapi_connection, connection_record):
+    dbapi_connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    dbapi_connection.execute('PRAGMA journal_mode=WAL')
+    dbapi_connection.execute('PRAGMA busy_timeout=5000')
+
+
+class ShardRouter:
+    """Maps classes to shard files and hands out sessions on them."""
+
+    def __init__(self):
+        self._engines = {}
+        self._map = TTLCache(maxsize=65536, ttl=30)
+        self._config = None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('SUBMISSION_SHARDS', 0)
+        app.config.setdefault(
+            'SUBMISSION_SHARD_DIR', os.path.join(app.instance_path, 'shards')
+        )
+        app.config.setdefault('SUBMISSION_SHARD_MAP_TTL', 30)
+        app.config.setdefault('SUBMISSION_SHARD_WORKERS', None)
+        app.extensions['shards'] = self
+        self._config = app.config
+        self._map.configure(ttl=app.config['SUBMISSION_SHARD_MAP_TTL'])
+        app.teardown_appcontext(self._close_sessions)
+        app.cli.add_command(shards_cli)
+
+    @property
+    def count(self):
+        return self._config['SUBMISSION_SHARDS'] if self._config else 0
+
+    @property
+    def enabled(self):
+        return self.count > 0
+
+    # ----- files and engines -----
+
+    def path(self, shard):
+        return os.path.join(self._config['SUBMISSION_SHARD_DIR'], f'submissions-{shard}.db')
+
+    def engine(self, shard):
+        if not 0 <= shard < self.count:
+            raise ShardError(f'No shard {shard}; SUBMISSION_SHARDS is {self.count}.')
+        path = self.path(shard)
+        engine = self._engines.get(path)
+        if engine is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            engine = create_engine('sqlite:///' + path)
+            event.listen(engine, 'connect', _pragmas)
+            Submission.__table__.create(engine, checkfirst=True)
+            self._engines[path] = engine
+        return engine
+
+    @property
+    def lock_path(self):
+        return os.path.join(self._config['SUBMISSION_SHARD_DIR'], 'maintenance.lock')
+
+    def dispose(self, close=True):
+        """Forget pooled shard connections and threads (close=False after fork)."""
+        for engine in self._engines.values():
+            engine.dispose(close=close)
+        self._map.clear()
+        with self._pool_lock:
+            # a forked child has none of the parent's pool threads
+            if self._pool is not None and close:
+                self._pool.shutdown(wait=False)
+            self._pool = None
+
+    # ----- routing -----
+
+    def shard_for(self, class_id):
+        shard = self._map.get(class_id)
+        if shard is not None:
+            return shard
+        placed = select(ClassShard.shard).where(ClassShard.class_id == class_id)
+        with db.session.no_autoflush:
+            shard = db.session.scalar(placed)
+        if shard is None:
+            # the first request to route a class places it for good, in its
+            # own transaction so whatever the caller has pending stays pending
+            with db.engine.begin() as connection:
+                connection.execute(
+                    insert(ClassShard)
+                    .values(class_id=class_id, shard=stable_shard(class_id, self.count))
+                    .on_conflict_do_nothing()
+                )
+                shard = connection.scalar(placed)
+        self._map.set(class_id, shard)
+        return shard
+
+    def session(self, shard):
+        """Session on one shard, closed at the end of the app context."""
+        sessions = g.setdefault('shard_sessions', {})
+        if shard not in sessions:
+            sessions[shard] = Session(self.engine(shard))
+        return sessions[shard]
+
+    def submission_session(self, class_id):
+        """Where the class's submissions live: db.session when not sharded."""
+        if not self.enabled:
+            return db.session
+        return self.session(self.shard_for(class_id))
+
+    def writable_session(self, class_id):
+        """submission_session for writes; 503 while shards are being moved."""
+        if self.locked:
+            raise ServiceUnavailable(
+                'Submissions are paused for a few minutes of maintenance.',
+                retry_after=60,
+            )
+        return self.submission_session(class_id)
+
+    def _close_sessions(self, exc=None):
+        for session in g.pop('shard_sessions', {}).values():
+            session.close()
+
+    def fan_out(self, query, shard_ids=None):
+        """Run query(connection) on shards in parallel; list of results.
+
+        shard_ids defaults to every shard. Only for queries that span
+        classes; one class's rows are all on its own shard.
+        """
+        def run(shard):
+            with self.engine(shard).connect() as connection:
+                return query(connection)
+
+        shard_ids = range(self.count) if shard_ids is None else sorted(shard_ids)
+        if len(shard_ids) <= 1:
+            return [run(shard) for shard in shard_ids]
+        return list(self._executor().map(run, shard_ids))
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                workers = self._config['SUBMISSION_SHARD_WORKERS'] or self.count
+                self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shards')
+            return self._pool
+
+    def partition(self, records):
+        """[(engine, records)] grouping submission records by their shard."""
+        if not self.enabled:
+            return [(db.engine, records)]
+        if self.locked:
+            raise ShardError('Shards are locked for maintenance.')
+        class_of = dict(db.session.execute(
+            select(Assignment.id, Assignment.class_id)
+            .where(Assignment.id.in_({record.assignment_id for record in records}))
+        ).all())
+        groups = {}
+        for record in records:
+            class_id = class_of.get(record.assignment_id)
+            # an assignment archived meanwhile: app.db, like before sharding
+            shard = None if class_id is None else self.shard_for(class_id)
+            groups.setdefault(shard, []).append(record)
+        return [
+            (db.engine if shard is None else self.engine(shard), group)
+            for shard, group in groups.items()
+        ]
+
+    # ----- maintenance lock -----
+
+    @property
+    def locked(self):
+        return self.enabled and os.path.exists(self.lock_path)
+
+    def lock(self):
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        with open(self.lock_path, 'a'):
+            pass
+
+    def unlock_wait(self):
+        """Seconds until no worker can still cache a map from before the last move."""
+        moved_at = os.path.getmtime(self.lock_path)
+        return max(0.0, moved_at + self._config['SUBMISSION_SHARD_MAP_TTL'] - time.time())
+
+    def unlock(self):
+        os.remove(self.lock_path)
+
+    # ----- moving classes -----
+
+    def move_class(self, class_id, src, dst):
+        """Move a class's submissions between shards (None: app.db).
+
+        Runs on a connection to one of the shard files with the other file
+        ATTACHed, with the copy and the delete in one transaction. That rolls
+        back as a whole on errors, but SQLite does not make a commit across
+        WAL-mode files atomic on a crash: the rows can end up in both files
+        (moving again cleans that up, INSERT OR REPLACE keeps one copy) or,
+        at worst, in neither, so back up before a rebalance. Moves between
+        two shards need the maintenance lock. Rows get new ids at the
+        destination; ids are only unique within a file.
+        """
+        if src == dst:
+            return 0
+        between_shards = src is not None and dst is not None
+        if between_shards and not self.locked:
+            raise ShardError('Run `flask shards lock` before moving classes between shards.')
+        assignment_ids = list(db.session.scalars(
+            select(Assignment.id).where(Assignment.class_id == class_id)
+        ))
+        moved = 0
+        if assignment_ids:
+            # app.db is always the attached side, so its pool stays untouched
+            local, other = (src, dst) if src is not None else (dst, src)
+            if other is not None:
+                self.engine(other)  # creates the file and its table
+            path = db.engine.url.database if other is None else self.path(other)
+            schemas = {local: 'main', other: 'other'}
+            columns = ', '.join(
+                f'"{c.name}"' for c in Submission.__table__.columns if c.name != 'id'
+            )
+            where = 'assignment_id IN :ids'
+            params = {'ids': assignment_ids}
+            with self.engine(local).connect() as connection:
+                # ATTACH is not allowed inside a transaction
+                connection.execute(text('ATTACH DATABASE :path AS other'), {'path': path})
+                connection.commit()
+                try:
+                    with connection.begin():
+                        moved = connection.execute(
+                            text(
+                                f'INSERT OR REPLACE INTO {schemas[dst]}.submission ({columns}) '
+                                f'SELECT {columns} FROM {schemas[src]}.submission WHERE {where}'
+                            ).bindparams(bindparam('ids', expanding=True)),
+                            params,
+                        ).rowcount
+                        connection.execute(
+                            text(f'DELETE FROM {schemas[src]}.submission WHERE {where}')
+                            .bindparams(bindparam('ids', expanding=True)),
+                            params,
+                        )
+                finally:
+                    connection.execute(text('DETACH DATABASE other'))
+                    connection.commit()
+
+        if dst is None:
+            db.session.execute(ClassShard.__table__.delete().where(ClassShard.class_id == class_id))
+            self._map.pop(class_id)
+        else:
+            stmt = insert(ClassShard).values(class_id=class_id, shard=dst)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['class_id'], set_={'shard': dst}
+            ))
+            self._map.set(class_id, dst)
+        db.session.commit()
+        if between_shards:
+            # unlock waits out the map TTL from here
+            os.utime(self.lock_path)
+        return moved
+
+    def collect(self, class_id):
+        """Bring a class's submissions back into app.db (before archiving)."""
+        if not self.enabled:
+            return 0
+        return self.move_class(class_id, self.shard_for(class_id), None)
+
+    def distribute(self, class_id):
+        """Send a class's submissions from app.db to its shard (after restoring)."""
+        if not self.enabled:
+            return 0
+        return self.move_class(class_id, None, self.shard_for(class_id))
+
+    # ----- reporting and rebalancing -----
+
+    def class_counts(self):
+        """[{class_id: submissions}] per shard."""
+        per_shard = self.fan_out(lambda connection: connection.execute(
+            select(Submission.assignment_id, func.count()).group_by(Submission.assignment_id)
+        ).all())
+        class_of = dict(db.session.execute(select(Assignment.id, Assignment.class_id)).all())
+        result = []
+        for rows in per_shard:
+            counts = {}
+            for assignment_id, count in rows:
+                class_id = class_of.get(assignment_id)
+                counts[class_id] = counts.get(class_id, 0) + count
+            result.append(counts)
+        return result
+
+
+def plan_rebalance(class_counts):
+    """Greedy moves [(class_id, src, dst, rows)] that even out shard sizes.
+
+    Repeatedly moves the largest class that still fits from the fullest
+    shard to the emptiest one, as long as that narrows the gap.
+    """
+    classes = [dict(counts) for counts in class_counts]
+    totals = [sum(counts.values()) for counts in classes]
+    moves = []
+    while True:
+        src = max(range(len(totals)), key=totals.__getitem__)
+        dst = min(range(len(totals)), key=totals.__getitem__)
+        gap = totals[src] - totals[dst]
+        candidates = [
+            (rows, class_id) for class_id, rows in classes[src].items()
+            if class_id is not None and 0 < rows < gap
+        ]
+        if not candidates:
+            return moves
+        rows, class_id = max(candidates)
+        del classes[src][class_id]
+        classes[dst][class_id] = rows
+        totals[src] -= rows
+        totals[dst] += rows
+        moves.append((class_id, src, dst, rows))
+
+
+shards = ShardRouter()
+
+
+shards_cli = AppGroup('shards', help='Inspect and rebalance submission shards.')
+
+
+def _require_shards():
+    if not shards.enabled:
+        raise click.ClickException('Sharding is off; set SUBMISSION_SHARDS first.')
+
+
+@shards_cli.command('status')
+def status_command():
+    """Submissions and classes per shard."""
+    _require_shards()
+    for shard, counts in enumerate(shards.class_counts()):
+        path = shards.path(shard)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        click.echo(
+            f'shard {shard}: {sum(counts.values())} submissions, {len(counts)} classes, '
+            f'{size} bytes ({path})'
+        )
+
+
+@shards_cli.command('move')
+@click.argument('class_id', type=int)
+@click.argument('shard', type=int)
+def move_command(class_id, shard):
+    """Move CLASS_ID's submissions to SHARD."""
+    _require_shards()
+    try:
+        moved = shards.move_class(class_id, shards.shard_for(class_id), shard)
+    except ShardError as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f'Moved {moved} submissions of class {class_id} to shard {shard}.')
+
+
+@shards_cli.command('rebalance')
+@click.option('--dry-run', is_flag=True, help='Only print the planned moves.')
+def rebalance_command(dry_run):
+    """Move classes so every shard holds about the same number of submissions."""
+    _require_shards()
+    if not dry_run and not shards.locked:
+        raise click.ClickException('Run `flask shards lock` before rebalancing.')
+    moves = plan_rebalance(shards.class_counts())
+    if not moves:
+        click.echo('Shards are balanced.')
+    for class_id, src, dst, rows in moves:
+        click.echo(f'class {class_id}: shard {src} -> {dst} ({rows} submissions)')
+        if not dry_run:
+            shards.move_class(class_id, src, dst)
+
+
+@shards_cli.command('lock')
+def lock_command():
+    """Pause submission writes so classes can be moved between shards."""
+    _require_shards()
+    shards.lock()
+    click.echo(f'Shards locked ({shards.lock_path}); submissions get 503 until unlock.')
+
+
+@shards_cli.command('unlock')
+def unlock_command():
+    """Resume writes once no worker can still route to a class's old shard."""
+    _require_shards()
+    if not shards.locked:
+        raise click.ClickException('Shards are not locked.')
+    wait = shards.unlock_wait()
+    if wait:
+        click.echo(f'Waiting {wait:.0f}s for workers to drop their cached shard map...')
+        time.sleep(wait)
+    shards.unlock()
+    click.echo('Shards unlocked.')
+
+
+@shards_cli.command('migrate')
+def migrate_command():
+    """Move submissions still in app.db into their classes' shards."""
+    _require_shards()
+    class_ids = db.session.scalars(
+        select(Assignment.class_id)
+        .join(Submission, Submission.assignment_id == Assignment.id)
+        .distinct()
+    ).all()
+    moved = sum(shards.distribute(class_id) for class_id in class_ids)
+    click.echo(f'Moved {moved} submissions of {len(class_ids)} classes into shards.')
@@ -0,0 +1,144 @@
+"""
+Per-student workload: how many assignments fall due on each day and week.
+
+Counts come from one grouped query that buckets Assignment.due_date by day
+for every class the student is a member of. Results are cached per user.
+An entry stays valid until one of the classes it covered has an assignment
+added, changed or removed, or the user joins or leaves a class. Those
+changes bump a generation row in app.db in the same transaction, so every
+worker sees them; checking an entry is one primary-key query.
+"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, event, func, literal, or_, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app import db
+from app.cache import TTLCache
+from app.models import Assignment, WorkloadGeneration, class_memberships
+
+
+workload_cache = TTLCache(maxsize=4096, ttl=600)
+
+generations = WorkloadGeneration.__table__
+
+
+def _bump(rows_select, connection):
+    """Add one to the generations of the (scope, scope_id, 1) rows selected."""
+    connection = connection or db.session.connection()
+    stmt = insert(generations).from_select(
+        ['scope', 'scope_id', 'generation'], rows_select
+    )
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=['scope', 'scope_id'],
+        set_={'generation': generations.c.generation + 1},
+    ))
+
+
+def invalidate_class(class_id, connection=None):
+    _bump(select(literal('class'), literal(class_id), literal(1)), connection)
+
+
+def invalidate_user(user_id, connection=None):
+    _bump(select(literal('user'), literal(user_id), literal(1)), connection)
+
+
+def invalidate_members(class_id, connection=None):
+    """Invalidate every member of a class (e.g. after restoring it)."""
+    members = class_memberships.c
+    _bump((
+        select(literal('user'), members.user_id, literal(1))
+        .where(members.class_id == class_id)
+    ), connection)
+
+
+@event.listens_for(Assignment, 'after_insert')
+@event.listens_for(Assignment, 'after_update')
+@event.listens_for(Assignment, 'after_delete')
+def _assignment_changed(mapper, connection, target):
+    invalidate_class(target.class_id, connection)
+
+
+def _generations(user_id, class_ids):
+    """(user generation, {class_id: generation}) as stored in app.db."""
+    g = generations.c
+    found = {
+        (scope, scope_id): generation
+        for scope, scope_id, generation in db.session.execute(
+            select(g.scope, g.scope_id, g.generation).where(or_(
+                and_(g.scope == 'user', g.scope_id == user_id),
+                and_(g.scope == 'class', g.scope_id.in_(class_ids)),
+            ))
+        )
+    }
+    return found.get(('user', user_id), 0), {c: found.get(('class', c), 0) for c in class_ids}
+
+
+def _daily_counts(user_id, start, end):
+    """{date: count} for the user's classes, due in [start, end)."""
+    members = class_memberships.c
+    day = func.date(Assignment.due_date)
+    rows = db.session.execute(
+        select(day, func.count(Assignment.id))
+        .join(class_memberships, members.class_id == Assignment.class_id)
+        .where(
+            members.user_id == user_id,
+            Assignment.due_date >= start,
+            Assignment.due_date < end,
+        )
+        .group_by(day)
+    ).all()
+    return {date.fromisoformat(d): count for d, count in rows}
+
+
+def _user_class_ids(user_id):
+    members = class_memberships.c
+    return set(db.session.scalars(
+        select(members.class_id).where(members.user_id == user_id)
+    ))
+
+
+def get_workload(user_id, start, weeks):
+    """Daily and weekly assignment counts for weeks starting at start (a Monday).
+
+    Returns {'weeks': [{'start': date, 'days': [(date, count) x 7], 'total': n}],
+    'max_day': n}.
+    """
+    key = (user_id, start, weeks)
+    cached = workload_cache.get(key)
+    if cached is not None:
+        seen, result = cached
+        if _generations(user_id, seen[1]) == seen:
+            return result
+
+    # read in the same transaction as the counts, so they match
+    seen = _generations(user_id, _user_class_ids(user_id))
+
+    end = start + timedelta(weeks=weeks)
+    counts = _daily_counts(
+        user_id,
+        datetime.combine(start, datetime.min.time()),
+        datetime.combine(end, datetime.min.time()),
+    )
+
+    week_rows = []
+    for w in range(weeks):
+        week_start = start + timedelta(weeks=w)
+        days = [(week_start + timedelta(days=d), counts.get(week_start + timedelta(days=d), 0))
+                for d in range(7)]
+        week_rows.append({
+            'start': week_start,
+            'days': days,
+            'total': sum(count for _, count in days),
+        })
+    result = {'weeks': week_rows, 'max_day': max(counts.values(), default=0)}
+
+    workload_cache.set(key, (seen, result))
+    return result
+
+
+def init_app(app):
+    app.config.setdefault('WORKLOAD_CACHE_TTL', 600)
+    app.config.setdefault('WORKLOAD_WEEKS', 16)
+    workload_cache.configure(ttl=app.config['WORKLOAD_CACHE_TTL'])
@@ -0,0 +1,157 @@
+"""
+ORM vs. row-object read path for the big list views.
+
+Fills a throwaway database with one student enrolled in --classes classes
+holding --rows assignments in total, plus --rows submissions on a single
+assignment, then times fetching each list both ways and measures the
+memory the fetched list keeps alive. The ORM side does what the views
+used to: Model.query...all() and reading the attributes the template
+reads, including assignment.clazz.name and submission.student.username.
+
+    python benchmarks/bench_read_path.py --rows 20000
+"""
+
+import argparse
+import gc
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app, db, readmodels  # noqa: E402
+from app.models import Assignment, Class, Submission, User, class_memberships  # noqa: E402
+
+
+def populate(rows, classes):
+    teacher = User(username='teacher', email='teacher@example.com', password_hash='x')
+    student = User(username='student', email='student@example.com', password_hash='x')
+    db.session.add_all([teacher, student])
+    db.session.flush()
+
+    db.session.execute(insert(Class), [
+        {'name': f'Class {n}', 'owner_id': teacher.id} for n in range(classes)
+    ])
+    class_ids = list(db.session.scalars(db.select(Class.id)))
+    db.session.execute(insert(class_memberships), [
+        {'class_id': class_id, 'user_id': student.id} for class_id in class_ids
+    ])
+    start = datetime(2026, 1, 1)
+    db.session.execute(insert(Assignment.__table__), [
+        {
+            'title': f'Assignment {n}',
+            'description': 'Read chapter and answer the questions.',
+            'due_date': start + timedelta(hours=n),
+            'class_id': class_ids[n % classes],
+            'creator_id': teacher.id,
+        }
+        for n in range(rows)
+    ])
+
+    users = [{'username': f's{n}', 'email': f's{n}@example.com', 'password_hash': 'x'}
+             for n in range(rows)]
+    db.session.execute(insert(User.__table__), users)
+    first = db.session.scalar(db.select(Assignment.id).order_by(Assignment.id))
+    student_ids = db.session.scalars(db.select(User.id).where(User.username.like('s%')))
+    db.session.execute(insert(Submission.__table__), [
+        {'assignment_id': first, 'student_id': sid, 'content': 'My answer', 'submitted_at': start}
+        for sid in student_ids
+    ])
+    db.session.commit()
+    return set(class_ids), first
+
+
+def orm_timeline(class_ids, _):
+    items = (
+        Assignment.query
+        .filter(Assignment.class_id.in_(class_ids))
+        .order_by(Assignment.due_date)
+        .all()
+    )
+    for a in items:
+        a.id, a.title, a.due_date, a.clazz.id, a.clazz.name
+    return items
+
+
+def rows_timeline(class_ids, _):
+    items = readmodels.timeline(class_ids)
+    for a in items:
+        a.id, a.title, a.due_date, a.class_id, a.class_name
+    return items
+
+
+def orm_submissions(_, assignment_id):
+    items = Submission.query.filter_by(assignment_id=assignment_id).all()
+    for s in items:
+        s.student.username, s.submitted_at, s.content, s.grade, s.feedback
+    return items
+
+
+def rows_submissions(_, assignment_id):
+    items = readmodels.submissions(assignment_id)
+    for s in items:
+        s.username, s.submitted_at, s.content, s.grade, s.feedback
+    return items
+
+
+CASES = [
+    ('timeline', orm_timeline, rows_timeline),
+    ('view_submissions', orm_submissions, rows_submissions),
+]
+
+
+def measure(fn, args, repeats):
+    times = []
+    for _ in range(repeats):
+        db.session.remove()
+        gc.collect()
+        started = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - started) * 1000)
+
+    db.session.remove()
+    gc.collect()
+    tracemalloc.start()
+    kept = fn(*args)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return statistics.median(times), current / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--classes', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+            'DB_AUTO_UPGRADE': True,
+            'AUDIT_ENABLED': False,
+        })
+        with app.app_context():
+            class_ids, assignment_id = populate(args.rows, args.classes)
+            print(f'{args.rows} rows, median of {args.repeats} runs')
+            print(f'  {"view":<18}{"path":<6}{"ms":>10}{"MiB kept":>12}')
+            for name, orm, rows in CASES:
+                results = {}
+                for label, fn in (('orm', orm), ('rows', rows)):
+                    results[label] = measure(fn, (class_ids, assignment_id), args.repeats)
+                    ms, mib = results[label]
+                    print(f'  {name:<18}{label:<6}{ms:>10.1f}{mib:>12.1f}')
+                speedup = results['orm'][0] / results['rows'][0]
+                print(f'  {"":<18}{"":<6}{speedup:>9.1f}x faster')
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Cold-start benchmark for the deadline application.
+
+Each run starts a fresh Python process, so imports, create_app() and the
+first template render are all measured from scratch, the way a newly
+spawned worker sees them. The database is a throwaway file that is
+initialised once up front, so runs measure the boot-time version check
+rather than schema creation.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({
+    "SQLALCHEMY_DATABASE_URI": sys.argv[1],
+    "JINJA_BYTECODE_CACHE_DIR": sys.argv[2] or None,
+    "DB_AUTO_UPGRADE": True,
+})
+created = time.perf_counter()
+app.test_client().get("/")
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (served - created) * 1000,
+    "total_ms": (served - start) * 1000,
+}))
+'''
+
+
+def run_once(database_uri, cache_dir):
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, database_uri, cache_dir],
+        cwd=PROJECT_ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--no-bytecode-cache', action='store_true',
+                        help='compile templates from source in every run')
+    parser.add_argument('--json', action='store_true', help='print raw results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database_uri = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        cache_dir = '' if args.no_bytecode_cache else os.path.join(workdir, 'jinja-cache')
+
+        # first boot creates the schema and fills the template cache
+        run_once(database_uri, cache_dir)
+        results = [run_once(database_uri, cache_dir) for _ in range(args.runs)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f'{args.runs} cold starts (bytecode cache {"off" if args.no_bytecode_cache else "on"})')
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms'):
+        values = [r[key] for r in results]
+        print(f'  {key:<18} median {statistics.median(values):8.1f}   min {min(values):8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 """
-This script runs the deadline application using a development server.
+This script runs the deadline application using a development server,
+or a multi-worker production server when SERVER_MODE=production.
 """
 
 from os import environ
@@ -8,9 +9,13 @@ from app import create_app
 deadline_app = create_app()
 
 if __name__ == '__main__':
-    HOST = environ.get('SERVER_HOST', 'localhost')
-    try:
-        PORT = int(environ.get('SERVER_PORT', '5555'))
-    except ValueError:
-        PORT = 5555
-    deadline_app.run(HOST, PORT)
\ No newline at end of file
+    if environ.get('SERVER_MODE', 'development') == 'production':
+        from app.serving import serve
+        serve(deadline_app)
+    else:
+        HOST = environ.get('SERVER_HOST', 'localhost')
+        try:
+            PORT = int(environ.get('SERVER_PORT', '5555'))
+        except ValueError:
+            PORT = 5555
+        deadline_app.run(HOST, PORT)
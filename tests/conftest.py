@@ -1,27 +1,24 @@
 import pytest
-import importlib
 from app import create_app, db
+from app.audit import audit
 
 @pytest.fixture
-def app():
-    _app = create_app()
-    _app.config.update({
+def app(tmp_path):
+    _app = create_app({
         "TESTING": True,
         "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "DB_AUTO_UPGRADE": True,
         "WTF_CSRF_ENABLED": False,
-        "SERVER_NAME": "localhost"
+        "SERVER_NAME": "localhost",
+        "AUDIT_DB_PATH": str(tmp_path / "audit.db"),
     })
 
     with _app.app_context():
-        import app.routes
-        # Only reload if the 'home' route isn't registered yet
-        if 'home' not in _app.view_functions:
-            importlib.reload(app.routes)
-        
         db.create_all()
         yield _app
         db.session.remove()
         db.drop_all()
+    audit.reset()
 
 @pytest.fixture
 def client(app):
@@ -29,4 +26,4 @@ def client(app):
 
 @pytest.fixture
 def session(app):
-    return db.session
\ No newline at end of file
+    return db.session
@@ -0,0 +1,65 @@
+import gzip
+import json
+
+from app import assets
+
+
+def _static_dir(tmp_path, monkeypatch):
+    static = tmp_path / "static"
+    (static / "content").mkdir(parents=True)
+    (static / "content" / "style.css").write_text("body { color: red; }\n" * 50)
+    (static / "vendor").mkdir()
+    lib = b"/* pretend bootstrap */\n" * 50
+    (static / "vendor" / "lib.min.css").write_bytes(lib)
+    monkeypatch.setattr(assets, "VENDOR", {
+        "vendor/lib.min.css": ("https://cdn.example/lib.min.css", assets._sri(lib)),
+    })
+    return static
+
+
+def test_build_writes_hashed_precompressed_files(tmp_path, monkeypatch):
+    static = _static_dir(tmp_path, monkeypatch)
+
+    manifest = assets.build(str(static), fetch=False)
+
+    hashed = manifest["content/style.css"]
+    assert hashed.startswith("style.") and hashed.endswith(".css")
+    dist = static / "dist"
+    assert json.loads((dist / "manifest.json").read_text()) == manifest
+    assert gzip.decompress((dist / (hashed + ".gz")).read_bytes()) == (
+        static / "content" / "style.css"
+    ).read_bytes()
+
+    # a changed file gets a new name and the old outputs are removed
+    (static / "content" / "style.css").write_text("body { color: blue; }\n")
+    rebuilt = assets.build(str(static), fetch=False)
+    assert rebuilt["content/style.css"] != hashed
+    assert not (dist / hashed).exists()
+
+
+def test_pages_use_fingerprinted_urls_served_immutable(app, client, tmp_path, monkeypatch):
+    static = _static_dir(tmp_path, monkeypatch)
+    manifest = assets.build(str(static), fetch=False)
+    app.static_folder = str(static)
+    assets.load(app)
+
+    page = client.get("/")
+    hashed = manifest["content/style.css"]
+    assert f"/assets/{hashed}".encode() in page.data
+
+    res = client.get(f"/assets/{hashed}", headers={"Accept-Encoding": "gzip, deflate"})
+    assert res.status_code == 200
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert res.headers["Cache-Control"] == assets.IMMUTABLE
+    assert res.mimetype == "text/css"
+    assert "Accept-Encoding" in res.headers["Vary"]
+
+    plain = client.get(f"/assets/{hashed}")
+    assert "Content-Encoding" not in plain.headers
+    assert client.get("/assets/manifest.json").status_code == 404
+
+
+def test_without_a_build_assets_fall_back_to_cdn_and_static(client):
+    page = client.get("/")
+    assert b"https://cdn.jsdelivr.net/npm/bootstrap@5.3.8/dist/css/bootstrap.min.css" in page.data
+    assert b"/static/content/style.css" in page.data
@@ -0,0 +1,95 @@
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from app.audit import AuditLog, audit, query
+from app.models import Assignment, Class, User
+
+
+def _log(tmp_path, **overrides):
+    log = AuditLog()
+    log._config = {
+        "AUDIT_ENABLED": True,
+        "AUDIT_DB_PATH": str(tmp_path / "audit.db"),
+        "AUDIT_BUFFER_SIZE": 3,
+        "AUDIT_BATCH": 100,
+        "AUDIT_FLUSH_INTERVAL": 60,
+        "AUDIT_OVERFLOW": "drop",
+        "AUDIT_BLOCK_TIMEOUT": 0.01,
+        **overrides,
+    }
+    return log
+
+
+def test_full_buffer_drops_and_records_the_gap(tmp_path):
+    log = _log(tmp_path)
+    results = [log.record("class.view", class_id=1) for _ in range(5)]
+    assert results == [True, True, True, False, False]
+
+    log.flush()
+    rows = query(str(tmp_path / "audit.db"))
+    assert [row["action"] for row in rows] == ["class.view"] * 3 + ["audit.dropped"]
+    assert rows[-1]["detail"] == "2 events dropped, buffer full"
+    log.stop()
+
+
+def test_block_policy_waits_for_room_before_dropping(tmp_path):
+    log = _log(tmp_path, AUDIT_OVERFLOW="block", AUDIT_BUFFER_SIZE=1, AUDIT_BATCH=1, AUDIT_BLOCK_TIMEOUT=1)
+    # the writer drains each event as it arrives, so nothing is lost
+    assert all(log.record("assignment.view", assignment_id=n) for n in range(20))
+    log.stop()
+    assert len(query(str(tmp_path / "audit.db"), action="assignment")) == 20
+
+
+def test_audit_table_is_append_only(tmp_path):
+    log = _log(tmp_path)
+    log.record("class.view", class_id=1)
+    log.stop()
+
+    conn = sqlite3.connect(tmp_path / "audit.db")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("DELETE FROM audit")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("UPDATE audit SET user_id = 2")
+
+
+def test_views_and_submissions_are_audited_and_exported(client, session, app, tmp_path):
+    teacher = User(username="teacher", email="t@t.com")
+    student = User(username="student", email="s@t.com")
+    for user in (teacher, student):
+        user.set_password("pass")
+    clazz = Class(name="Law", owner=teacher)
+    clazz.members.extend([teacher, student])
+    assignment = Assignment(title="Brief", due_date=datetime(2026, 6, 1), creator=teacher, clazz=clazz)
+    session.add_all([teacher, student, clazz, assignment])
+    session.commit()
+    class_id, assignment_id = clazz.id, assignment.id
+
+    client.post("/login", data={"username": "student", "password": "pass"})
+    client.get(f"/classes/{class_id}")
+    client.get(f"/assignments/{assignment_id}/submit")
+    client.post(f"/assignments/{assignment_id}/submit", data={"content": "v1"})
+    client.post(f"/assignments/{assignment_id}/submit", data={"content": "v2"})
+    client.get("/logout")
+    client.post("/login", data={"username": "teacher", "password": "pass"})
+    client.get(f"/assignments/{assignment_id}/submissions")
+    audit.flush()
+
+    path = app.config["AUDIT_DB_PATH"]
+    rows = query(path, assignment_id=assignment_id)
+    assert [(row["username"], row["action"]) for row in rows] == [
+        ("student", "assignment.view"),
+        ("student", "submission.create"),
+        ("student", "submission.edit"),
+        ("teacher", "submissions.view"),
+    ]
+    assert query(path, username="student", action="class.view")[0]["class_id"] == class_id
+
+    result = app.test_cli_runner().invoke(
+        args=["audit", "export", "--user", "student", "--action", "submission", "--format", "json"]
+    )
+    assert result.exit_code == 0
+    exported = [json.loads(line) for line in result.output.splitlines()]
+    assert [row["action"] for row in exported] == ["submission.create", "submission.edit"]
@@ -0,0 +1,79 @@
+import time
+
+from app.events import EventBroker, Subscription
+
+
+
+def _broker(**overrides):
+    broker = EventBroker()
+    config = {
+        'EVENTS_BACKEND': 'local',
+        'EVENTS_DB_PATH': '',
+        'EVENTS_QUEUE_SIZE': 100,
+        'EVENTS_HEARTBEAT_SECONDS': 0.05,
+        'EVENTS_POLL_INTERVAL': 0.05,
+        'EVENTS_MAX_STREAMS': None,
+    }
+    config.update(overrides)
+    broker._app_config = config
+    return broker
+
+
+def test_publish_reaches_only_matching_classes_and_audience():
+    broker = _broker()
+    student = broker.subscribe(1, {10})
+    teacher = broker.subscribe(2, {10})
+    other = broker.subscribe(3, {20})
+
+    broker.publish('assignment', 10, {'id': 5})
+    broker.publish('submission', 10, {'assignment_id': 5}, user_ids={2})
+
+    assert student.queue.qsize() == 1
+    assert teacher.queue.qsize() == 2
+    assert other.queue.qsize() == 0
+
+
+def test_slow_subscriber_is_bounded_and_told_to_resync():
+    broker = _broker(EVENTS_QUEUE_SIZE=2)
+    slow = broker.subscribe(1, {10})
+    for i in range(5):
+        broker.publish('assignment', 10, {'id': i})
+
+    assert slow.queue.qsize() == 2
+    messages = slow.messages(heartbeat=0.01)
+    assert next(messages).startswith('event: resync')
+
+
+def test_idle_stream_sends_heartbeats():
+    sub = Subscription(1, {10}, maxsize=1)
+    assert next(sub.messages(heartbeat=0.01)) == ': heartbeat\n\n'
+
+
+def test_streams_are_capped_and_end_after_their_time():
+    broker = _broker(EVENTS_MAX_STREAMS=1)
+    first = broker.subscribe(1, {10})
+    assert broker.subscribe(2, {10}) is None
+
+    started = time.monotonic()
+    assert set(first.messages(heartbeat=0.05, max_seconds=0.12)) == {': heartbeat\n\n'}
+    assert time.monotonic() - started < 1
+    broker.unsubscribe(first)
+    assert broker.subscribe(2, {10}) is not None
+
+
+def test_sqlite_backend_shares_events_between_brokers(tmp_path):
+    path = str(tmp_path / 'events.db')
+    publisher = _broker(EVENTS_BACKEND='sqlite', EVENTS_DB_PATH=path)
+    listener = _broker(EVENTS_BACKEND='sqlite', EVENTS_DB_PATH=path)
+    try:
+        sub = listener.subscribe(1, {10})
+        publisher.publish('assignment', 10, {'id': 7})
+
+        deadline = time.time() + 2
+        while sub.queue.empty() and time.time() < deadline:
+            time.sleep(0.02)
+        assert sub.queue.get_nowait()['data'] == {'id': 7}
+    finally:
+        publisher.reset()
+        listener.reset()
+
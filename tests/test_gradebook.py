@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.gradebook import apply_grades, export_csv, load_gradebook, parse_grade, parse_grade_csv
+from app.models import Assignment, Class, Submission, User
+
+
+@pytest.fixture
+def course(app, session):
+    teacher = User(username="teacher", email="t@example.com")
+    ann = User(username="ann", email="ann@example.com")
+    ben = User(username="ben", email="ben@example.com")
+    for user in (teacher, ann, ben):
+        user.set_password("pass")
+    clazz = Class(name="Biology", owner=teacher)
+    clazz.members.extend([teacher, ann, ben])
+    due = datetime(2026, 4, 1, 9, 0)
+    first = Assignment(title="Cells", due_date=due, creator=teacher, clazz=clazz)
+    second = Assignment(title="Genes", due_date=due + timedelta(days=7), creator=teacher, clazz=clazz)
+    session.add_all([teacher, ann, ben, clazz, first, second])
+    session.commit()
+    session.add(Submission(assignment=first, student_id=ann.id, content="mitochondria"))
+    session.commit()
+    return clazz, ann, ben, first, second
+
+
+def test_gradebook_matrix_excludes_owner_and_orders_by_due_date(course):
+    clazz, ann, ben, first, second = course
+    book = load_gradebook(clazz)
+
+    assert [username for _, username in book.students] == ["ann", "ben"]
+    assert [a_id for a_id, _, _ in book.assignments] == [first.id, second.id]
+    assert book.cell(0, 0).submitted and book.cell(0, 0).grade is None
+    assert book.cell(1, 1) == (None, None, None, False)
+
+
+def test_apply_grades_updates_and_creates_in_one_batch(course, session):
+    clazz, ann, ben, first, second = course
+
+    result = apply_grades(clazz, [
+        {"student_id": ann.id, "assignment_id": first.id, "grade": "9.5", "feedback": "Good"},
+        {"student_id": ben.id, "assignment_id": first.id, "grade": 0},
+        {"student_id": ben.id, "assignment_id": second.id, "grade": ""},
+        {"student_id": ann.id, "assignment_id": 999, "grade": 1},
+        {"student_id": ann.id, "assignment_id": second.id, "grade": "-3"},
+    ])
+
+    assert (result.updated, result.created) == (1, 1)
+    assert [row for row, _ in result.errors] == [4, 5]
+    graded = Submission.query.filter_by(assignment_id=first.id, student_id=ann.id).one()
+    assert (graded.grade, graded.feedback, graded.content) == (9.5, "Good", "mitochondria")
+    assert graded.graded_at is not None
+    zero = Submission.query.filter_by(assignment_id=first.id, student_id=ben.id).one()
+    assert zero.grade == 0 and zero.submitted_at is None
+
+    # unchanged cells are not written again
+    again = apply_grades(clazz, [{"student_id": ann.id, "assignment_id": first.id, "grade": "9.5"}])
+    assert (again.updated, again.created) == (0, 0)
+
+
+def test_grading_a_missing_cell_keeps_work_handed_in_meanwhile(course, session):
+    clazz, ann, ben, first, second = course
+    book = load_gradebook(clazz)
+    # ben hands in after the teacher opened the gradebook
+    session.add(Submission(assignment=first, student_id=ben.id, content="late essay"))
+    session.commit()
+
+    apply_grades(clazz, [{"student_id": ben.id, "assignment_id": first.id, "grade": 0}], book)
+
+    cell = Submission.query.filter_by(assignment_id=first.id, student_id=ben.id).one()
+    assert (cell.grade, cell.content) == (0, "late essay")
+    assert cell.submitted_at is not None and cell.graded_at is not None
+
+
+def test_csv_export_round_trips_through_upload(course):
+    clazz, ann, ben, first, second = course
+    apply_grades(clazz, [{"student_id": ann.id, "assignment_id": first.id, "grade": 7}])
+    book = load_gradebook(clazz)
+
+    text = export_csv(book).replace(f"{ann.id},ann,{first.id},Cells,7,", f"{ann.id},ann,{first.id},Cells,8,")
+    edits = parse_grade_csv(text, book)
+    assert len(edits) == 4
+    assert apply_grades(clazz, edits, book).updated == 1
+
+    by_name = parse_grade_csv(f"username,assignment_id,grade\nben,{second.id},6\n", book)
+    assert by_name == [{"student_id": ben.id, "assignment_id": second.id, "grade": "6"}]
+
+    with pytest.raises(ValueError):
+        parse_grade_csv("student,grade\nann,1\n", book)
+
+
+@pytest.mark.parametrize("value", ["abc", "nan", "inf", "-1"])
+def test_parse_grade_rejects_bad_values(value):
+    with pytest.raises(ValueError):
+        parse_grade(value)
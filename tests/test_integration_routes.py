@@ -1,5 +1,8 @@
+import io
+import sqlite3
+
 import pytest
-from app.models import User, Class, Assignment
+from app.models import User, Class, Assignment, Submission
 from datetime import datetime, timedelta
 
 def test_home_page_renders(client):
@@ -60,3 +63,404 @@ def test_timeline_renders_with_data(client, session, app):
     res = client.get("/timeline")
     assert res.status_code == 200
     assert b"Bio Lab" in res.data
+
+def test_timeline_renders_without_assignments(client, session, app):
+    with app.app_context():
+        u = User(username="newcomer", email="new@test.com")
+        u.set_password("pass")
+        session.add(u)
+        session.commit()
+
+    client.post("/login", data={"username": "newcomer", "password": "pass"})
+    res = client.get("/timeline")
+    assert res.status_code == 200
+    assert b"No assignments yet" in res.data
+
+def test_missing_work_lists_only_unsubmitted_students(client, session, app):
+    with app.app_context():
+        teacher = User(username="teacher", email="t@t.com")
+        teacher.set_password("pass")
+        done = User(username="done_student", email="d@t.com")
+        done.set_password("pass")
+        late = User(username="late_student", email="l@t.com")
+        late.set_password("pass")
+        session.add_all([teacher, done, late])
+        c = Class(name="Chem", owner=teacher)
+        c.members.extend([teacher, done, late])
+        session.add(c)
+        session.commit()
+        a = Assignment(title="Titration", due_date=datetime.now() + timedelta(days=1), creator=teacher, clazz=c)
+        session.add(a)
+        session.commit()
+        session.add(Submission(assignment=a, student=done, content="done"))
+        session.commit()
+        c_id, a_id = c.id, a.id
+
+    client.post("/login", data={"username": "teacher", "password": "pass"})
+    res = client.get(f"/classes/{c_id}/missing")
+    assert res.status_code == 200
+    assert b"late_student" in res.data
+    assert b"done_student" not in res.data
+    assert b"<strong>teacher</strong>" not in res.data
+
+    res = client.get(f"/assignments/{a_id}/missing?format=csv")
+    assert res.status_code == 200
+    assert res.mimetype == "text/csv"
+    lines = res.data.decode().strip().splitlines()
+    assert len(lines) == 2
+    assert "late_student" in lines[1]
+
+def test_event_stream_opens_for_logged_in_user(client, session, app):
+    with app.app_context():
+        u = User(username="viewer", email="v@test.com")
+        u.set_password("pass")
+        session.add(u)
+        session.commit()
+
+    client.post("/login", data={"username": "viewer", "password": "pass"})
+    res = client.get("/events", buffered=False)
+    assert res.status_code == 200
+    assert res.mimetype == "text/event-stream"
+    assert next(res.response).startswith(b"retry:")
+    res.close()
+
+def test_archive_and_restore_class(client, session, app, tmp_path):
+    from app import archive
+
+    app.config["ARCHIVE_DATABASE_PATH"] = str(tmp_path / "archive.db")
+    with app.app_context():
+        teacher = User(username="teacher", email="t@t.com")
+        teacher.set_password("pass")
+        student = User(username="student", email="s@t.com")
+        student.set_password("pass")
+        session.add_all([teacher, student])
+        c = Class(name="Old Term", owner=teacher)
+        c.members.extend([teacher, student])
+        session.add(c)
+        session.commit()
+        a = Assignment(title="Final Essay", due_date=datetime.now(), creator=teacher, clazz=c)
+        session.add(a)
+        session.commit()
+        session.add(Submission(assignment=a, student=student, content="essay"))
+        session.commit()
+        c_id, a_id = c.id, a.id
+
+        moved = archive.archive_class(c_id)
+        assert moved == {"class": 1, "assignment": 1, "submission": 1, "class_memberships": 2}
+        assert session.get(Class, c_id) is None
+        assert Submission.query.count() == 0
+
+    # names only: password hashes never leave app.db
+    archived = sqlite3.connect(tmp_path / "archive.db")
+    assert archived.execute('SELECT username, password_hash FROM "user" ORDER BY id').fetchall() == [
+        ("teacher", ""), ("student", ""),
+    ]
+    archived.close()
+
+    client.post("/login", data={"username": "teacher", "password": "pass"})
+    res = client.get(f"/classes/{c_id}")
+    assert res.status_code == 200
+    assert b"Archived" in res.data
+    assert b"Final Essay" in res.data
+    res = client.get(f"/assignments/{a_id}/submissions")
+    assert res.status_code == 200
+    assert b"essay" in res.data
+    assert client.get(f"/assignments/{a_id}/submit").status_code == 404
+
+    with app.app_context():
+        # the archived ids stay reserved for the restore
+        teacher = User.query.filter_by(username="teacher").one()
+        newer = Class(name="New Term", owner=teacher)
+        session.add(newer)
+        session.add(Assignment(title="Intro", due_date=datetime.now(), creator=teacher, clazz=newer))
+        session.commit()
+        assert newer.id != c_id and newer.assignments[0].id != a_id
+
+        archive.restore_class(c_id)
+        restored = session.get(Class, c_id)
+        assert restored is not None
+        assert restored.members.count() == 2
+        assert Submission.query.count() == 1
+
+def test_clone_class_shifts_assignments(client, session, app):
+    start = datetime(2026, 1, 12, 9, 0)
+    with app.app_context():
+        teacher = User(username="teacher", email="t@t.com")
+        teacher.set_password("pass")
+        session.add(teacher)
+        c = Class(name="Spring", owner=teacher)
+        c.members.append(teacher)
+        session.add(c)
+        session.commit()
+        for week in range(3):
+            session.add(Assignment(
+                title=f"Week {week}", description="read", due_date=start + timedelta(weeks=week),
+                reminder_hours=6, creator=teacher, clazz=c,
+            ))
+        session.commit()
+        c_id = c.id
+
+    client.post("/login", data={"username": "teacher", "password": "pass"})
+    res = client.post(f"/classes/{c_id}/clone", data={
+        "name": "Fall",
+        "start_date": "2026-09-07 09:00",
+        "copy_reminders": "y",
+    })
+    assert res.status_code == 302
+
+    with app.app_context():
+        fall = Class.query.filter_by(name="Fall").one()
+        assert fall.members.count() == 1
+        copies = Assignment.query.filter_by(class_id=fall.id).order_by(Assignment.due_date).all()
+        assert [a.title for a in copies] == ["Week 0", "Week 1", "Week 2"]
+        assert copies[0].due_date == datetime(2026, 9, 7, 9, 0)
+        assert copies[2].due_date == datetime(2026, 9, 21, 9, 0)
+        assert all(a.description is None and a.reminder_hours == 6 for a in copies)
+
+def test_user_loader_is_cached_and_invalidated(client, session, app):
+    from sqlalchemy import event
+    from app import db
+    from app.identity import user_cache
+
+    with app.app_context():
+        u = User(username="cached", email="c@test.com")
+        u.set_password("pass")
+        session.add(u)
+        session.commit()
+        u_id = u.id
+
+    client.post("/login", data={"username": "cached", "password": "pass"})
+    client.get("/")
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        res = client.get("/")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert b"Hi, cached" in res.data
+    assert not any("FROM user" in s for s in statements)
+
+    with app.app_context():
+        user = session.get(User, u_id)
+        user.email = "new@test.com"
+        session.commit()
+    assert u_id not in user_cache
+
+def test_login_is_rate_limited_per_username(client, session, app):
+    app.config["RATELIMITS"] = {"login": {"username": "3/minute"}}
+    with app.app_context():
+        u = User(username="target", email="target@test.com")
+        u.set_password("pass")
+        session.add(u)
+        session.commit()
+
+    for _ in range(3):
+        res = client.post("/login", data={"username": "Target", "password": "wrong"})
+        assert res.status_code == 302
+
+    res = client.post("/login", data={"username": "target", "password": "wrong"})
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) >= 1
+
+    # other accounts and page views are unaffected
+    assert client.post("/login", data={"username": "someone", "password": "x"}).status_code == 302
+    assert client.get("/login").status_code == 200
+
+def test_workload_counts_assignments_per_day_across_classes(client, session, app):
+    from sqlalchemy import text
+
+    from app import workload
+
+    monday = datetime(2026, 3, 2, 9, 0)
+    with app.app_context():
+        student = User(username="busy", email="busy@test.com")
+        student.set_password("pass")
+        teacher = User(username="teacher", email="t@t.com")
+        teacher.set_password("pass")
+        session.add_all([student, teacher])
+        math_class = Class(name="Math", owner=teacher)
+        math_class.members.extend([teacher, student])
+        art_class = Class(name="Art", owner=teacher)
+        art_class.members.append(teacher)
+        session.add_all([math_class, art_class])
+        session.commit()
+        session.add_all([
+            Assignment(title="M1", due_date=monday, creator=teacher, clazz=math_class),
+            Assignment(title="M2", due_date=monday + timedelta(hours=5), creator=teacher, clazz=math_class),
+            Assignment(title="M3", due_date=monday + timedelta(days=8), creator=teacher, clazz=math_class),
+            Assignment(title="A1", due_date=monday, creator=teacher, clazz=art_class),
+        ])
+        session.commit()
+        student_id, art_id = student.id, art_class.id
+
+        load = workload.get_workload(student_id, monday.date(), 2)
+        assert load["weeks"][0]["days"][0] == (monday.date(), 2)
+        assert [w["total"] for w in load["weeks"]] == [2, 1]
+        assert workload.get_workload(student_id, monday.date(), 2) is load
+
+        # joining another class invalidates the cached heatmap
+        art = session.get(Class, art_id)
+        art.members.append(session.get(User, student_id))
+        workload.invalidate_user(student_id)
+        session.commit()
+        load = workload.get_workload(student_id, monday.date(), 2)
+        assert load["weeks"][0]["days"][0][1] == 3
+
+        # so does a new assignment in one of the classes
+        session.add(Assignment(title="A2", due_date=monday, creator_id=art.owner_id, class_id=art_id))
+        session.commit()
+        load = workload.get_workload(student_id, monday.date(), 2)
+        assert load["max_day"] == 4
+
+        # a change made by another worker shows up through app.db
+        session.execute(text(
+            "INSERT INTO assignment (title, due_date, creator_id, class_id) VALUES ('A3', :due, :owner, :cid)"
+        ), {"due": monday, "owner": art.owner_id, "cid": art_id})
+        session.execute(text(
+            "UPDATE workload_generation SET generation = generation + 1 WHERE scope = 'class' AND scope_id = :cid"
+        ), {"cid": art_id})
+        session.commit()
+        assert workload.get_workload(student_id, monday.date(), 2)["max_day"] == 5
+
+    client.post("/login", data={"username": "busy", "password": "pass"})
+    res = client.get("/workload?start=2026-03-04&weeks=2")
+    assert res.status_code == 200
+    assert b"Week of" in res.data
+    assert b"03/02" in res.data
+
+def test_deadline_conflicts_count_other_classes_only(client, session, app):
+    from app import deadline_index
+    from app.models import DeadlineLoad
+
+    due = datetime(2026, 5, 6, 12, 0)
+    with app.app_context():
+        teacher = User(username="teacher", email="t@t.com")
+        teacher.set_password("pass")
+        other = User(username="other", email="o@t.com")
+        other.set_password("pass")
+        busy = User(username="busy", email="busy@test.com")
+        busy.set_password("pass")
+        free = User(username="free", email="free@test.com")
+        free.set_password("pass")
+        session.add_all([teacher, other, busy, free])
+        history = Class(name="History", owner=teacher)
+        history.members.extend([teacher, free])
+        physics = Class(name="Physics", owner=other)
+        physics.members.extend([other, busy])
+        session.add_all([history, physics])
+        session.commit()
+        session.add_all([
+            Assignment(title="P1", due_date=due, creator=other, clazz=physics),
+            Assignment(title="P2", due_date=due + timedelta(hours=3), creator=other, clazz=physics),
+            Assignment(title="P3", due_date=due + timedelta(days=5), creator=other, clazz=physics),
+            Assignment(title="H1", due_date=due, creator=teacher, clazz=history),
+        ])
+        session.commit()
+        history_id, physics_id = history.id, physics.id
+
+    client.post("/login", data={"username": "busy", "password": "pass"})
+    client.post("/classes/enroll", data={"classCode": history_id})
+
+    res = client.get(f"/classes/{history_id}/assignments/conflicts?due=2026-05-06 18:00")
+    assert res.status_code == 403
+
+    client.get("/logout")
+    client.post("/login", data={"username": "teacher", "password": "pass"})
+    res = client.get(f"/classes/{history_id}/assignments/conflicts?due=2026-05-06 18:00")
+    assert res.status_code == 200
+    data = res.get_json()
+    # busy has P1 and P2 that day; free has nothing; H1 is this class's own
+    assert data["students"] == 2
+    assert data["histogram"] == [1, 0, 1, 0]
+
+    assert client.get(f"/classes/{history_id}/assignments/conflicts?due=soon").status_code == 400
+
+    with app.app_context():
+        # moving a deadline keeps the index in step without a rebuild
+        p3 = Assignment.query.filter_by(title="P3").one()
+        p3.due_date = due
+        session.commit()
+        indexed = {(r.user_id, r.class_id, r.day, r.count) for r in DeadlineLoad.query}
+        deadline_index.rebuild()
+        session.commit()
+        assert {(r.user_id, r.class_id, r.day, r.count) for r in DeadlineLoad.query} == indexed
+
+    res = client.get(f"/classes/{history_id}/assignments/conflicts?due=2026-05-06 18:00&window=0")
+    assert res.get_json()["histogram"] == [1, 0, 0, 1]
+
+def test_gradebook_saves_whole_grid_in_one_post(client, session, app):
+    due = datetime(2026, 4, 1, 9, 0)
+    with app.app_context():
+        teacher = User(username="teacher", email="t@t.com")
+        teacher.set_password("pass")
+        students = [User(username=f"s{i}", email=f"s{i}@t.com") for i in range(3)]
+        for s in students:
+            s.set_password("pass")
+        c = Class(name="Chem", owner=teacher)
+        c.members.extend([teacher] + students)
+        a = Assignment(title="Lab", due_date=due, creator=teacher, clazz=c)
+        session.add_all([teacher, c, a] + students)
+        session.commit()
+        session.add(Submission(assignment=a, student_id=students[0].id, content="done"))
+        session.commit()
+        c_id, a_id = c.id, a.id
+        ids = [s.id for s in students]
+
+    client.post("/login", data={"username": "teacher", "password": "pass"})
+    res = client.get(f"/classes/{c_id}/gradebook")
+    assert res.status_code == 200
+    assert f'name="grade-{ids[0]}-{a_id}"'.encode() in res.data
+
+    form = {f"grade-{sid}-{a_id}": str(5 + n) for n, sid in enumerate(ids)}
+    form[f"feedback-{ids[0]}-{a_id}"] = "Tidy work"
+    res = client.post(f"/classes/{c_id}/gradebook", data=form)
+    assert res.status_code == 302
+
+    with app.app_context():
+        grades = {s.student_id: s.grade for s in Submission.query.filter_by(assignment_id=a_id)}
+        assert grades == {ids[0]: 5, ids[1]: 6, ids[2]: 7}
+
+    # a zero for missing work does not hide it from the missing-work page
+    res = client.get(f"/assignments/{a_id}/missing")
+    assert b"s1" in res.data and b"s2" in res.data
+
+    res = client.post(f"/classes/{c_id}/gradebook", json={"grades": [
+        {"student_id": ids[1], "assignment_id": a_id, "grade": 10},
+    ]})
+    assert res.get_json() == {"updated": 1, "created": 0, "errors": []}
+
+    res = client.post(f"/classes/{c_id}/gradebook/upload", data={
+        "file": (io.BytesIO(f"username,assignment_id,grade\ns2,{a_id},3\n".encode()), "grades.csv"),
+    })
+    assert res.status_code == 302
+    with app.app_context():
+        assert Submission.query.filter_by(assignment_id=a_id, student_id=ids[2]).one().grade == 3
+
+    client.get("/logout")
+    client.post("/login", data={"username": "s0", "password": "pass"})
+    assert client.get(f"/classes/{c_id}/gradebook").status_code == 403
+    assert b"Tidy work" in client.get(f"/assignments/{a_id}/submit").data
+
+def test_gradebook_posts_need_a_csrf_token(client, session, app):
+    with app.app_context():
+        teacher = User(username="teacher", email="t@t.com")
+        teacher.set_password("pass")
+        c = Class(name="Chem", owner=teacher)
+        session.add_all([teacher, c])
+        session.commit()
+        c_id = c.id
+
+    client.post("/login", data={"username": "teacher", "password": "pass"})
+    app.config["WTF_CSRF_ENABLED"] = True
+    assert b'name="csrf_token"' in client.get(f"/classes/{c_id}/gradebook").data
+    assert client.post(f"/classes/{c_id}/gradebook", json={"grades": []}).status_code == 400
+    res = client.post(f"/classes/{c_id}/gradebook/upload", data={
+        "file": (io.BytesIO(b"username,assignment_id,grade\n"), "grades.csv"),
+    })
+    assert res.status_code == 400
@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app, db
+from app.archive import archive_class
+from app.journal import PendingSubmission, journal, read_segment, write_records
+from app.models import Assignment, Class, Submission, User
+
+
+@pytest.fixture
+def journaled(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+        "DB_AUTO_UPGRADE": True,
+        "WTF_CSRF_ENABLED": False,
+        "SUBMISSION_JOURNAL_ENABLED": True,
+        "SUBMISSION_JOURNAL_DIR": str(tmp_path / "journal"),
+        # only flush when the test says so
+        "SUBMISSION_JOURNAL_INTERVAL": 60,
+        "AUDIT_ENABLED": False,
+    })
+    with app.app_context():
+        teacher = User(username="teacher", email="t@t.com")
+        student = User(username="student", email="s@t.com")
+        for user in (teacher, student):
+            user.set_password("pass")
+        clazz = Class(name="Art", owner=teacher)
+        clazz.members.extend([teacher, student])
+        assignment = Assignment(title="Sketch", due_date=datetime(2026, 6, 1, 9, 0),
+                                creator=teacher, clazz=clazz)
+        db.session.add_all([teacher, student, clazz, assignment])
+        db.session.commit()
+        ids = student.id, assignment.id
+    yield app, ids
+    journal.stop()
+    journal.reset()
+
+
+def _stored(app, student_id, assignment_id):
+    with app.app_context():
+        return db.session.scalar(
+            db.select(Submission.content).filter_by(student_id=student_id, assignment_id=assignment_id)
+        )
+
+
+def test_submission_is_acknowledged_before_it_reaches_the_table(journaled):
+    app, (student_id, assignment_id) = journaled
+    client = app.test_client()
+    client.post("/login", data={"username": "student", "password": "pass"})
+
+    res = client.post(f"/assignments/{assignment_id}/submit", data={"content": "draft one"})
+    assert res.status_code == 302
+    assert _stored(app, student_id, assignment_id) is None
+    # read-through: the student sees what they sent
+    assert b"draft one" in client.get(f"/assignments/{assignment_id}/submit").data
+
+    client.post(f"/assignments/{assignment_id}/submit", data={"content": "draft two"})
+    journal.flush()
+
+    assert _stored(app, student_id, assignment_id) == "draft two"
+    assert journal.pending(assignment_id, student_id) is None
+    # only the open, empty segment and this process's lock file remain
+    assert sorted(name.rsplit(".", 1)[-1] for name in os.listdir(journal.directory)) == ["lock", "log"]
+
+
+def test_pending_entries_of_other_workers_are_seen(journaled, tmp_path):
+    app, (student_id, assignment_id) = journaled
+    client = app.test_client()
+    client.post("/login", data={"username": "student", "password": "pass"})
+    client.post(f"/assignments/{assignment_id}/submit", data={"content": "sent here"})
+
+    # the next submission went to another, still running worker
+    line = json.dumps({
+        "assignment_id": assignment_id,
+        "student_id": student_id,
+        "content": "sent to another worker",
+        "submitted_at": (datetime.utcnow() + timedelta(seconds=1)).isoformat(),
+    })
+    (tmp_path / "journal" / "4242-other.00000001.log").write_text(line + "\n" + line[:20])
+
+    assert journal.pending(assignment_id, student_id).content == "sent to another worker"
+    assert b"sent to another worker" in client.get(f"/assignments/{assignment_id}/submit").data
+
+
+def test_segments_of_a_dead_process_are_replayed(journaled, tmp_path):
+    app, (student_id, assignment_id) = journaled
+    directory = tmp_path / "journal"
+    directory.mkdir(exist_ok=True)
+    (directory / "999-dead.lock").write_text("")
+    line = json.dumps({
+        "assignment_id": assignment_id,
+        "student_id": student_id,
+        "content": "saved before the crash",
+        "submitted_at": "2026-05-31T23:59:00",
+    })
+    (directory / "999-dead.00000001.log").write_text(line + "\n" + line[:20])
+
+    assert len(read_segment(directory / "999-dead.00000001.log")) == 1
+
+    with app.test_request_context():
+        app.preprocess_request()
+    assert journal.pending(assignment_id, student_id).content == "saved before the crash"
+    journal.flush()
+
+    assert _stored(app, student_id, assignment_id) == "saved before the crash"
+    assert not (directory / "999-dead.lock").exists()
+    assert not (directory / "999-dead.00000001.log").exists()
+
+
+def test_replayed_entries_never_overwrite_newer_submissions(journaled):
+    app, (student_id, assignment_id) = journaled
+    newer = datetime(2026, 6, 1, 8, 0)
+    with app.app_context():
+        db.session.add(Submission(assignment_id=assignment_id, student_id=student_id,
+                                  content="newer", submitted_at=newer))
+        db.session.commit()
+        with db.engine.begin() as connection:
+            write_records(connection, [
+                PendingSubmission(assignment_id, student_id, "older", newer - timedelta(hours=1)),
+            ])
+    assert _stored(app, student_id, assignment_id) == "newer"
+
+
+def test_archiving_writes_journaled_submissions_first(journaled, tmp_path):
+    app, (student_id, assignment_id) = journaled
+    app.config["ARCHIVE_DATABASE_PATH"] = str(tmp_path / "archive.db")
+    client = app.test_client()
+    client.post("/login", data={"username": "student", "password": "pass"})
+    client.post(f"/assignments/{assignment_id}/submit", data={"content": "just in time"})
+
+    with app.app_context():
+        class_id = db.session.get(Assignment, assignment_id).class_id
+        moved = archive_class(class_id)
+        journal.flush()
+
+    assert moved["submission"] == 1
+    assert _stored(app, student_id, assignment_id) is None
+    archived = sqlite3.connect(tmp_path / "archive.db")
+    assert archived.execute("SELECT content FROM submission").fetchall() == [("just in time",)]
+    archived.close()
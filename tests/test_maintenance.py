@@ -0,0 +1,94 @@
+import json
+import sqlite3
+import threading
+
+from app import create_app, db
+from app.maintenance import backup, enable_incremental_vacuum, incremental_vacuum, prune_backups
+
+
+def _fill(path, rows, blob=2000):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY, data BLOB)")
+    conn.executemany("INSERT INTO t (data) VALUES (?)", [(b"x" * blob,) for _ in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def test_backup_copies_while_writes_continue(tmp_path):
+    source = str(tmp_path / "live.db")
+    _fill(source, 2000)
+
+    stop = threading.Event()
+    written = []
+
+    def writer():
+        conn = sqlite3.connect(source, timeout=5)
+        while not stop.is_set():
+            conn.execute("INSERT INTO t (data) VALUES (x'00')")
+            conn.commit()
+            written.append(1)
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        backup(source, str(tmp_path / "copy.db"))
+    finally:
+        stop.set()
+        thread.join()
+
+    assert written, "writer was blocked for the whole backup"
+    copy = sqlite3.connect(tmp_path / "copy.db")
+    assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert copy.execute("SELECT count(*) FROM t").fetchone()[0] >= 2000
+    assert not (tmp_path / "copy.db.partial").exists()
+
+
+def test_incremental_vacuum_frees_pages_above_threshold(tmp_path):
+    path = str(tmp_path / "churn.db")
+    _fill(path, 500)
+    assert incremental_vacuum(path)["auto_vacuum"] == "none"
+    assert enable_incremental_vacuum(path) == "incremental"
+
+    conn = sqlite3.connect(path)
+    conn.execute("DELETE FROM t WHERE id <= 300")
+    conn.commit()
+    conn.close()
+
+    skipped = incremental_vacuum(path, threshold=0.9)
+    assert skipped["freed_pages"] == 0 and skipped["freelist_pages"] > 0
+
+    metrics = incremental_vacuum(path, threshold=0.1, max_pages=10)
+    assert metrics["freed_pages"] == 10
+    metrics = incremental_vacuum(path)
+    assert metrics["freelist_pages"] == 0
+
+
+def test_prune_keeps_newest_backups(tmp_path):
+    for stamp in ("20260101", "20260102", "20260103"):
+        (tmp_path / f"main-{stamp}.db").write_bytes(b"")
+    kept = prune_backups(str(tmp_path), "main", 2)
+    assert [p.rsplit("-", 1)[-1] for p in kept] == ["20260102.db", "20260103.db"]
+    assert not (tmp_path / "main-20260101.db").exists()
+
+
+def test_maintenance_cli_reports_metrics(tmp_path):
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+        "DB_AUTO_UPGRADE": True,
+        "ARCHIVE_DATABASE_PATH": str(tmp_path / "archive.db"),
+        "MAINTENANCE_BACKUP_DIR": str(tmp_path / "backups"),
+        "AUDIT_ENABLED": False,
+    })
+    result = app.test_cli_runner().invoke(args=["maintenance", "run", "--backup", "--json"])
+    assert result.exit_code == 0, result.output
+
+    steps = [json.loads(line) for line in result.output.splitlines()]
+    assert [s["step"] for s in steps] == ["optimize", "vacuum", "backup"]
+    # new databases are created ready for incremental vacuum
+    assert steps[1]["auto_vacuum"] == "incremental"
+    assert {"size_bytes", "freelist_pages", "duration_seconds"} <= set(steps[2])
+    assert len(list((tmp_path / "backups").glob("main-*.db"))) == 1
+    with app.app_context():
+        db.engine.dispose()
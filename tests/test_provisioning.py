@@ -0,0 +1,107 @@
+import json
+
+from app.models import User
+from app.provisioning import parse_users, provision_users
+
+
+CSV = f"""username,email,password
+alice,alice@example.com,pw1
+bob,bob@example.com,pw2
+alice,alice2@example.com,pw3
+carol,not-an-email,pw4
+taken,dave@example.com,pw5
+erin,erin@example.com,
+{'f' * 65},frank@example.com,pw7
+"""
+
+
+def test_provision_users_reports_conflicts_per_row(app, session):
+    existing = User(username="taken", email="taken@example.com")
+    existing.set_password("x")
+    session.add(existing)
+    session.commit()
+
+    result = provision_users(parse_users(CSV, "csv"), workers=1, chunk_size=1)
+
+    assert result.created == 2
+    assert [(row, reason) for row, _, reason in result.conflicts] == [
+        (3, "duplicate username in this batch"),
+        (4, "invalid email address"),
+        (5, "username already exists"),
+        (6, "username, email and password are required"),
+        (7, "username is longer than 64 characters"),
+    ]
+    bob = User.query.filter_by(username="bob").one()
+    assert bob.check_password("pw2")
+    assert bob.notifications_enabled is True
+
+
+def test_password_hashing_uses_a_process_pool(app, session):
+    rows = [
+        {"username": f"user{i}", "email": f"user{i}@example.com", "password": f"pw{i}"}
+        for i in range(4)
+    ]
+
+    result = provision_users(rows, workers=2)
+
+    assert result.created == 4
+    assert User.query.filter_by(username="user3").one().check_password("pw3")
+
+
+def test_provision_endpoint_is_admin_only(client, session, app):
+    admin = User(username="registrar", email="reg@example.com")
+    admin.set_password("pass")
+    session.add(admin)
+    session.commit()
+
+    client.post("/login", data={"username": "registrar", "password": "pass"})
+    body = json.dumps([{"username": "zoe", "email": "zoe@example.com", "password": "pw"}])
+    res = client.post("/admin/users/provision", data=body, content_type="application/json")
+    assert res.status_code == 403
+
+    app.config["PROVISIONING_ADMINS"] = ["registrar"]
+    res = client.post("/admin/users/provision", data=body, content_type="application/json")
+    assert res.status_code == 200
+    assert res.get_json() == {"created": 1, "conflicts": []}
+
+
+def _registrar(client, session, app):
+    admin = User(username="registrar", email="reg@example.com")
+    admin.set_password("pass")
+    session.add(admin)
+    session.commit()
+    app.config["PROVISIONING_ADMINS"] = ["registrar"]
+    client.post("/login", data={"username": "registrar", "password": "pass"})
+
+
+def test_provision_endpoint_needs_a_csrf_token(client, session, app):
+    _registrar(client, session, app)
+    app.config["WTF_CSRF_ENABLED"] = True
+
+    body = "username,email,password\nzoe,zoe@example.com,pw\n"
+    res = client.post("/admin/users/provision", data=body, content_type="text/plain")
+
+    assert res.status_code == 400
+    assert User.query.filter_by(username="zoe").first() is None
+
+
+def test_provision_endpoint_sends_large_batches_to_the_command(client, session, app):
+    _registrar(client, session, app)
+    app.config["PROVISIONING_MAX_ROWS"] = 2
+    rows = [{"username": f"u{i}", "email": f"u{i}@example.com", "password": "pw"} for i in range(3)]
+
+    res = client.post("/admin/users/provision", data=json.dumps(rows), content_type="application/json")
+
+    assert res.status_code == 413
+    assert "flask users provision" in res.get_json()["error"]
+    assert User.query.filter_by(username="u0").first() is None
+
+
+def test_provision_command(app, session, tmp_path):
+    source = tmp_path / "users.csv"
+    source.write_text(CSV)
+
+    result = app.test_cli_runner().invoke(args=["users", "provision", str(source), "--workers", "1"])
+
+    assert result.exit_code == 0
+    assert "Created 3 users, 4 rows skipped." in result.output
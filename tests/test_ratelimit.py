@@ -0,0 +1,24 @@
+from app.ratelimit import MemoryBackend, SQLiteBackend, parse_limit
+
+
+def test_parse_limit():
+    assert parse_limit("10/minute") == (10, 10 / 60)
+    assert parse_limit("5/seconds") == (5, 5)
+
+
+def test_token_bucket_refills_over_time():
+    backend = MemoryBackend()
+    capacity, rate = parse_limit("2/minute")
+
+    assert backend.take("k", capacity, rate, now=0) == 0
+    assert backend.take("k", capacity, rate, now=0) == 0
+    assert backend.take("k", capacity, rate, now=0) == 30
+    assert backend.take("k", capacity, rate, now=30) == 0
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "limits.db")
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+
+    assert first.take("k", 1, 1 / 60, now=100) == 0
+    assert second.take("k", 1, 1 / 60, now=100) == 60
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from app import readmodels
+from app.models import Assignment, Class, Submission, User
+
+
+def test_rows_carry_joined_names_and_skip_the_identity_map(app, session):
+    teacher = User(username="teacher", email="t@t.com")
+    student = User(username="student", email="s@t.com")
+    for user in (teacher, student):
+        user.set_password("pass")
+    geo = Class(name="Geography", owner=teacher)
+    later = Assignment(title="Maps", due_date=datetime(2026, 3, 9), creator=teacher, clazz=geo)
+    sooner = Assignment(title="Rivers", due_date=datetime(2026, 3, 2), creator=teacher, clazz=geo)
+    session.add_all([teacher, student, geo, later, sooner])
+    session.commit()
+    session.add(Submission(assignment=sooner, student_id=student.id, content="Nile"))
+    session.commit()
+    class_id, sooner_id = geo.id, sooner.id
+    session.expunge_all()
+
+    timeline = readmodels.timeline({class_id})
+    assert [(a.title, a.class_name) for a in timeline] == [("Rivers", "Geography"), ("Maps", "Geography")]
+    assert [d.title for d in readmodels.deadlines({class_id})] == ["Rivers", "Maps"]
+    assert readmodels.assignment_list(set()) == []
+
+    (row,) = readmodels.submissions(sooner_id)
+    assert (row.username, row.content, row.grade) == ("student", "Nile", None)
+    assert not hasattr(row, "__dict__")
+    assert len(session.identity_map) == 0
+
+
+def test_list_pages_render_every_column_from_rows(app, session, client):
+    teacher = User(username="teacher", email="t@t.com")
+    student = User(username="student", email="s@t.com")
+    for user in (teacher, student):
+        user.set_password("pass")
+    geo = Class(name="Geography", owner=teacher)
+    geo.members.extend([teacher, student])
+    due = datetime.now() + timedelta(days=3)
+    rivers = Assignment(title="Rivers", description="Trace the Nile", due_date=due,
+                        creator=teacher, clazz=geo)
+    session.add_all([teacher, student, geo, rivers])
+    session.commit()
+    session.add(Submission(assignment=rivers, student_id=student.id, content="Cairo to Khartoum"))
+    session.commit()
+    assignment_id = rivers.id
+
+    client.post("/login", data={"username": "student", "password": "pass"})
+    for path in ("/timeline", "/deadlines", "/assignments"):
+        page = client.get(path).data
+        assert b"Rivers" in page, path
+        if path != "/timeline":
+            assert b"Trace the Nile" in page, path
+    assert b"Geography" in client.get("/timeline").data
+    assert b"Geography" in client.get("/assignments").data
+
+    client.get("/logout")
+    client.post("/login", data={"username": "teacher", "password": "pass"})
+    page = client.get(f"/assignments/{assignment_id}/submissions").data
+    assert b"student" in page and b"Cairo to Khartoum" in page
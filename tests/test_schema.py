@@ -0,0 +1,105 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import inspect
+
+from app import create_app, db
+from app.schema import SCHEMA_VERSION
+
+
+def _old_database(path):
+    # the shape of databases created before reminders and notification settings
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE user (
+            id INTEGER NOT NULL PRIMARY KEY,
+            username VARCHAR(64) NOT NULL,
+            email VARCHAR(128) NOT NULL,
+            password_hash VARCHAR(128) NOT NULL
+        );
+        INSERT INTO user VALUES (1, 'old', 'old@example.com', 'x');
+    """)
+    conn.close()
+
+
+def test_boot_upgrades_an_old_database(tmp_path):
+    path = tmp_path / "old.db"
+    _old_database(path)
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "DB_AUTO_UPGRADE": True})
+
+    with app.app_context():
+        inspector = inspect(db.engine)
+        assert "notifications_enabled" in {c["name"] for c in inspector.get_columns("user")}
+        assert inspector.has_table("submission")
+        assert "ix_class_memberships_class_id" in {
+            i["name"] for i in inspector.get_indexes("class_memberships")
+        }
+        notify = db.session.execute(db.text("SELECT notifications_enabled FROM user")).scalar()
+        assert notify == 1
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    conn.close()
+
+
+def test_boot_refuses_outdated_schema_by_default(tmp_path):
+    path = tmp_path / "old.db"
+    _old_database(path)
+
+    with pytest.raises(RuntimeError, match="flask init-db"):
+        create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    conn.close()
+
+
+def test_other_flask_commands_refuse_outdated_schema(tmp_path, monkeypatch):
+    path = tmp_path / "old.db"
+    _old_database(path)
+    monkeypatch.setenv("FLASK_RUN_FROM_CLI", "true")
+    monkeypatch.setattr("sys.argv", ["flask", "--app", "run", "archive", "list"])
+
+    with pytest.raises(RuntimeError, match="flask init-db"):
+        create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+
+
+def test_init_db_command(tmp_path, monkeypatch):
+    path = tmp_path / "fresh.db"
+    # the flask command loads the app before it runs init-db
+    monkeypatch.setenv("FLASK_RUN_FROM_CLI", "true")
+    monkeypatch.setattr("sys.argv", ["flask", "--app", "run", "init-db"])
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}"})
+
+    result = app.test_cli_runner().invoke(args=["init-db"])
+
+    assert result.exit_code == 0
+    assert f"version {SCHEMA_VERSION} (was 0)" in result.output
+
+
+def test_upgrade_stops_sqlite_reusing_freed_ids(tmp_path):
+    path = tmp_path / "old.db"
+    _old_database(path)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE class (
+            id INTEGER NOT NULL PRIMARY KEY,
+            name VARCHAR(140) NOT NULL,
+            description TEXT,
+            owner_id INTEGER NOT NULL REFERENCES user (id)
+        );
+        INSERT INTO class VALUES (1, 'Art', NULL, 1), (2, 'Music', NULL, 1);
+    """)
+    conn.close()
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "DB_AUTO_UPGRADE": True})
+
+    with app.app_context():
+        db.session.execute(db.text("DELETE FROM class WHERE id = 2"))
+        db.session.execute(db.text("INSERT INTO class (name, owner_id) VALUES ('Drama', 1)"))
+        db.session.commit()
+        ids = db.session.execute(db.text("SELECT id, name FROM class ORDER BY id")).all()
+        assert ids == [(1, "Art"), (3, "Drama")]
+        fks = inspect(db.engine).get_foreign_keys("assignment")
+        assert {fk["referred_table"] for fk in fks} == {"user", "class"}
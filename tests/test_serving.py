@@ -0,0 +1,70 @@
+from app import create_app, db
+from app.serving import configure_app, production_options, reset_after_fork
+
+
+def test_production_options_read_server_environment(monkeypatch):
+    monkeypatch.setenv("SERVER_HOST", "127.0.0.1")
+    monkeypatch.setenv("SERVER_PORT", "8080")
+    monkeypatch.setenv("SERVER_WORKERS", "3")
+    monkeypatch.setenv("SERVER_THREADS", "not-a-number")
+    monkeypatch.setenv("SERVER_PRELOAD", "off")
+
+    options = production_options()
+
+    assert options["bind"] == "127.0.0.1:8080"
+    assert options["workers"] == 3
+    assert options["threads"] == 4
+    assert options["preload_app"] is False
+    assert options["worker_class"] == "gthread"
+
+
+def test_reset_after_fork_drops_pooled_connections(tmp_path):
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'serve.db'}",
+        "DB_AUTO_UPGRADE": True,
+    })
+    with app.app_context():
+        db.session.execute(db.text("SELECT 1"))
+        db.session.remove()
+        engine = db.engine
+        assert engine.pool.checkedin() >= 1
+
+    reset_after_fork(app)
+
+    assert engine.pool.checkedin() == 0
+
+
+def _whoami_app():
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "DB_AUTO_UPGRADE": True,
+        "TESTING": True,
+    })
+
+    @app.route("/whoami")
+    def whoami():
+        from flask import request
+        return request.remote_addr
+
+    return app
+
+
+def test_configure_app_caps_streams_and_ignores_forwarded_for(monkeypatch):
+    monkeypatch.setenv("SERVER_THREADS", "8")
+    app = _whoami_app()
+
+    configure_app(app, production_options())
+
+    assert app.config["EVENTS_MAX_STREAMS"] == 4
+    res = app.test_client().get("/whoami", headers={"X-Forwarded-For": "203.0.113.7"})
+    assert res.data == b"127.0.0.1"
+
+
+def test_configure_app_trusts_proxies_when_told_to(monkeypatch):
+    monkeypatch.setenv("SERVER_PROXY_HOPS", "1")
+    app = _whoami_app()
+
+    configure_app(app, production_options())
+
+    res = app.test_client().get("/whoami", headers={"X-Forwarded-For": "203.0.113.7"})
+    assert res.data == b"203.0.113.7"
@@ -0,0 +1,250 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import create_app, db, readmodels
+from app.archive import ArchiveError, archive_class, restore_class
+from app.gradebook import apply_grades, load_gradebook
+from app.journal import PendingSubmission, write_records
+from app.models import Assignment, Class, ClassShard, Submission, User
+from app.sharding import ShardError, plan_rebalance, shards, stable_shard
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+        "DB_AUTO_UPGRADE": True,
+        "WTF_CSRF_ENABLED": False,
+        "ARCHIVE_DATABASE_PATH": str(tmp_path / "archive.db"),
+        "SUBMISSION_SHARDS": 2,
+        "SUBMISSION_SHARD_DIR": str(tmp_path / "shards"),
+        "AUDIT_ENABLED": False,
+    })
+    with app.app_context():
+        teacher = User(username="teacher", email="t@t.com")
+        ann = User(username="ann", email="ann@t.com")
+        ben = User(username="ben", email="ben@t.com")
+        for user in (teacher, ann, ben):
+            user.set_password("pass")
+        due = datetime.now() + timedelta(days=2)
+        classes, assignments = [], []
+        for n in range(4):
+            clazz = Class(name=f"Class {n}", owner=teacher)
+            clazz.members.extend([teacher, ann, ben])
+            classes.append(clazz)
+            assignments.append(Assignment(title=f"Essay {n}", due_date=due, creator=teacher, clazz=clazz))
+        db.session.add_all([teacher, ann, ben, *classes, *assignments])
+        db.session.commit()
+        ids = [(clazz.id, assignment.id) for clazz, assignment in zip(classes, assignments)]
+    yield app, ids
+    with app.app_context():
+        shards.dispose()
+
+
+def _rows(path):
+    if not os.path.exists(path):
+        return []
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT assignment_id, student_id, content FROM submission").fetchall()
+    finally:
+        conn.close()
+
+
+def _login(app, username):
+    client = app.test_client()
+    client.post("/login", data={"username": username, "password": "pass"})
+    return client
+
+
+def test_submissions_go_to_the_class_shard(sharded):
+    app, ids = sharded
+    client = _login(app, "ann")
+    for _, assignment_id in ids:
+        res = client.post(f"/assignments/{assignment_id}/submit", data={"content": f"essay {assignment_id}"})
+        assert res.status_code == 302
+
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(Submission)) == 0
+        placed = dict(db.session.execute(db.select(ClassShard.class_id, ClassShard.shard)).all())
+        for class_id, assignment_id in ids:
+            assert placed[class_id] == stable_shard(class_id, 2)
+            assert (assignment_id, 2, f"essay {assignment_id}") in _rows(shards.path(placed[class_id]))
+
+    # the student's own page reads it back from the shard
+    assert b"essay" in client.get(f"/assignments/{ids[0][1]}/submit").data
+    # the timeline marks it across every shard
+    assert client.get("/timeline").data.count(b"js-submitted\">Submitted") == len(ids)
+
+
+def test_handed_in_reads_only_the_shards_of_those_classes(sharded, monkeypatch):
+    app, ids = sharded
+    client = _login(app, "ann")
+    for _, assignment_id in ids:
+        client.post(f"/assignments/{assignment_id}/submit", data={"content": "x"})
+
+    with app.app_context():
+        (class_id, assignment_id), *_ = ids
+        shard = shards.shard_for(class_id)
+        opened = []
+        engine = shards.engine
+        monkeypatch.setattr(shards, "engine", lambda n: opened.append(n) or engine(n))
+
+        assert readmodels.handed_in(2, [assignment_id], {class_id}) == {assignment_id}
+        assert opened == [shard]
+
+        everything = readmodels.handed_in(2, [a for _, a in ids], {c for c, _ in ids})
+        assert everything == {a for _, a in ids}
+        # every fan-out shares one pool
+        assert shards._executor() is shards._executor()
+
+
+def test_placing_a_class_leaves_the_callers_transaction_alone(sharded):
+    app, ids = sharded
+    class_id, _ = ids[0]
+    with app.app_context():
+        db.session.add(User(username="half", email="half@t.com", password_hash="x"))
+        shard = shards.shard_for(class_id)
+        db.session.rollback()
+
+        assert db.session.scalar(db.select(User).filter_by(username="half")) is None
+        assert db.session.get(ClassShard, class_id).shard == shard
+
+
+def test_teacher_views_read_from_the_shard(sharded):
+    app, ids = sharded
+    class_id, assignment_id = ids[0]
+    _login(app, "ann").post(f"/assignments/{assignment_id}/submit", data={"content": "photosynthesis"})
+
+    teacher = _login(app, "teacher")
+    page = teacher.get(f"/assignments/{assignment_id}/submissions").data
+    assert b"ann" in page and b"photosynthesis" in page
+    missing = teacher.get(f"/classes/{class_id}/missing").data
+    assert b"ben" in missing and b"ann" not in missing
+
+    with app.app_context():
+        clazz = db.session.get(Class, class_id)
+        ann, ben = (db.session.scalar(db.select(User.id).filter_by(username=name)) for name in ("ann", "ben"))
+        result = apply_grades(clazz, [
+            {"student_id": ann, "assignment_id": assignment_id, "grade": "9"},
+            {"student_id": ben, "assignment_id": assignment_id, "grade": "0"},
+        ])
+        assert (result.updated, result.created) == (1, 1)
+        book = load_gradebook(clazz)
+        assert [book.grade(i) for i in range(book.width * 2)] == [9.0, 0.0]
+
+
+def test_move_and_rebalance(sharded):
+    app, ids = sharded
+    client = _login(app, "ann")
+    for _, assignment_id in ids:
+        client.post(f"/assignments/{assignment_id}/submit", data={"content": "x"})
+
+    runner = app.test_cli_runner()
+    with app.app_context():
+        with pytest.raises(ShardError, match="shards lock"):
+            shards.move_class(ids[0][0], shards.shard_for(ids[0][0]), 1 - shards.shard_for(ids[0][0]))
+        assert "flask shards lock" in runner.invoke(args=["shards", "rebalance"]).output
+
+    assert runner.invoke(args=["shards", "lock"]).exit_code == 0
+    with app.app_context():
+        for class_id, _ in ids:
+            shards.move_class(class_id, shards.shard_for(class_id), 0)
+        assert [sum(counts.values()) for counts in shards.class_counts()] == [4, 0]
+        assert len(_rows(shards.path(0))) == 4 and _rows(shards.path(1)) == []
+
+    result = runner.invoke(args=["shards", "rebalance"])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert [sum(counts.values()) for counts in shards.class_counts()] == [2, 2]
+    app.config["SUBMISSION_SHARD_MAP_TTL"] = 0
+    assert runner.invoke(args=["shards", "unlock"]).output.strip() == "Shards unlocked."
+    # routing follows the map, so the moved classes are still found
+    assert b"x</textarea>" in client.get(f"/assignments/{ids[0][1]}/submit").data
+    assert client.get("/timeline").data.count(b"js-submitted\">Submitted") == len(ids)
+
+
+def test_writes_pause_while_shards_are_locked(sharded):
+    app, ids = sharded
+    class_id, assignment_id = ids[0]
+    client = _login(app, "ann")
+    with app.app_context():
+        shards.lock()
+
+    res = client.post(f"/assignments/{assignment_id}/submit", data={"content": "later"})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "60"
+    # reads carry on
+    assert client.get(f"/assignments/{assignment_id}/submit").status_code == 200
+
+    with app.app_context():
+        assert shards.unlock_wait() > 0
+        shards.unlock()
+    assert client.post(f"/assignments/{assignment_id}/submit", data={"content": "now"}).status_code == 302
+
+
+def test_migrate_moves_existing_submissions_and_journal_writes_follow(sharded):
+    app, ids = sharded
+    with app.app_context():
+        # written before sharding was switched on
+        db.session.add_all([Submission(assignment_id=a, student_id=2, content="old") for _, a in ids])
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["shards", "migrate"])
+    assert "Moved 4 submissions of 4 classes" in result.output
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(Submission)) == 0
+
+        records = [PendingSubmission(a, 3, "journaled", datetime.utcnow()) for _, a in ids]
+        for engine, group in shards.partition(records):
+            with engine.begin() as connection:
+                write_records(connection, group)
+        for class_id, assignment_id in ids:
+            rows = _rows(shards.path(shards.shard_for(class_id)))
+            assert (assignment_id, 2, "old") in rows and (assignment_id, 3, "journaled") in rows
+
+
+def test_plan_rebalance_moves_largest_class_that_narrows_the_gap():
+    assert plan_rebalance([{1: 50, 2: 30, 3: 20}, {}]) == [(1, 0, 1, 50)]
+    assert plan_rebalance([{1: 5}, {2: 5}]) == []
+
+
+def test_archive_takes_sharded_submissions_along(sharded):
+    app, ids = sharded
+    class_id, assignment_id = ids[0]
+    _login(app, "ann").post(f"/assignments/{assignment_id}/submit", data={"content": "keep me"})
+
+    with app.app_context():
+        shard = shards.shard_for(class_id)
+        moved = archive_class(class_id)
+        assert moved["submission"] == 1
+        assert _rows(shards.path(shard)) == []
+        assert db.session.get(ClassShard, class_id) is None
+
+        restore_class(class_id)
+        assert _rows(shards.path(shards.shard_for(class_id))) == [(assignment_id, 2, "keep me")]
+        assert db.session.scalar(db.select(db.func.count()).select_from(Submission)) == 0
+
+
+def test_failed_archive_sends_submissions_back_to_the_shard(sharded, tmp_path):
+    app, ids = sharded
+    (class_id, assignment_id), (other_id, _) = ids[:2]
+    _login(app, "ann").post(f"/assignments/{assignment_id}/submit", data={"content": "stay"})
+
+    with app.app_context():
+        archive_class(other_id)
+        # a clashing row makes the next archive fail
+        conn = sqlite3.connect(tmp_path / "archive.db")
+        conn.execute("INSERT INTO class (id, name, owner_id) VALUES (?, 'clash', 1)", (class_id,))
+        conn.commit()
+        conn.close()
+
+        with pytest.raises(ArchiveError):
+            archive_class(class_id)
+        assert db.session.scalar(db.select(db.func.count()).select_from(Submission)) == 0
+        rows = readmodels.shard_submissions(assignment_id, shards.submission_session(class_id))
+        assert [row.content for row in rows] == ["stay"]